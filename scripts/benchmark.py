@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк этапов обработки конфигов на синтетическом корпусе.
+
+Генератор детерминирован (seed) и выдаёт vless (reality и tls), vmess, trojan, ss,
+ssr, tuic и hysteria2 с заданными долями дубликатов и попаданий в whitelist.
+Для каждого этапа замеряется время и пик памяти (tracemalloc, отдельным проходом).
+Результаты сравниваются с сохранённым baseline: этап, замедлившийся больше
+порога, считается регрессией, и скрипт завершается с кодом 1.
+
+Примеры:
+    python scripts/benchmark.py --sizes 10000,100000
+    python scripts/benchmark.py --sizes 10000,100000 --save-baseline
+    python scripts/benchmark.py --sizes 1000000 --no-memory
+    python scripts/benchmark.py --sizes 1000000 --no-memory --parse-workers 4
+"""
+
+from collections.abc import Callable
+import ipaddress
+import logging
+import argparse
+import platform
+import tracemalloc
+import random
+import base64
+import json
+import time
+import uuid
+import sys
+import os
+
+from common import logger, setup_logging
+import configs
+from whitelist import WHITELIST_SUBNETS, is_ip_in_subnets
+from configs import (
+    extract_host_port, filter_excluded_configs, generate_config_key, merge_and_deduplicate,
+    parse_config, process_configs_with_numbering,
+)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+FLAGS = ["🇷🇺", "🇩🇪", "🇳🇱", "🇫🇮", "🇺🇸", "🇸🇪", "🇵🇱", "🇰🇿"]
+SNI_HOSTS = ["www.google.com", "ya.ru", "vk.com", "cdn.jsdelivr.net", "gosuslugi.ru", "ozon.ru"]
+SS_METHODS = ["aes-256-gcm", "chacha20-ietf-poly1305", "aes-128-gcm"]
+PROTOCOL_WEIGHTS = {
+    "vless_reality": 30,
+    "vless_tls": 15,
+    "vmess": 15,
+    "trojan": 10,
+    "ss": 12,
+    "ssr": 3,
+    "tuic": 5,
+    "hysteria2": 10,
+}
+
+def _b64(text: str, urlsafe: bool = False) -> str:
+    encode = base64.urlsafe_b64encode if urlsafe else base64.b64encode
+    return encode(text.encode("utf-8")).decode("ascii")
+
+class CorpusGenerator:
+    """Детерминированный генератор строк конфигов"""
+
+    def __init__(self, seed: int = 1, whitelist_ratio: float = 0.3, domain_ratio: float = 0.1):
+        self.rng = random.Random(seed)
+        self.whitelist_ratio = whitelist_ratio
+        self.domain_ratio = domain_ratio
+        self._subnets = [ipaddress.ip_network(subnet, strict=False) for subnet in WHITELIST_SUBNETS]
+        self._protocols = list(PROTOCOL_WEIGHTS)
+        self._weights = list(PROTOCOL_WEIGHTS.values())
+
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _token(self, length: int) -> str:
+        return "".join(self.rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(length))
+
+    def _host(self) -> str:
+        roll = self.rng.random()
+        if roll < self.whitelist_ratio:
+            network = self.rng.choice(self._subnets)
+            return str(network.network_address + self.rng.randrange(network.num_addresses))
+        if roll < self.whitelist_ratio + self.domain_ratio:
+            return f"{self._token(8)}.{self.rng.choice(['com', 'net', 'ru', 'xyz'])}"
+        while True:  # Публичный адрес вне whitelist
+            address = str(ipaddress.IPv4Address(self.rng.randrange(1 << 24, 224 << 24)))
+            if not is_ip_in_subnets(address):
+                return address
+
+    def _name(self, index: int) -> str:
+        return f"{self.rng.choice(FLAGS)} Server {index}"
+
+    def _port(self) -> int:
+        return self.rng.choice((443, 443, 443, 8443, 2053, 80)) if self.rng.random() < 0.7 else self.rng.randrange(1024, 65535)
+
+    def config(self, index: int) -> str:
+        """Одна уникальная строка конфига"""
+        protocol = self.rng.choices(self._protocols, self._weights)[0]
+        host, port, name = self._host(), self._port(), self._name(index)
+        sni = self.rng.choice(SNI_HOSTS)
+        if protocol == "vless_reality":
+            return (f"vless://{self._uuid()}@{host}:{port}?encryption=none&security=reality&sni={sni}"
+                    f"&fp=chrome&pbk={_b64(self._token(32), urlsafe=True).rstrip('=')}&sid={self._token(8)}"
+                    f"&type=tcp&flow=xtls-rprx-vision#{name}")
+        if protocol == "vless_tls":
+            return (f"vless://{self._uuid()}@{host}:{port}?encryption=none&security=tls&sni={sni}"
+                    f"&type=ws&host={sni}&path=%2F{self._token(6)}#{name}")
+        if protocol == "vmess":
+            return "vmess://" + _b64(json.dumps({
+                "v": "2", "ps": name, "add": host, "port": str(port), "id": self._uuid(), "aid": "0",
+                "net": "ws", "type": "none", "host": sni, "path": "/" + self._token(6), "tls": "tls", "sni": sni,
+            }, ensure_ascii=False))
+        if protocol == "trojan":
+            return f"trojan://{self._token(16)}@{host}:{port}?security=tls&sni={sni}&type=tcp#{name}"
+        if protocol == "ss":
+            userinfo = _b64(f"{self.rng.choice(SS_METHODS)}:{self._token(16)}", urlsafe=True).rstrip("=")
+            return f"ss://{userinfo}@{host}:{port}#{name}"
+        if protocol == "ssr":
+            password = _b64(self._token(12), urlsafe=True).rstrip("=")
+            remarks = _b64(name, urlsafe=True).rstrip("=")
+            return "ssr://" + _b64(f"{host}:{port}:origin:aes-256-cfb:plain:{password}/?remarks={remarks}", urlsafe=True).rstrip("=")
+        if protocol == "tuic":
+            return (f"tuic://{self._uuid()}:{self._token(12)}@{host}:{port}"
+                    f"?congestion_control=bbr&alpn=h3&sni={sni}#{name}")
+        return f"hysteria2://{self._token(16)}@{host}:{port}?sni={sni}&obfs=salamander&obfs-password={self._token(10)}#{name}"
+
+    def corpus(self, size: int, duplicate_ratio: float = 0.25) -> list[str]:
+        """Корпус из size строк: доля duplicate_ratio - повторы (половина точные, половина с другим именем)"""
+        lines = []
+        for index in range(size):
+            if lines and self.rng.random() < duplicate_ratio:
+                original = self.rng.choice(lines)
+                if self.rng.random() < 0.5 or original.startswith(("vmess://", "ssr://")):
+                    lines.append(original)
+                else:
+                    lines.append(original.partition("#")[0] + "#" + self._name(index))
+            else:
+                lines.append(self.config(index))
+        return lines
+
+def _stages(lines: list[str]) -> list[tuple[str, Callable[[], object]]]:
+    """Этапы конвейера; каждый получает результаты предыдущих через замыкания"""
+    state = {}
+    exclude_settings = {"case_sensitive": False, "log_excluded": False, "save_excluded": False}
+
+    def dedup():
+        state["unique"], state["whitelist"] = merge_and_deduplicate(lines)
+
+    def whitelist_check():
+        hosts = [parsed.host for parsed in state["unique"] if parsed.host]
+        return sum(1 for host in hosts if is_ip_in_subnets(host))
+
+    def exclusions():
+        state["filtered"], _ = filter_excluded_configs(state["unique"], settings=exclude_settings)
+
+    return [
+        ("parse_config", lambda: [parse_config(line) for line in lines]),
+        ("generate_config_key", lambda: [generate_config_key(line) for line in lines]),
+        ("extract_host_port", lambda: [extract_host_port(line) for line in lines]),
+        ("merge_and_deduplicate", dedup),
+        ("is_ip_in_subnets", whitelist_check),
+        ("filter_excluded_configs", exclusions),
+        ("process_configs_with_numbering", lambda: process_configs_with_numbering(state["filtered"])),
+    ]
+
+def run_stages(lines: list[str], measure_memory: bool = True) -> dict[str, dict[str, float]]:
+    """Замеряет время каждого этапа; пик памяти - отдельным проходом под tracemalloc"""
+    results = {}
+    for name, stage in _stages(lines):
+        started = time.perf_counter()
+        stage()
+        results[name] = {"seconds": round(time.perf_counter() - started, 4)}
+    if measure_memory:
+        for name, stage in _stages(lines):
+            tracemalloc.start()
+            stage()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name]["peak_kib"] = round(peak / 1024)
+    return results
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float, min_seconds: float = 0.05) -> list[str]:
+    """Список регрессий: этапы, замедлившиеся больше чем в threshold раз
+
+    Этапы короче min_seconds не сравниваются - их время определяется шумом.
+    """
+    regressions = []
+    for size, stages in results.items():
+        for name, current in stages.items():
+            previous = baseline.get(size, {}).get(name)
+            if not previous:
+                continue
+            if previous["seconds"] >= min_seconds and current["seconds"] > previous["seconds"] * threshold:
+                regressions.append(f"{size}/{name}: {previous['seconds']:.3f} → {current['seconds']:.3f} с")
+            if previous.get("peak_kib") and current.get("peak_kib", 0) > previous["peak_kib"] * threshold:
+                regressions.append(f"{size}/{name}: память {previous['peak_kib']} → {current['peak_kib']} КиБ")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов обработки конфигов")
+    parser.add_argument("--sizes", default="10000,100000", help="размеры корпуса через запятую")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.25)
+    parser.add_argument("--whitelist-ratio", type=float, default=0.3)
+    parser.add_argument("--no-memory", action="store_true", help="не замерять память (быстрее на 1M)")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результаты как baseline")
+    parser.add_argument("--threshold", type=float, default=1.5, help="допустимое замедление, раз")
+    parser.add_argument("--write-corpus", metavar="PATH", help="сохранить корпус наибольшего размера")
+    parser.add_argument("--parse-workers", type=int, default=configs.PARSE_WORKERS,
+                        help="процессов для разбора в merge_and_deduplicate (0 - в основном процессе)")
+    args = parser.parse_args()
+    configs.PARSE_WORKERS = args.parse_workers
+    # Сообщения этапов не должны попадать в замеры
+    setup_logging()
+    logger.setLevel(logging.WARNING)
+
+    results = {}
+    corpus = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        started = time.perf_counter()
+        corpus = CorpusGenerator(args.seed, args.whitelist_ratio).corpus(size, args.duplicate_ratio)
+        print(f"📦 Корпус {size}: сгенерирован за {time.perf_counter() - started:.1f} с")
+        results[str(size)] = run_stages(corpus, measure_memory=not args.no_memory)
+        for name, metrics in results[str(size)].items():
+            memory = f", пик {metrics['peak_kib']} КиБ" if "peak_kib" in metrics else ""
+            print(f"   {name:<32} {metrics['seconds']:8.3f} с{memory}")
+
+    if args.write_corpus:
+        with open(args.write_corpus, "w", encoding="utf-8") as f:
+            f.write("\n".join(corpus))
+
+    if args.save_baseline:
+        baseline = {
+            "meta": {"python": platform.python_version(), "machine": platform.machine(), "seed": args.seed},
+            "results": results,
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=1)
+        print(f"💾 Baseline сохранён в {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+    except (OSError, ValueError):
+        print("ℹ️ Baseline не найден, сравнение пропущено")
+        return
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"❌ Регрессии (порог x{args.threshold}):")
+        for line in regressions:
+            print(f"   • {line}")
+        sys.exit(1)
+    print(f"✅ Регрессий нет (порог x{args.threshold})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Каталог конфигов в SQLite: каждый разобранный конфиг по ключу дедупликации,
+его поля, источники и время первого и последнего появления.
+
+Каталог переживает запуски и отвечает на вопросы вроде «какие источники дают серверы
+в 158.160.0.0/16» без разбора текстовых файлов:
+    python scripts/catalogue.py --subnet 158.160.0.0/16
+    python scripts/catalogue.py --source https://raw.githubusercontent.com/...
+"""
+
+from collections.abc import Iterable
+import contextlib
+import ipaddress
+import argparse
+import sqlite3
+import time
+import os
+
+from common import log
+from configs import ParsedConfig
+from whitelist import ip_to_int
+
+CATALOGUE_FILE = os.environ.get("CATALOGUE_FILE", ".cache/catalogue.sqlite3")
+# Конфиги, не встречавшиеся дольше этого, удаляются из каталога
+CATALOGUE_RETENTION_DAYS = int(os.environ.get("CATALOGUE_RETENTION_DAYS", "30"))
+SELECTED_SOURCE = "selected.txt"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS configs (
+    key TEXT PRIMARY KEY,
+    protocol TEXT NOT NULL,
+    host TEXT,
+    port INTEGER,
+    ip_int INTEGER,
+    credential TEXT,
+    sni TEXT,
+    whitelist INTEGER NOT NULL DEFAULT 0,
+    raw TEXT NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS config_sources (
+    key TEXT NOT NULL REFERENCES configs(key) ON DELETE CASCADE,
+    source TEXT NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    PRIMARY KEY (key, source)
+);
+CREATE INDEX IF NOT EXISTS configs_host ON configs(host);
+CREATE INDEX IF NOT EXISTS configs_port ON configs(port);
+CREATE INDEX IF NOT EXISTS configs_protocol ON configs(protocol);
+CREATE INDEX IF NOT EXISTS configs_ip_int ON configs(ip_int);
+CREATE INDEX IF NOT EXISTS configs_last_seen ON configs(last_seen);
+CREATE INDEX IF NOT EXISTS config_sources_source ON config_sources(source);
+"""
+
+_UPSERT_CONFIG = """
+INSERT INTO configs (key, protocol, host, port, ip_int, credential, sni, whitelist, raw, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET
+    whitelist = excluded.whitelist,
+    raw = excluded.raw,
+    last_seen = excluded.last_seen
+"""
+
+_UPSERT_SOURCE = """
+INSERT INTO config_sources (key, source, first_seen, last_seen) VALUES (?, ?, ?, ?)
+ON CONFLICT(key, source) DO UPDATE SET last_seen = excluded.last_seen
+"""
+
+def connect_catalogue(path: str | None = None) -> sqlite3.Connection:
+    """Открывает каталог, создавая схему при первом обращении"""
+    path = CATALOGUE_FILE if path is None else path
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    connection.executescript(_SCHEMA)
+    return connection
+
+def _sni(parsed: ParsedConfig) -> str:
+    if parsed.vmess:
+        return str(parsed.vmess.get("sni") or parsed.vmess.get("host") or "")
+    params = parsed.params or {}
+    return str(params.get("sni") or params.get("peer") or "")
+
+def _config_row(parsed: ParsedConfig, whitelist: bool, now: int) -> tuple:
+    host_port = parsed.host_port
+    host, port = host_port if host_port else ("", None)
+    host = host.lower().strip("[]")
+    address = ip_to_int(host) if host else None
+    # В INTEGER SQLite помещается только IPv4; IPv6 ищется по host
+    ip_int = address[1] if address and address[0] == 4 else None
+    return (parsed.key, parsed.scheme, host, port, ip_int, parsed.credential, _sni(parsed),
+            int(whitelist), parsed.raw, now, now)
+
+def update_catalogue(by_source: dict[str, Iterable[ParsedConfig]], whitelist_keys: set[str],
+                     path: str | None = None, now: int | None = None) -> dict[str, int]:
+    """Добавляет или обновляет конфиги всех источников одной транзакцией
+
+    Конфиг с уже известным ключом только продлевает last_seen (свой и у источника),
+    first_seen сохраняется. Возвращает счётчики: всего, новых, удалено по давности.
+    """
+    path = CATALOGUE_FILE if path is None else path
+    if not path:
+        return {}
+    now = int(time.time()) if now is None else now
+    config_rows = {}
+    source_rows = []
+    for source, configs in by_source.items():
+        for parsed in configs:
+            if not parsed.key:
+                continue
+            if parsed.key not in config_rows:
+                config_rows[parsed.key] = _config_row(parsed, parsed.key in whitelist_keys, now)
+            source_rows.append((parsed.key, source, now, now))
+
+    try:
+        with contextlib.closing(connect_catalogue(path)) as connection, connection:
+            before = connection.execute("SELECT COUNT(*) FROM configs").fetchone()[0]
+            connection.executemany(_UPSERT_CONFIG, config_rows.values())
+            connection.executemany(_UPSERT_SOURCE, source_rows)
+            expired = connection.execute(
+                "DELETE FROM configs WHERE last_seen < ?", (now - CATALOGUE_RETENTION_DAYS * 86400,)
+            ).rowcount
+            total = connection.execute("SELECT COUNT(*) FROM configs").fetchone()[0]
+    except sqlite3.Error as e:
+        log(f"⚠️  Не удалось обновить каталог конфигов: {str(e)[:100]}")
+        return {}
+    stats = {"total": total, "new": total - before + expired, "expired": expired, "seen": len(config_rows)}
+    log(f"🗃️ Каталог: {stats['seen']} конфигов в этом запуске, новых {stats['new']}, "
+        f"удалено устаревших {stats['expired']}, всего {stats['total']}")
+    return stats
+
+def sources_in_subnet(subnet: str, path: str | None = None,
+                      seen_since: int | None = None) -> list[tuple[str, int]]:
+    """Источники с серверами в IPv4-подсети: [(источник, число конфигов)] по убыванию"""
+    network = ipaddress.ip_network(subnet, strict=False)
+    if network.version != 4:
+        raise ValueError("поиск по подсети поддерживается только для IPv4")
+    start = int(network.network_address)
+    end = int(network.broadcast_address)
+    with contextlib.closing(connect_catalogue(path)) as connection:
+        return connection.execute(
+            """
+            SELECT s.source, COUNT(*) FROM configs c JOIN config_sources s ON s.key = c.key
+            WHERE c.ip_int BETWEEN ? AND ? AND s.last_seen >= ?
+            GROUP BY s.source ORDER BY COUNT(*) DESC, s.source
+            """,
+            (start, end, seen_since or 0),
+        ).fetchall()
+
+def configs_from_source(source: str, path: str | None = None) -> list[tuple]:
+    """Конфиги источника: (протокол, host, port, first_seen, last_seen), свежие первыми"""
+    with contextlib.closing(connect_catalogue(path)) as connection:
+        return connection.execute(
+            """
+            SELECT c.protocol, c.host, c.port, s.first_seen, s.last_seen
+            FROM config_sources s JOIN configs c ON c.key = s.key
+            WHERE s.source = ? ORDER BY s.last_seen DESC, c.host
+            """,
+            (source,),
+        ).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description="Запросы к каталогу конфигов")
+    parser.add_argument("--db", default=CATALOGUE_FILE)
+    parser.add_argument("--subnet", help="источники с серверами в IPv4-подсети")
+    parser.add_argument("--source", help="конфиги, которые давал источник")
+    args = parser.parse_args()
+    if args.subnet:
+        for source, count in sources_in_subnet(args.subnet, args.db):
+            print(f"{count:6d}  {source}")
+    elif args.source:
+        for protocol, host, port, first_seen, last_seen in configs_from_source(args.source, args.db):
+            first = time.strftime("%Y-%m-%d %H:%M", time.localtime(first_seen))
+            last = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_seen))
+            print(f"{protocol:<10} {host}:{port}  {first} → {last}")
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
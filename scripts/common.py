@@ -0,0 +1,178 @@
+"""
+Общие для модулей парсера журнал, пути к файлам и время запуска.
+Импорт модуля не выполняет сетевых запросов и не обращается к диску:
+поток-писатель журнала запускается при первой записи.
+"""
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from datetime import datetime
+import functools
+import threading
+import zoneinfo
+import logging
+import atexit
+import queue
+import sys
+import os
+
+# Журнал: уровень, файл с ротацией и размер очереди записей
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.environ.get("LOG_FILE", ".cache/logs/run.log")
+LOG_FILE_MAX_BYTES = int(os.environ.get("LOG_FILE_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.environ.get("LOG_FILE_BACKUPS", "3"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+logger = logging.getLogger("wlrus")
+logger.propagate = False
+
+# Уровень по умолчанию выводится из префикса сообщения
+_LEVEL_PREFIXES = (("❌", logging.ERROR), ("💥", logging.ERROR), ("⚠️", logging.WARNING))
+
+class _FieldsFormatter(logging.Formatter):
+    """Добавляет к сообщению структурированные поля key=value"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+class _DroppingQueueHandler(QueueHandler):
+    """Кладёт запись в ограниченную очередь, не блокируясь: при переполнении запись отбрасывается"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+_listener: QueueListener | None = None
+_listener_lock = threading.Lock()
+
+def setup_logging() -> logging.Logger:
+    """Запускает поток-писатель журнала (один раз; вызывается и при первом log())"""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return logger
+        handlers = []
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(_FieldsFormatter("%(asctime)s %(message)s", "%H:%M:%S"))
+        handlers.append(stream_handler)
+        if LOG_FILE:
+            try:
+                os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
+                file_handler = RotatingFileHandler(
+                    LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+                )
+                file_handler.setFormatter(_FieldsFormatter("%(asctime)s %(levelname)s %(threadName)s %(message)s"))
+                handlers.append(file_handler)
+            except OSError as e:
+                print(f"⚠️  Не удалось открыть файл журнала {LOG_FILE}: {e}", file=sys.stderr)
+        logger.setLevel(LOG_LEVEL)
+        queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE)))
+        logger.addHandler(queue_handler)
+        _listener = QueueListener(queue_handler.queue, *handlers)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return logger
+
+def shutdown_logging():
+    """Дописывает очередь и останавливает поток-писатель"""
+    global _listener
+    with _listener_lock:
+        listener, _listener = _listener, None
+    if listener is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        if _DroppingQueueHandler.dropped:
+            handler.handle(logger.makeRecord(
+                logger.name, logging.WARNING, __file__, 0,
+                f"⚠️  Журнал: отброшено {_DroppingQueueHandler.dropped} записей (очередь переполнена)", None, None,
+            ))
+        handler.flush()
+    for handler in list(logger.handlers):
+        if isinstance(handler, _DroppingQueueHandler):
+            logger.removeHandler(handler)
+
+def log(message: str, level: int | None = None, **fields):
+    """Пишет сообщение в журнал, не блокируя вызывающий поток
+
+    fields - структурированные поля (source, stage, elapsed...), выводятся как key=value.
+    """
+    if _listener is None:
+        setup_logging()
+    if level is None:
+        level = logging.INFO
+        for prefix, prefix_level in _LEVEL_PREFIXES:
+            if message.startswith(prefix):
+                level = prefix_level
+                break
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"fields": fields} if fields else None)
+
+@functools.lru_cache(maxsize=1)
+def run_timestamp() -> str:
+    """Время запуска по Москве (фиксируется при первом обращении)"""
+    return datetime.now(zoneinfo.ZoneInfo("Europe/Moscow")).strftime("%H:%M | %d.%m.%Y")
+
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "confs")
+
+CONFIG = {
+    "output_dir": OUTPUT_DIR,
+    "merged_file": "merged.txt",
+    "wl_file": "wl.txt",
+    "selected_file": "selected.txt",
+    "custom_prefix": "",
+    "use_date_suffix": False,
+    "rotate_folders": False,
+}
+
+if CONFIG["rotate_folders"]:
+    month = datetime.now().month
+    year_short = datetime.now().strftime("%y")
+    CONFIG["output_dir_suffix"] = f"_{year_short}{month:02d}"
+
+def get_paths():
+    """Возвращает актуальные пути к файлам"""
+    base_dir = CONFIG["output_dir"]
+    
+    paths = {
+        "base_dir": base_dir,
+        "merged": f"{base_dir}/{CONFIG['merged_file']}",
+        "wl": f"{base_dir}/{CONFIG['wl_file']}",
+        "selected": f"{base_dir}/{CONFIG['selected_file']}",
+        "gh_pages_merged": "merged.txt",
+        "gh_pages_wl": "wl.txt",
+    }
+    return paths
+
+PATHS = get_paths()
+
+URLS = [
+    "https://raw.githubusercontent.com/igareck/vpn-configs-for-russia/refs/heads/main/WHITE-CIDR-RU-all.txt",
+    "https://raw.githubusercontent.com/zieng2/wl/refs/heads/main/vless_universal.txt",
+    "https://raw.githubusercontent.com/zieng2/wl/main/vless_lite.txt",
+    "https://gitverse.ru/api/repos/Vsevj/OBS/raw/branch/master/wwh",
+    "https://storage.yandexcloud.net/cid-vpn/whitelist.txt",
+    "https://raw.githubusercontent.com/koteey/Ms.Kerosin-VPN/refs/heads/main/proxies.txt",
+    "https://raw.githubusercontent.com/HikaruApps/WhiteLattice/refs/heads/main/subscriptions/main-sub.txt",
+    "https://raw.githubusercontent.com/FalerChannel/FalerChannel/refs/heads/main/configs",
+    "https://raw.githubusercontent.com/officialdakari/psychic-octo-tribble/refs/heads/main/subwl.txt",
+    "https://raw.githubusercontent.com/RKPchannel/RKP_bypass_configs/refs/heads/main/configs",
+    "https://raw.githubusercontent.com/Ai123999/WhiteeListSub/refs/heads/main/whitelistkeys",
+    "https://raw.githubusercontent.com/EtoNeYaProject/etoneyaproject.github.io/refs/heads/main/whitelist",
+    "https://raw.githubusercontent.com/gbwltg/gbwl/refs/heads/main/m2EsPqwmlc",
+    "https://gitverse.ru/api/repos/LowiK/LowiKLive/raw/branch/main/ObhodBSfree.txt",
+    "https://sub-rostunnel.vercel.app/subs/gen.txt",
+    "https://raw.githubusercontent.com/igareck/vpn-configs-for-russia/refs/heads/main/WHITE-CIDR-RU-checked.txt",
+]
+
+# Зеркала источников в порядке предпочтения: к ним уходят резервные запросы, если основной
+# URL отвечает медленно или с ошибкой. Для raw.githubusercontent.com зеркало jsDelivr
+# добавляется автоматически (см. simple_merge.mirror_urls)
+SOURCE_MIRRORS: dict[str, list[str]] = {}
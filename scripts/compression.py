@@ -0,0 +1,121 @@
+"""
+Сжатые копии выходных файлов: merged.txt.gz и т.п. пишутся тем же проходом, что и сам файл.
+
+gzip доступен всегда; brotli и zstd - при установленных пакетах brotli и zstandard.
+Сжатие детерминированное (gzip без mtime и имени), поэтому одинаковое содержимое
+даёт одинаковые байты и не перезаливается.
+"""
+
+import contextlib
+import gzip
+import os
+
+from common import log
+
+# Кодировки сжатых копий через запятую: gzip, br, zstd; пусто - копии не пишутся
+OUTPUT_COMPRESSION = [
+    encoding.strip() for encoding in os.environ.get("OUTPUT_COMPRESSION", "gzip").split(",") if encoding.strip()
+]
+ENCODING_SUFFIXES = {"gzip": ".gz", "br": ".br", "zstd": ".zst"}
+# Content-Type сжатых копий при публикации: это файлы-архивы, а не сжатая передача текста
+ENCODING_CONTENT_TYPES = {"gzip": "application/gzip", "br": "application/x-brotli", "zstd": "application/zstd"}
+
+class _GzipCompressor:
+    def __init__(self, stream):
+        self._file = gzip.GzipFile(filename="", mode="wb", compresslevel=9, fileobj=stream, mtime=0)
+
+    def write(self, data: bytes):
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+class _IncrementalCompressor:
+    """Обёртка над compress/flush-интерфейсом brotli и zstandard"""
+
+    def __init__(self, stream, compress, finish):
+        self._stream = stream
+        self._compress = compress
+        self._finish = finish
+
+    def write(self, data: bytes):
+        self._stream.write(self._compress(data))
+
+    def close(self):
+        self._stream.write(self._finish())
+
+def _open_compressor(encoding: str, stream):
+    """Компрессор, пишущий в stream; ImportError, если нет нужного пакета"""
+    if encoding == "gzip":
+        return _GzipCompressor(stream)
+    if encoding == "br":
+        import brotli
+        compressor = brotli.Compressor(quality=11, mode=brotli.MODE_TEXT)
+        return _IncrementalCompressor(stream, compressor.process, compressor.finish)
+    if encoding == "zstd":
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=19).compressobj()
+        return _IncrementalCompressor(stream, compressor.compress, compressor.flush)
+    raise ValueError(f"неизвестная кодировка сжатия: {encoding}")
+
+class _TeeWriter:
+    """Текстовый писатель: строка кодируется один раз и уходит в файл и все компрессоры"""
+
+    def __init__(self, plain, compressors: list):
+        self._plain = plain
+        self._compressors = compressors
+
+    def write(self, text: str):
+        data = text.encode("utf-8", errors="replace")
+        self._plain.write(data)
+        for compressor in self._compressors:
+            compressor.write(data)
+
+@contextlib.contextmanager
+def open_output(path: str, encodings: list[str] | None = None):
+    """Открывает выходной файл на запись вместе с его сжатыми копиями
+
+    Копии пишутся во временные файлы и заменяют прежние только после успешной записи;
+    устаревшие копии отключённых кодировок удаляются.
+    """
+    encodings = OUTPUT_COMPRESSION if encodings is None else encodings
+    compressors = {}  # кодировка -> (путь копии, компрессор)
+    temp_paths = []
+    written = False
+    try:
+        with contextlib.ExitStack() as stack:
+            plain = stack.enter_context(open(path, "wb"))
+            for encoding in encodings:
+                if encoding not in ENCODING_SUFFIXES:
+                    log(f"⚠️  Неизвестная кодировка сжатия: {encoding}")
+                    continue
+                target = path + ENCODING_SUFFIXES[encoding]
+                try:
+                    stream = stack.enter_context(open(target + ".tmp", "wb"))
+                    temp_paths.append(target + ".tmp")
+                    compressors[encoding] = (target, _open_compressor(encoding, stream))
+                except (ImportError, OSError) as e:
+                    log(f"⚠️  Сжатая копия {encoding} для {os.path.basename(path)} пропущена: {str(e)[:100]}")
+            yield _TeeWriter(plain, [compressor for _, compressor in compressors.values()])
+            for _, compressor in compressors.values():
+                compressor.close()
+        written = True
+    finally:
+        if written:
+            for target, _ in compressors.values():
+                os.replace(target + ".tmp", target)
+        for temp_path in temp_paths:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+    if written:
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            if encoding not in compressors:
+                with contextlib.suppress(OSError):
+                    os.remove(path + suffix)
+
+def compressed_variants(path: str) -> dict[str, str]:
+    """Существующие сжатые копии файла: кодировка -> путь"""
+    return {
+        encoding: path + suffix for encoding, suffix in ENCODING_SUFFIXES.items()
+        if os.path.exists(path + suffix)
+    }
@@ -0,0 +1,750 @@
+"""
+Разбор, дедупликация, нумерация и фильтрация конфигов.
+Модуль не выполняет ввода-вывода при импорте.
+"""
+
+from collections.abc import Iterable, Iterator
+import concurrent.futures
+import multiprocessing
+import urllib.parse
+import functools
+import codecs
+import base64
+import logging
+import json
+import os
+import re
+
+from common import log, logger
+from metrics import count_duplicates
+from whitelist import SubnetIndex, classify_ips, get_whitelist_index
+
+EXCLUDE_PATTERNS = [
+    "rootface-@pwn1337-telegram",
+    "01010101",
+    "9292929",
+    "38388282",
+    "star_test1",
+    "11111111-1111-1111-1111-111111111111",
+]
+
+# Дополнительные настройки
+EXCLUDE_SETTINGS = {
+    "case_sensitive": False,  # Регистрозависимость
+    "log_excluded": True,     # Логировать исключенные конфиги
+    "save_excluded": True,    # Сохранять исключенные в отдельный файл
+}
+
+# Разбор в процессах: число рабочих процессов (0 или 1 - разбор в основном процессе)
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", "0"))
+# Строк в одном задании рабочему процессу; пачки меньше двух заданий разбираются на месте
+PARSE_CHUNK_SIZE = int(os.environ.get("PARSE_CHUNK_SIZE", "5000"))
+
+FLAG_RE = re.compile(r'[\U0001F1E6-\U0001F1FF]{2}')
+
+_HOST_PORT_PATTERNS = [
+    re.compile(r'@([\w\.-]+):(\d{1,5})', re.IGNORECASE),
+    re.compile(r'host=([\w\.-]+).*?port=(\d{1,5})', re.IGNORECASE),
+    re.compile(r'address=([\w\.-]+).*?port=(\d{1,5})', re.IGNORECASE),
+    re.compile(r'//([\w\.-]+):(\d{1,5})', re.IGNORECASE),
+]
+_IPV4_PORT_RE = re.compile(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d{1,5})')
+_ANY_HOST_PORT_RE = re.compile(r'([\w\.-]+):(\d{1,5})')
+
+# Схемы, у которых имя лежит в URL-фрагменте после первого '#'
+_URL_FRAGMENT_SCHEMES = ("vless", "trojan", "ss")
+
+
+# Версия записей to_record() и результатов парсеров: увеличивается при любом их изменении,
+# чтобы сохранённые между запусками записи не подменяли собой новый разбор
+RECORD_VERSION = 2
+
+
+class ParsedConfig:
+    """Конфиг, разобранный один раз для дедупликации, whitelist и нумерации"""
+
+    __slots__ = ("raw", "scheme", "credential", "host", "port", "params",
+                 "fragment", "flag", "key", "vmess", "excluded", "in_whitelist")
+
+    def __init__(self, raw: str, scheme: str = ""):
+        self.raw = raw
+        self.scheme = scheme
+        self.credential = ""
+        self.host = ""
+        self.port = None
+        self.params = {}
+        # Сырой (URL-кодированный) фрагмент; None - строку не удалось разобрать
+        self.fragment = None
+        self.flag = ""
+        self.key = raw[:200]
+        # Декодированный JSON для vmess
+        self.vmess = None
+        # Причина исключения, проставляется filter_excluded_configs
+        self.excluded = ""
+        # Попадание IP в whitelist, если уже посчитано рабочим процессом; None - не проверялось
+        self.in_whitelist = None
+
+    def __str__(self) -> str:
+        return self.raw
+
+    def to_record(self) -> list:
+        """Компактное JSON-представление для инкрементального состояния"""
+        return [self.raw, self.scheme, self.credential, self.host, self.port, self.params,
+                self.fragment, self.flag, self.key, self.vmess]
+
+    @staticmethod
+    def is_record(record) -> bool:
+        """Похоже ли значение на запись to_record() текущего формата"""
+        return isinstance(record, (list, tuple)) and len(record) == 10 and isinstance(record[0], str)
+
+    @classmethod
+    def from_record(cls, record: list) -> "ParsedConfig":
+        """Восстанавливает конфиг из to_record() без повторного разбора; ValueError - запись другого формата"""
+        if not cls.is_record(record):
+            raise ValueError(f"не запись конфига: {str(record)[:60]}")
+        pc = cls.__new__(cls)
+        (pc.raw, pc.scheme, pc.credential, pc.host, pc.port, pc.params,
+         pc.fragment, pc.flag, pc.key, pc.vmess) = record
+        pc.excluded = ""
+        pc.in_whitelist = None
+        return pc
+
+    def __repr__(self) -> str:
+        return f"ParsedConfig({self.raw[:60]!r})"
+
+    @property
+    def host_port(self) -> tuple[str, int] | None:
+        """Хост и порт сервера, если их удалось определить"""
+        if self.host and self.port:
+            return self.host, self.port
+        return _legacy_host_port(self.raw)
+
+
+def _legacy_host_port(config: str) -> tuple[str, int] | None:
+    """Ищет хост и порт регулярками - для строк без известной структуры"""
+    try:
+        for pattern in _HOST_PORT_PATTERNS:
+            match = pattern.search(config)
+            if match:
+                return match.group(1), int(match.group(2))
+
+        match = _IPV4_PORT_RE.search(config)
+        if match:
+            return match.group(1), int(match.group(2))
+
+        match = _ANY_HOST_PORT_RE.search(config)
+        if match:
+            host = match.group(1)
+            port = int(match.group(2))
+            if len(host) > 1 and ('.' in host or host.replace('.', '').replace('-', '').isalnum()):
+                return host, port
+    except Exception:
+        pass
+    return None
+
+def _b64decode_text(payload: str) -> str:
+    """Декодирует base64 (обычный или urlsafe) с недостающим выравниванием"""
+    payload = payload.strip()
+    rem = len(payload) % 4
+    if rem:
+        payload += '=' * (4 - rem)
+    if '-' in payload or '_' in payload:
+        return base64.urlsafe_b64decode(payload).decode('utf-8', errors='ignore')
+    return base64.b64decode(payload).decode('utf-8', errors='ignore')
+
+def _find_flag(name: str) -> str:
+    match = FLAG_RE.search(name)
+    return match.group(0) if match else ""
+
+def _parse_vmess(pc: ParsedConfig):
+    pc.key = pc.raw[:100]
+    try:
+        decoded = _b64decode_text(pc.raw[8:])
+        if not decoded.startswith('{'):
+            return
+        j = json.loads(decoded)
+    except Exception:
+        return
+    if not isinstance(j, dict):
+        return
+    pc.vmess = j
+    pc.credential = str(j.get('id', ''))
+    pc.flag = _find_flag(str(j.get('ps', '')))
+    try:
+        key_parts = [
+            j.get('id', ''),  # UUID
+            j.get('add', ''),  # Host
+            str(j.get('port', '')),  # Port
+            j.get('net', ''),  # Network type
+            j.get('host', ''),  # Host header
+            j.get('path', ''),  # Path
+            j.get('tls', ''),  # TLS
+            j.get('sni', ''),  # SNI
+            j.get('type', ''),  # Type
+            j.get('ps', ''),  # Remark/name
+        ]
+        pc.key = "|".join([part for part in key_parts if part])
+    except Exception:
+        pass
+    host = j.get('add') or j.get('host') or j.get('ip')
+    try:
+        port = int(j.get('port'))
+    except (TypeError, ValueError):
+        return
+    if host and port:
+        pc.host, pc.port = str(host), port
+
+def _parse_url(pc: ParsedConfig) -> urllib.parse.SplitResult | None:
+    """Общий разбор URL-подобных конфигов (vless, trojan, ss, tuic, hysteria)"""
+    try:
+        parsed = urllib.parse.urlsplit(pc.raw)
+    except ValueError:
+        return None
+    pc.fragment = parsed.fragment
+    pc.credential = parsed.username or ""
+    pc.host = parsed.hostname or ""
+    try:
+        pc.port = parsed.port
+    except ValueError:
+        pc.port = None
+    pc.params = {name: values[0] for name, values in urllib.parse.parse_qs(parsed.query).items()}
+    return parsed
+
+def _parse_vless_trojan(pc: ParsedConfig):
+    parsed = _parse_url(pc)
+    if parsed is None:
+        # Как и прежний get_config_key: для vless/trojan с ошибкой разбора - первые 100 символов,
+        # остальные схемы сохраняют ключ по первым 200 из ParsedConfig.__init__
+        pc.key = pc.raw[:100]
+        return
+    pc.flag = _find_flag(urllib.parse.unquote(pc.fragment))
+    try:
+        port = parsed.port or 443
+    except ValueError:
+        pc.key = pc.raw[:100]
+        return
+    params = pc.params
+    if pc.scheme == "vless":
+        key_parts = [
+            pc.credential,  # UUID
+            pc.host,
+            str(port),
+            params.get('security', ''),
+            params.get('sni', ''),
+            params.get('sid', ''),
+            params.get('pbk', ''),
+            params.get('type', ''),
+            params.get('flow', ''),
+            params.get('fp', ''),
+            params.get('encryption', ''),
+        ]
+    else:
+        key_parts = [
+            pc.credential,  # Password for Trojan
+            pc.host,
+            str(port),
+            params.get('security', ''),
+            params.get('sni', ''),
+            params.get('type', ''),
+            params.get('flow', ''),
+            params.get('fp', ''),
+        ]
+    pc.key = "|".join([part for part in key_parts if part])
+
+def _parse_ss(pc: ParsedConfig):
+    parsed = _parse_url(pc)
+    if parsed is None:
+        return
+    name = urllib.parse.unquote(pc.fragment)
+    if not name and 'name' in pc.params:
+        name = urllib.parse.unquote(pc.params['name'])
+    pc.flag = _find_flag(name)
+
+    if '@' in parsed.netloc:
+        # SIP002: ss://base64(method:password)@host:port
+        userinfo = urllib.parse.unquote(parsed.netloc.rpartition('@')[0])
+        if ':' not in userinfo:
+            try:
+                userinfo = _b64decode_text(userinfo)
+            except Exception:
+                return
+        pc.credential = userinfo.partition(':')[2]
+        return
+
+    # Старый формат: ss://base64(method:password@host:port)
+    try:
+        decoded = _b64decode_text(urllib.parse.unquote(parsed.netloc))
+    except Exception:
+        return
+    userinfo, _, server = decoded.rpartition('@')
+    host, _, port = server.rpartition(':')
+    pc.credential = userinfo.partition(':')[2]
+    if host and port.isdigit():
+        pc.host = host.strip('[]').lower()
+        pc.port = int(port)
+
+def _parse_ssr(pc: ParsedConfig):
+    # ssr://base64(host:port:protocol:method:obfs:base64(password)/?params)
+    body, sep, fragment = pc.raw[6:].rpartition('#')
+    if not sep:
+        body, fragment = fragment, ""
+    pc.fragment = fragment
+    pc.flag = _find_flag(urllib.parse.unquote(fragment))
+    try:
+        decoded = _b64decode_text(body)
+    except Exception:
+        return
+    main_part, _, query = decoded.partition('/?')
+    parts = main_part.rsplit(':', 5)
+    if len(parts) != 6 or not parts[1].isdigit():
+        return
+    pc.host = parts[0].strip('[]').lower()
+    pc.port = int(parts[1])
+    try:
+        pc.credential = _b64decode_text(parts[5])
+    except Exception:
+        pc.credential = parts[5]
+    pc.params = {name: values[0] for name, values in urllib.parse.parse_qs(query).items()}
+
+def _parse_tuic_hysteria(pc: ParsedConfig):
+    parsed = _parse_url(pc)
+    if parsed is not None and pc.scheme == "hysteria" and not pc.credential:
+        pc.credential = pc.params.get('auth', '')
+    # Имя для нумерации берётся после последнего '#'
+    pc.fragment = pc.raw.rpartition('#')[2] if '#' in pc.raw else ""
+    pc.flag = _find_flag(urllib.parse.unquote(pc.fragment))
+
+_SCHEME_PARSERS = {
+    "vmess": _parse_vmess,
+    "vless": _parse_vless_trojan,
+    "trojan": _parse_vless_trojan,
+    "ss": _parse_ss,
+    "ssr": _parse_ssr,
+    "tuic": _parse_tuic_hysteria,
+    "hysteria": _parse_tuic_hysteria,
+    "hysteria2": _parse_tuic_hysteria,
+}
+
+def parse_config(config: "str | ParsedConfig") -> ParsedConfig:
+    """Разбирает строку конфига один раз протокольным парсером"""
+    if isinstance(config, ParsedConfig):
+        return config
+    scheme = config_scheme(config)
+    pc = ParsedConfig(config, scheme)
+    if not config:
+        pc.key = ""
+        return pc
+    parser = _SCHEME_PARSERS.get(scheme)
+    if parser:
+        parser(pc)
+    else:
+        pc.fragment = config.rpartition('#')[2] if '#' in config else ""
+        pc.flag = _find_flag(urllib.parse.unquote(pc.fragment))
+    return pc
+
+def extract_host_port(config: str) -> tuple[str, int] | None:
+    """Извлекает хост и порт из конфигурационной строки для дедупликации"""
+    if not config:
+        return None
+    return parse_config(config).host_port
+
+def generate_config_key(config: str) -> str:
+    """Генерирует уникальный ключ для конфига на основе всех параметров"""
+    if not config:
+        return ""
+    return parse_config(config).key
+
+# Индекс подсетей в рабочем процессе: передаётся готовым, а не строится заново
+_WORKER_WHITELIST_INDEX = None
+
+def _init_parse_worker(whitelist_index: SubnetIndex):
+    global _WORKER_WHITELIST_INDEX
+    _WORKER_WHITELIST_INDEX = whitelist_index
+
+def _parse_chunk(lines: list[str]) -> tuple[list[list], bytes]:
+    """Задание рабочего процесса: записи to_record() без строки и попадание в whitelist по байту на конфиг
+
+    Возвращаются простые списки и bytes, а не объекты, и без исходных строк - они
+    и так есть у основного процесса: так pickle передаёт результат дешевле.
+    В журнал задание не пишет: обо всём сообщает основной процесс.
+    """
+    configs = [parse_config(line) for line in lines]
+    hosts = []
+    for parsed in configs:
+        host_port = parsed.host_port
+        hosts.append(host_port[0] if host_port else "")
+    return [parsed.to_record()[1:] for parsed in configs], bytes(_WORKER_WHITELIST_INDEX.classify(hosts))
+
+def parse_many(lines: list[str]) -> list[ParsedConfig]:
+    """Разбирает пачку строк, при PARSE_WORKERS > 1 - кусками в пуле процессов
+
+    Порядок результата совпадает с порядком строк. Конфиги из пула приходят с уже
+    проставленным in_whitelist. Если пул недоступен, разбор идёт в основном процессе.
+    """
+    chunk_size = max(1, PARSE_CHUNK_SIZE)
+    if PARSE_WORKERS <= 1 or len(lines) < 2 * chunk_size:
+        return [parse_config(line) for line in lines]
+
+    chunks = [lines[start:start + chunk_size] for start in range(0, len(lines), chunk_size)]
+    workers = min(PARSE_WORKERS, len(chunks))
+    # Не fork: у основного процесса уже работают поток журнала и потоки загрузки,
+    # и копия их захваченных блокировок может навсегда остановить рабочий процесс
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=_init_parse_worker, initargs=(get_whitelist_index(),),
+        ) as pool:
+            results = list(pool.map(_parse_chunk, chunks))
+    except (OSError, concurrent.futures.process.BrokenProcessPool) as e:
+        log(f"⚠️  Пул разбора недоступен, разбор в основном процессе: {str(e)[:100]}")
+        return [parse_config(line) for line in lines]
+
+    configs = []
+    for chunk, (records, flags) in zip(chunks, results):
+        for line, record, in_whitelist in zip(chunk, records, flags):
+            parsed = ParsedConfig.from_record((line, *record))
+            parsed.in_whitelist = bool(in_whitelist)
+            configs.append(parsed)
+    log(f"🧮 Разобрано {len(configs)} строк в {workers} процессах ({len(chunks)} кусков)")
+    return configs
+
+
+CONFIG_SCHEMES = frozenset(("vmess", "vless", "trojan", "ss", "ssr", "tuic", "hysteria", "hysteria2"))
+# Длина самой длинной схемы с "://" - дальше искать разделитель нет смысла
+_MAX_SCHEME_PREFIX = max(len(scheme) for scheme in CONFIG_SCHEMES) + 3
+_SCHEME_BOUNDARY_RE = re.compile(r'(?:vmess|vless|trojan|ss|ssr|tuic|hysteria|hysteria2)://')
+# Незавершённая строка без переводов строк режется по схемам, когда вырастает больше этого
+_MAX_PENDING_LINE = 64 * 1024
+
+def config_scheme(line: str) -> str:
+    """Возвращает схему конфига, если строка начинается с поддерживаемой схемы"""
+    sep = line.find("://", 0, _MAX_SCHEME_PREFIX)
+    if sep > 0 and line[:sep] in CONFIG_SCHEMES:
+        return line[:sep]
+    return ""
+
+def is_config_line(line: str) -> bool:
+    """Проверяет, похожа ли очищенная строка на конфиг"""
+    if config_scheme(line):
+        return True
+    return '@' in line and ':' in line and line.count(':') >= 2
+
+def _accept_line(segment: str) -> Iterator[str]:
+    """Отдаёт сегмент, если после очистки это конфиг"""
+    line = segment.strip()
+    if line and not line.startswith('#') and len(line) > 10 and is_config_line(line):
+        yield line
+
+def _configs_from_text(text: str) -> Iterator[str]:
+    """Режет завершённый фрагмент текста на строки и по границам схем"""
+    for physical_line in text.splitlines():
+        start = 0
+        for match in _SCHEME_BOUNDARY_RE.finditer(physical_line):
+            if match.start() > start:
+                yield from _accept_line(physical_line[start:match.start()])
+            start = match.start()
+        yield from _accept_line(physical_line[start:])
+
+def iter_configs_from_chunks(chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    """Потоково извлекает конфиги из кусков тела ответа"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        newline = pending.rfind("\n")
+        if newline >= 0:
+            yield from _configs_from_text(pending[:newline + 1])
+            pending = pending[newline + 1:]
+        if len(pending) > _MAX_PENDING_LINE:
+            # Источник без переводов строк: всё до последней схемы уже не изменится
+            last_start = 0
+            for match in _SCHEME_BOUNDARY_RE.finditer(pending):
+                last_start = match.start()
+            if last_start > 0:
+                yield from _configs_from_text(pending[:last_start])
+                pending = pending[last_start:]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield from _configs_from_text(pending)
+
+
+_NUMBERING_LABELS = {
+    "vmess": "VMESS",
+    "vless": "VLESS",
+    "trojan": "TROJAN",
+    "ss": "SS",
+    "ssr": "SSR",
+    "tuic": "TUIC",
+    "hysteria": "HYSTERIA",
+    "hysteria2": "HYSTERIA2",
+}
+
+def add_numbering_to_name(config: "str | ParsedConfig", number: int) -> str:
+    """Добавляет нумерацию и вотермарк в поле name конфига"""
+    pc = parse_config(config)
+    try:
+        flag = pc.flag + " " if pc.flag else ""
+        new_name = f"{number}. {flag}{_NUMBERING_LABELS.get(pc.scheme, 'CONFIG')} | TG: @wlrustg"
+
+        if pc.scheme == "vmess":
+            if pc.vmess is None:
+                return pc.raw
+            new_json = json.dumps(dict(pc.vmess, ps=new_name), separators=(',', ':'))
+            encoded = base64.b64encode(new_json.encode()).decode()
+            return f"vmess://{encoded}"
+
+        if pc.fragment is None:
+            return pc.raw
+
+        new_fragment = urllib.parse.quote(new_name, safe='')
+        if pc.scheme in _URL_FRAGMENT_SCHEMES:
+            base_part = pc.raw.partition('#')[0]
+        elif '#' in pc.raw:
+            base_part = pc.raw.rpartition('#')[0]
+        else:
+            base_part = pc.raw
+        return f"{base_part}#{new_fragment}"
+
+    except Exception as e:
+        log(f"Ошибка добавления нумерации к конфигу: {str(e)[:100]}")
+        return pc.raw
+
+
+def extract_existing_info(config: str) -> tuple:
+    """Извлекает существующие информацию из конфига: номер, флаг, вотермарк"""
+    config_clean = config.strip()
+    
+    number_match = re.search(r'(?:#?\s*)(\d{1,3})(?:\.|\s+|$)', config_clean)
+    number = number_match.group(1) if number_match else None
+    
+    flag_match = re.search(r'[\U0001F1E6-\U0001F1FF]{2}', config_clean)
+    flag = flag_match.group(0) if flag_match else ""
+    
+    tg_match = re.search(r'TG\s*:\s*@wlrustg', config_clean, re.IGNORECASE)
+    tg = tg_match.group(0) if tg_match else ""
+    
+    return number, flag, tg
+
+
+def process_configs_with_numbering(configs: "list[str | ParsedConfig]") -> list[str]:
+    """Добавляет нумерацию и вотермарк в поле name конфигов"""
+    processed_configs = []
+    
+    for i, config in enumerate(configs, 1):
+        raw = str(config)
+        # Если уже есть номер и наш вотермарк, не меняем
+        if "TG: @wlrustg" in raw and extract_existing_info(raw)[0]:
+            processed_configs.append(raw)
+        else:
+            # Добавляем нумерацию
+            processed = add_numbering_to_name(config, i)
+            processed_configs.append(processed)
+    
+    return processed_configs
+
+
+def merge_and_deduplicate(all_configs: "list[str | ParsedConfig]") -> tuple[list[ParsedConfig], list[ParsedConfig]]:
+    """Объединяет и дедуплицирует конфиги, возвращает два списка: все конфиги и whitelist конфиги
+
+    Каждая строка разбирается в ParsedConfig один раз; дальше по конвейеру идут уже разобранные конфиги.
+    """
+    if not all_configs:
+        return [], []
+    
+    seen_full = set()
+    seen_config_keys = set()  # Уникальные ключи конфигов (по параметрам)
+    unique_configs = []
+    duplicates = {"empty": 0, "exact": 0, "params": 0}
+    verbose = logger.isEnabledFor(logging.DEBUG)
+
+    # Полные дубликаты отсеиваются до разбора: разбираются только первые вхождения строк
+    first_seen = []
+    for config in all_configs:
+        raw = config.raw if isinstance(config, ParsedConfig) else config.strip()
+        if not raw:
+            duplicates["empty"] += 1
+            continue
+        if raw in seen_full:
+            duplicates["exact"] += 1
+            if verbose:
+                log("Дубликат (полный): " + raw[:120], level=logging.DEBUG, reason="exact")
+            continue
+        seen_full.add(raw)
+        first_seen.append(config if isinstance(config, ParsedConfig) else raw)
+
+    # Неразобранные строки разбираются пачкой (в пуле процессов при PARSE_WORKERS > 1);
+    # здесь остаётся только упорядоченный проход "первый побеждает"
+    positions = [index for index, config in enumerate(first_seen) if not isinstance(config, ParsedConfig)]
+    if positions:
+        for index, parsed in zip(positions, parse_many([first_seen[index] for index in positions])):
+            first_seen[index] = parsed
+
+    for parsed in first_seen:
+        # Уникальный ключ конфига на основе его параметров
+        config_key = parsed.key
+        if config_key and config_key in seen_config_keys:
+            duplicates["params"] += 1
+            if verbose:
+                log("Дубликат (по параметрам): " + parsed.raw[:120], level=logging.DEBUG, reason="params")
+            continue
+        seen_config_keys.add(config_key)
+        
+        unique_configs.append(parsed)
+    
+    # Проверка на whitelist (по IP) одной пачкой - для конфигов, которых не проверил пул разбора
+    unchecked = [parsed for parsed in unique_configs if parsed.in_whitelist is None]
+    hosts = []
+    for parsed in unchecked:
+        host_port = parsed.host_port
+        hosts.append(host_port[0] if host_port else "")
+    for parsed, in_whitelist in zip(unchecked, classify_ips(hosts)):
+        parsed.in_whitelist = in_whitelist
+    whitelist_configs = [parsed for parsed in unique_configs if parsed.in_whitelist]
+    
+    for reason, count in duplicates.items():
+        if count:
+            count_duplicates(reason, count)
+    duplicate_count = sum(duplicates.values())
+    if duplicate_count > 0:
+        log(f"🔍 Удалено {duplicate_count} дубликатов (полных или по параметрам)")
+    
+    return unique_configs, whitelist_configs
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Строит регулярное выражение из префиксного дерева литералов
+
+    Общие префиксы вынесены, поэтому движок re проверяет каждую позицию текста
+    за длину самой длинной иглы, а не перебором всех паттернов.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        ends_here = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if ends_here else group
+
+    return build(trie)
+
+
+class ExclusionMatcher:
+    """Список исключений, скомпилированный в одно регулярное выражение
+
+    Префиксы паттернов сохраняют смысл: '#' - remark, '@' - адрес, '/' - path, иначе подстрока.
+    """
+
+    __slots__ = ("case_sensitive", "_rules", "_regex")
+
+    def __init__(self, patterns: Iterable[str], case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self._rules = []
+        needles = set()
+        for pattern in patterns:
+            if not case_sensitive:
+                pattern = pattern.lower()
+            if pattern.startswith("#"):  # Исключение по remark
+                rule_needles = (pattern,)
+                reason = f"remark содержит: {pattern}"
+            elif pattern.startswith("@"):  # Исключение по адресу
+                rule_needles = (pattern,)
+                reason = f"адрес содержит: {pattern}"
+            elif pattern.startswith("/"):  # Исключение по path (в том числе URL-кодированному)
+                rule_needles = (f"path={pattern}", f"path%3D{pattern}")
+                reason = f"path содержит: {pattern}"
+            else:  # Общая проверка по подстроке
+                rule_needles = (pattern,)
+                reason = f"содержит: {pattern}"
+            if not case_sensitive:
+                rule_needles = tuple(needle.lower() for needle in rule_needles)
+            self._rules.append((rule_needles, reason))
+            needles.update(rule_needles)
+        self._regex = re.compile(_trie_pattern(needles)) if needles else None
+
+    def match(self, config: str) -> str:
+        """Возвращает причину исключения или пустую строку"""
+        if self._regex is None:
+            return ""
+        text = config if self.case_sensitive else config.lower()
+        if not self._regex.search(text):
+            return ""
+        # Причина - первый по порядку сработавший паттерн (как при переборе)
+        for rule_needles, reason in self._rules:
+            if any(needle in text for needle in rule_needles):
+                return reason
+        return ""
+
+@functools.lru_cache(maxsize=8)
+def compile_exclusions(patterns: tuple[str, ...], case_sensitive: bool = False) -> ExclusionMatcher:
+    """Компилирует список исключений (результат кэшируется)"""
+    return ExclusionMatcher(patterns, case_sensitive)
+
+def save_excluded_configs(excluded_configs: "list[str | ParsedConfig]", excluded_filename: str):
+    """Сохраняет исключенные конфиги в отдельный файл"""
+    with open(excluded_filename, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(str(config) for config in excluded_configs))
+    log(f"💾 Исключенные конфиги сохранены в {excluded_filename} ({len(excluded_configs)} шт.)")
+
+def filter_excluded_configs(configs, exclude_patterns=None, settings=None, excluded_file=None):
+    """
+    Фильтрует конфиги по паттернам исключения
+
+    Для ParsedConfig причина исключения запоминается в поле excluded, чтобы
+    подмножества (например, whitelist) не приходилось фильтровать повторно.
+    """
+    if exclude_patterns is None:
+        exclude_patterns = EXCLUDE_PATTERNS
+    
+    if settings is None:
+        settings = EXCLUDE_SETTINGS.copy()
+    else:
+        settings = settings.copy()
+    
+    if excluded_file:
+        settings["excluded_file"] = excluded_file
+    
+    filtered_configs = []
+    excluded_configs = []
+    exclusion_stats = {}
+    
+    matcher = compile_exclusions(tuple(exclude_patterns), settings.get("case_sensitive", False))
+    
+    for config in configs:
+        reason = matcher.match(str(config))
+        if isinstance(config, ParsedConfig):
+            config.excluded = reason
+        
+        if reason:
+            excluded_configs.append(config)
+            # Статистика по причинам
+            exclusion_stats[reason] = exclusion_stats.get(reason, 0) + 1
+        else:
+            filtered_configs.append(config)
+    
+    # Вывод статистики
+    if settings.get("log_excluded", True):
+        log(f"🚫 Фильтрация исключений:")
+        log(f"   Всего конфигов до фильтрации: {len(configs)}")
+        log(f"   Исключено: {len(excluded_configs)}")
+        log(f"   Осталось после исключений: {len(filtered_configs)}")
+        
+        if exclusion_stats:
+            log(f"   Причины исключений:")
+            for reason, count in exclusion_stats.items():
+                log(f"     • {reason}: {count}")
+    
+    # Сохранение исключенных конфигов
+    if settings.get("save_excluded", True) and excluded_configs:
+        save_excluded_configs(excluded_configs, settings.get("excluded_file", "excluded.txt"))
+    
+    return filtered_configs, excluded_configs
@@ -0,0 +1,128 @@
+"""
+Дельты подписок: какие конфиги добавились и пропали с прошлого запуска.
+
+Между запусками хранится набор ключей дедупликации (generate_config_key) каждого списка.
+Рядом со снимками пишется delta.json: номер последовательности и последние патчи.
+Зеркало, знающее свой seq, применяет патчи с большими номерами по порядку, а если
+отстало дальше истории - забирает полный снимок.
+
+Поле epoch меняется, только когда последовательность начата заново (нет ни состояния,
+ни опубликованного delta.json): зеркало с другим epoch забирает полный снимок,
+даже если его seq больше текущего.
+"""
+
+import hashlib
+import json
+import time
+import os
+
+from common import PATHS, log, run_timestamp
+from compression import open_output
+from configs import ParsedConfig
+
+DELTA_OUTPUTS = os.environ.get("DELTA_OUTPUTS", "1") == "1"
+DELTA_STATE_FILE = os.environ.get("DELTA_STATE_FILE", ".cache/delta_state.json")
+DELTA_FILE = "delta.json"
+# Сколько последних патчей держать в delta.json
+DELTA_HISTORY = int(os.environ.get("DELTA_HISTORY", "48"))
+
+def config_id(key: str) -> str:
+    """Короткий идентификатор конфига по ключу дедупликации"""
+    return hashlib.sha256(key.encode("utf-8", errors="replace")).hexdigest()[:16]
+
+def load_delta_state() -> dict:
+    if not DELTA_STATE_FILE:
+        return {}
+    try:
+        with open(DELTA_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+def save_delta_state(state: dict):
+    if not DELTA_STATE_FILE:
+        return
+    try:
+        os.makedirs(os.path.dirname(DELTA_STATE_FILE) or ".", exist_ok=True)
+        with open(DELTA_STATE_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(DELTA_STATE_FILE + ".tmp", DELTA_STATE_FILE)
+    except OSError as e:
+        log(f"⚠️  Не удалось сохранить состояние дельт: {str(e)[:100]}")
+
+def _load_published_delta(path: str) -> dict:
+    """Прошлый опубликованный delta.json - по нему продолжается seq, если состояние потеряно"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            delta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return delta if isinstance(delta, dict) and isinstance(delta.get("seq"), int) else {}
+
+def diff_lists(previous: dict[str, str], current: dict[str, str]) -> dict[str, list[list[str]]]:
+    """Патч одного списка: added - [id, строка] новых конфигов, removed - [id, прежняя строка]"""
+    return {
+        "added": [[cid, line] for cid, line in current.items() if cid not in previous],
+        "removed": [[cid, line] for cid, line in previous.items() if cid not in current],
+    }
+
+def write_delta(lists: dict[str, tuple[list[ParsedConfig], list[str] | None]],
+                base_dir: str | None = None) -> dict:
+    """Сравнивает списки с прошлым запуском и пишет delta.json; возвращает его содержимое
+
+    lists - имя списка -> (конфиги, строки в том виде, как они записаны в файл).
+    Список, который не удалось сохранить (строки None), остаётся в состоянии прежним.
+    """
+    path = os.path.join(PATHS["base_dir"] if base_dir is None else base_dir, DELTA_FILE)
+    state = load_delta_state()
+    if not state:
+        # Кэш Actions мог быть вытеснен: seq не должен откатываться относительно опубликованного
+        published = _load_published_delta(path)
+        if published:
+            state = {"seq": published["seq"], "epoch": published.get("epoch")}
+            log(f"⚠️  Состояние дельт потеряно: seq продолжается с {published['seq']} "
+                f"по опубликованному {DELTA_FILE}, патчей до нового снимка не будет")
+    epoch = state.get("epoch") or int(time.time())
+    previous_lists = state.get("lists", {})
+    current_lists = dict(previous_lists)
+    for name, (configs, lines) in lists.items():
+        if lines is not None:
+            current_lists[name] = {config_id(parsed.key): line for parsed, line in zip(configs, lines)}
+
+    seq = state.get("seq", 0)
+    patches = state.get("patches", [])
+    changes = {
+        name: diff_lists(previous_lists[name], current)
+        for name, current in current_lists.items() if name in previous_lists
+    }
+    changed = any(patch["added"] or patch["removed"] for patch in changes.values())
+    if not previous_lists:
+        seq += 1  # Первый запуск - только базовый снимок, патчей ещё нет
+    elif changed:
+        seq += 1
+        patches = (patches + [{"seq": seq, "timestamp": run_timestamp(), "lists": changes}])[-DELTA_HISTORY:]
+
+    delta = {
+        "epoch": epoch,
+        "seq": seq,
+        # Самый ранний seq, от которого можно догнать текущий по патчам
+        "min_seq": patches[0]["seq"] - 1 if patches else seq,
+        "snapshots": {name: os.path.basename(PATHS.get(name, name)) for name in current_lists},
+        "counts": {name: len(current) for name, current in current_lists.items()},
+        "patches": patches,
+    }
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open_output(path) as f:
+            f.write(json.dumps(delta, ensure_ascii=False, separators=(",", ":")))
+    except OSError as e:
+        log(f"⚠️  Не удалось сохранить {DELTA_FILE}: {str(e)[:100]}")
+        return delta
+    save_delta_state({"epoch": epoch, "seq": seq, "lists": current_lists, "patches": patches})
+
+    summary = ", ".join(
+        f"{name} +{len(patch['added'])}/-{len(patch['removed'])}" for name, patch in changes.items()
+    )
+    log(f"🔁 Дельта: seq {seq}" + (f", {summary}" if summary else ", базовый снимок"))
+    return delta
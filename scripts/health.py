@@ -0,0 +1,143 @@
+"""
+Здоровье источников между запусками: задержки, доля успехов и ошибки подряд.
+
+По истории задержек подбирается таймаут источника, а автомат (circuit breaker)
+пропускает хронически падающие источники и лишь изредка пробует их снова.
+"""
+
+import threading
+import json
+import time
+import os
+
+from common import log
+
+SOURCE_HEALTH_FILE = os.environ.get("SOURCE_HEALTH_FILE", ".cache/source_health.json")
+# Сколько последних загрузок помнить для процентилей и доли успехов
+HEALTH_WINDOW = int(os.environ.get("HEALTH_WINDOW", "20"))
+# Таймаут запроса: p95 * множитель, но в пределах [min, max] секунд
+SOURCE_TIMEOUT_DEFAULT = float(os.environ.get("SOURCE_TIMEOUT", "15"))
+SOURCE_TIMEOUT_MIN = float(os.environ.get("SOURCE_TIMEOUT_MIN", "5"))
+SOURCE_TIMEOUT_FACTOR = 3.0
+# Автомат размыкается после стольких ошибок подряд
+BREAKER_THRESHOLD = int(os.environ.get("BREAKER_THRESHOLD", "3"))
+# Пауза перед пробной загрузкой; удваивается после каждой неудачной пробы
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", "3600"))
+BREAKER_MAX_COOLDOWN = 24 * 3600
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+HEALTH: dict[str, dict] = {}
+HEALTH_STATS = {"skipped": 0, "probes": 0, "opened": 0, "closed": 0}
+_HEALTH_LOCK = threading.Lock()
+
+def percentile(values: list[float], q: float) -> float:
+    """Процентиль q (0..1) с линейной интерполяцией; 0.0 для пустого списка"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def load_source_health() -> dict[str, dict]:
+    """Читает состояние здоровья источников в HEALTH"""
+    HEALTH.clear()
+    if not SOURCE_HEALTH_FILE:
+        return HEALTH
+    try:
+        with open(SOURCE_HEALTH_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return HEALTH
+    if isinstance(data, dict):
+        HEALTH.update({url: entry for url, entry in data.items() if isinstance(entry, dict)})
+    return HEALTH
+
+def _summary(entry: dict) -> dict:
+    """Производные поля для чтения человеком: p50/p95 и доля успехов"""
+    outcomes = entry.get("outcomes", [])
+    return {
+        "p50": round(percentile(entry.get("latencies", []), 0.5), 3),
+        "p95": round(percentile(entry.get("latencies", []), 0.95), 3),
+        "success_rate": round(sum(outcomes) / len(outcomes), 3) if outcomes else None,
+    }
+
+def save_source_health(urls: list[str] | None = None):
+    """Сохраняет HEALTH; источники не из urls (убранные из URLS) отбрасываются"""
+    if not SOURCE_HEALTH_FILE:
+        return
+    with _HEALTH_LOCK:
+        data = {
+            url: {**entry, **_summary(entry)} for url, entry in HEALTH.items()
+            if urls is None or url in urls
+        }
+    try:
+        os.makedirs(os.path.dirname(SOURCE_HEALTH_FILE) or ".", exist_ok=True)
+        with open(SOURCE_HEALTH_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(SOURCE_HEALTH_FILE + ".tmp", SOURCE_HEALTH_FILE)
+    except OSError as e:
+        log(f"⚠️  Не удалось сохранить здоровье источников: {str(e)[:100]}")
+
+def latency_percentile(url: str, q: float) -> float:
+    """Процентиль задержки успешных загрузок источника (0.0 без истории)"""
+    with _HEALTH_LOCK:
+        return percentile(HEALTH.get(url, {}).get("latencies", []), q)
+
+def source_timeout(url: str) -> float:
+    """Таймаут запроса к источнику по его p95; без истории - SOURCE_TIMEOUT_DEFAULT"""
+    p95 = latency_percentile(url, 0.95)
+    if not p95:
+        return SOURCE_TIMEOUT_DEFAULT
+    return min(SOURCE_TIMEOUT_DEFAULT, max(SOURCE_TIMEOUT_MIN, p95 * SOURCE_TIMEOUT_FACTOR))
+
+def breaker_state(url: str, now: float | None = None) -> str:
+    """Состояние автомата: closed - грузим, open - пропускаем, half_open - одна пробная попытка"""
+    now = time.time() if now is None else now
+    with _HEALTH_LOCK:
+        entry = HEALTH.get(url)
+        if not entry or entry.get("consecutive_failures", 0) < BREAKER_THRESHOLD:
+            return CLOSED
+        if now < entry.get("opened_at", 0) + entry.get("cooldown", BREAKER_COOLDOWN):
+            return OPEN
+        return HALF_OPEN
+
+def record_fetch(url: str, ok: bool, seconds: float, error: str = "", now: float | None = None):
+    """Учитывает исход загрузки источника и переключает автомат"""
+    now = time.time() if now is None else now
+    with _HEALTH_LOCK:
+        entry = HEALTH.setdefault(url, {})
+        was_open = entry.get("consecutive_failures", 0) >= BREAKER_THRESHOLD
+        entry["outcomes"] = (entry.get("outcomes", []) + [1 if ok else 0])[-HEALTH_WINDOW:]
+        if ok:
+            entry["latencies"] = (entry.get("latencies", []) + [round(seconds, 3)])[-HEALTH_WINDOW:]
+            entry["consecutive_failures"] = 0
+            entry["last_success"] = int(now)
+            entry.pop("opened_at", None)
+            entry.pop("cooldown", None)
+            entry.pop("last_error", None)
+            if was_open:
+                HEALTH_STATS["closed"] += 1
+            return
+        entry["consecutive_failures"] = entry.get("consecutive_failures", 0) + 1
+        if error:
+            entry["last_error"] = error[:100]
+        if was_open:
+            # Пробная загрузка не удалась - ждём вдвое дольше
+            entry["cooldown"] = min(entry.get("cooldown", BREAKER_COOLDOWN) * 2, BREAKER_MAX_COOLDOWN)
+            entry["opened_at"] = int(now)
+        elif entry["consecutive_failures"] >= BREAKER_THRESHOLD:
+            entry["cooldown"] = BREAKER_COOLDOWN
+            entry["opened_at"] = int(now)
+            HEALTH_STATS["opened"] += 1
+
+def log_source_health():
+    """Выводит итоги автомата источников"""
+    if not any(HEALTH_STATS.values()):
+        return
+    log(f"🩺 Источники: пропущено {HEALTH_STATS['skipped']}, пробных загрузок {HEALTH_STATS['probes']}, "
+        f"автомат разомкнут {HEALTH_STATS['opened']}, восстановлено {HEALTH_STATS['closed']}")
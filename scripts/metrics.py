@@ -0,0 +1,135 @@
+"""
+Метрики запуска: время этапов, показатели источников, дубликаты по причинам и пик памяти.
+Пишутся в metrics.json и в текстовый файл для Prometheus (textfile collector node_exporter).
+"""
+
+import contextlib
+import threading
+import logging
+import json
+import time
+import sys
+import os
+
+from common import log
+
+# Каталог для metrics.json и metrics.prom; пусто - метрики не сохраняются
+METRICS_DIR = os.environ.get("METRICS_DIR", ".cache/metrics")
+METRICS_PREFIX = "wlrus"
+
+STAGES: dict[str, float] = {}
+SOURCES: dict[str, dict] = {}
+DUPLICATES: dict[str, int] = {}
+COUNTERS: dict[str, float] = {}
+_METRICS_LOCK = threading.Lock()
+
+def record_stage(name: str, seconds: float):
+    """Добавляет время этапа (повторные замеры одного этапа суммируются)"""
+    with _METRICS_LOCK:
+        STAGES[name] = STAGES.get(name, 0.0) + seconds
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Замеряет время блока как этап name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        record_stage(name, elapsed)
+        log(f"⏱️ Этап {name}: {elapsed:.2f} с", level=logging.DEBUG, stage=name, elapsed=round(elapsed, 3))
+
+def record_source(url: str, **fields):
+    """Дополняет показатели источника: seconds, bytes, status, attempts, configs, error..."""
+    with _METRICS_LOCK:
+        SOURCES.setdefault(url, {}).update(fields)
+
+def count_duplicates(reason: str, value: int = 1):
+    with _METRICS_LOCK:
+        DUPLICATES[reason] = DUPLICATES.get(reason, 0) + value
+
+def set_counter(name: str, value: float):
+    with _METRICS_LOCK:
+        COUNTERS[name] = value
+
+def peak_rss_bytes() -> int:
+    """Пиковый RSS процесса (0, если платформа не даёт его узнать)"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт КиБ, macOS - байты
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def snapshot() -> dict:
+    """Все метрики запуска одним словарём"""
+    with _METRICS_LOCK:
+        return {
+            "timestamp": int(time.time()),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": {name: round(seconds, 4) for name, seconds in STAGES.items()},
+            "sources": {url: dict(fields) for url, fields in SOURCES.items()},
+            "duplicates": dict(DUPLICATES),
+            "counters": dict(COUNTERS),
+        }
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def to_prometheus(data: dict) -> str:
+    """Форматирует снимок метрик в текстовый формат Prometheus"""
+    lines = []
+
+    def metric(name: str, help_text: str, samples: list[tuple[dict, float]], kind: str = "gauge"):
+        if not samples:
+            return
+        full_name = f"{METRICS_PREFIX}_{name}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f"{full_name}{{{label_text}}} {value}" if label_text else f"{full_name} {value}")
+
+    metric("run_timestamp_seconds", "Время завершения запуска", [({}, data["timestamp"])])
+    metric("peak_rss_bytes", "Пиковый RSS процесса", [({}, data["peak_rss_bytes"])])
+    metric("stage_duration_seconds", "Время этапа",
+           [({"stage": name}, seconds) for name, seconds in data["stages"].items()])
+    for field, help_text in (
+        ("seconds", "Время загрузки источника"),
+        ("bytes", "Размер тела источника"),
+        ("wire_bytes", "Передано байт по сети (до распаковки)"),
+        ("status", "HTTP-статус последнего ответа источника"),
+        ("attempts", "Число попыток загрузки источника"),
+        ("timeout", "Адаптивный таймаут запроса к источнику"),
+        ("configs", "Конфигов получено из источника"),
+    ):
+        metric(f"source_{field}", help_text, [
+            ({"source": url}, fields[field]) for url, fields in data["sources"].items()
+            if isinstance(fields.get(field), (int, float))
+        ])
+    metric("duplicates", "Удалено дубликатов по причинам",
+           [({"reason": reason}, value) for reason, value in data["duplicates"].items()])
+    for name, value in data["counters"].items():
+        metric(name, name, [({}, value)])
+    return "\n".join(lines) + "\n"
+
+def write_metrics(directory: str | None = None) -> dict:
+    """Сохраняет metrics.json и metrics.prom, возвращает снимок метрик"""
+    directory = METRICS_DIR if directory is None else directory
+    data = snapshot()
+    if not directory:
+        return data
+    try:
+        os.makedirs(directory, exist_ok=True)
+        for filename, content in (
+            ("metrics.json", json.dumps(data, ensure_ascii=False, indent=1)),
+            ("metrics.prom", to_prometheus(data)),
+        ):
+            path = os.path.join(directory, filename)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)  # Атомарно, чтобы коллектор не прочитал половину файла
+    except OSError as e:
+        log(f"⚠️  Не удалось сохранить метрики: {str(e)[:100]}")
+    return data
@@ -0,0 +1,209 @@
+"""
+Проверка доступности серверов: TCP-подключение и, где конфиг использует TLS, рукопожатие с его SNI.
+
+Каждый уникальный host:port проверяется один раз за запуск, результаты кэшируются с TTL,
+поэтому повторные запуски проверяют только устаревшие адреса. По измеренной задержке
+конфиги упорядочиваются, недоступные опускаются в конец или отбрасываются.
+"""
+
+import ipaddress
+import asyncio
+import ssl
+import json
+import time
+import os
+
+from common import log
+from configs import ParsedConfig
+
+# По умолчанию выключено: перестановка по задержке меняет нумерацию merged.txt и wl.txt
+# каждый запуск, и неизменившиеся файлы перестают пропускаться при публикации
+PROBE_ENABLED = os.environ.get("PROBE_ENABLED", "0") == "1"
+PROBE_CONCURRENCY = int(os.environ.get("PROBE_CONCURRENCY", "256"))
+# Таймаут одной проверки (подключение и рукопожатие) и всего этапа, секунды
+PROBE_TIMEOUT = float(os.environ.get("PROBE_TIMEOUT", "3"))
+PROBE_DEADLINE = float(os.environ.get("PROBE_DEADLINE", "120"))
+PROBE_CACHE_FILE = os.environ.get("PROBE_CACHE_FILE", ".cache/probe.json")
+# Сколько секунд результат проверки считается свежим (для недоступных - меньше)
+PROBE_TTL = int(os.environ.get("PROBE_TTL", str(6 * 3600)))
+PROBE_DEAD_TTL = int(os.environ.get("PROBE_DEAD_TTL", "3600"))
+# Что делать с недоступными: demote - в конец списка, drop - отбросить, keep - вместе с непроверенными.
+# По умолчанию demote: раннер CI видит сеть не так, как подписчики в России
+PROBE_DEAD_ACTION = os.environ.get("PROBE_DEAD_ACTION", "demote")
+# Задержки округляются до корзин, чтобы шум измерений не переставлял файл каждый запуск
+PROBE_LATENCY_BUCKET_MS = int(os.environ.get("PROBE_LATENCY_BUCKET_MS", "100"))
+
+# Протоколы поверх UDP: TCP-подключение о них ничего не говорит
+UDP_SCHEMES = frozenset(("tuic", "hysteria", "hysteria2"))
+
+PROBE_STATS = {"endpoints": 0, "cached": 0, "probed": 0, "alive": 0, "dead": 0, "skipped": 0}
+
+def probe_target(parsed: ParsedConfig) -> tuple[str, int, str | None] | None:
+    """(host, port, SNI или None для чистого TCP); None - конфиг не проверяется"""
+    if parsed.scheme in UDP_SCHEMES:
+        return None
+    host_port = parsed.host_port
+    if not host_port:
+        return None
+    host, port = host_port[0].strip("[]"), host_port[1]
+    if not 0 < port < 65536:
+        return None
+
+    params = parsed.params or {}
+    if parsed.vmess:
+        tls = parsed.vmess.get("tls") in ("tls", "reality")
+        sni = parsed.vmess.get("sni") or parsed.vmess.get("host")
+    else:
+        security = params.get("security", "tls" if parsed.scheme == "trojan" else "none")
+        tls = security in ("tls", "reality")
+        sni = params.get("sni") or params.get("peer") or params.get("host")
+    if not tls:
+        return host, port, None
+    if not sni:
+        try:
+            ipaddress.ip_address(host)
+            sni = ""  # IP без SNI - рукопожатие без server_name
+        except ValueError:
+            sni = host
+    return host, port, str(sni).split(",")[0]
+
+def _load_probe_cache() -> dict:
+    if not PROBE_CACHE_FILE:
+        return {}
+    try:
+        with open(PROBE_CACHE_FILE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {endpoint: entry for endpoint, entry in cache.items() if entry.get("expires", 0) > now}
+
+def _save_probe_cache(cache: dict):
+    if not PROBE_CACHE_FILE:
+        return
+    try:
+        os.makedirs(os.path.dirname(PROBE_CACHE_FILE) or ".", exist_ok=True)
+        with open(PROBE_CACHE_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(PROBE_CACHE_FILE + ".tmp", PROBE_CACHE_FILE)
+    except OSError as e:
+        log(f"⚠️  Не удалось сохранить кэш проверок: {str(e)[:100]}")
+
+def _tls_context() -> ssl.SSLContext:
+    # Проверяется лишь, что сервер завершает рукопожатие: reality и самоподписанные
+    # сертификаты - норма для этих серверов
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+async def _probe_one(host: str, port: int, sni: str | None, context: ssl.SSLContext) -> float | None:
+    """Время подключения (и рукопожатия TLS) в миллисекундах; None - сервер недоступен"""
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port,
+                ssl=context if sni is not None else None,
+                server_hostname=sni if sni else None,
+            ),
+            timeout=PROBE_TIMEOUT,
+        )
+    except (OSError, ssl.SSLError, asyncio.TimeoutError, UnicodeError, ValueError):
+        return None
+    latency = (time.perf_counter() - started) * 1000
+    writer.close()
+    try:
+        await asyncio.wait_for(writer.wait_closed(), timeout=1)
+    except (OSError, ssl.SSLError, asyncio.TimeoutError):
+        pass
+    return latency
+
+async def _probe_many(targets: dict[str, tuple[str, int, str | None]]) -> dict[str, float | None]:
+    """Проверяет адреса с ограничением параллельности; не успевшие к дедлайну в ответ не попадают"""
+    limit = asyncio.Semaphore(PROBE_CONCURRENCY)
+    context = _tls_context()
+    results = {}
+
+    async def probe(endpoint: str, target: tuple[str, int, str | None]):
+        async with limit:
+            results[endpoint] = await _probe_one(*target, context)
+
+    tasks = [asyncio.create_task(probe(endpoint, target)) for endpoint, target in targets.items()]
+    _, pending = await asyncio.wait(tasks, timeout=PROBE_DEADLINE)
+    for task in pending:
+        task.cancel()
+    if pending:
+        log(f"⏱️ Дедлайн проверки {PROBE_DEADLINE:.0f} с: не проверено {len(pending)} адресов")
+        await asyncio.gather(*pending, return_exceptions=True)
+    return results
+
+def probe_endpoints(configs: list[ParsedConfig]) -> dict[str, float | None]:
+    """Задержки уникальных адресов конфигов: "host:port" -> мс или None (недоступен)
+
+    Адреса без результата (UDP-протоколы, не успевшие к дедлайну) в ответ не попадают.
+    """
+    targets = {}
+    for parsed in configs:
+        target = probe_target(parsed)
+        if target is None:
+            PROBE_STATS["skipped"] += 1
+            continue
+        targets.setdefault(f"{target[0]}:{target[1]}", target)
+    PROBE_STATS["endpoints"] += len(targets)
+
+    cache = _load_probe_cache()
+    results = {endpoint: cache[endpoint]["latency"] for endpoint in targets if endpoint in cache}
+    stale = {endpoint: target for endpoint, target in targets.items() if endpoint not in cache}
+    PROBE_STATS["cached"] += len(results)
+    PROBE_STATS["probed"] += len(stale)
+
+    if stale:
+        probed = asyncio.run(_probe_many(stale))
+        now = time.time()
+        for endpoint, latency in probed.items():
+            ttl = PROBE_TTL if latency is not None else PROBE_DEAD_TTL
+            cache[endpoint] = {"latency": None if latency is None else round(latency, 1), "expires": now + ttl}
+            results[endpoint] = cache[endpoint]["latency"]
+        _save_probe_cache(cache)
+    PROBE_STATS["alive"] += sum(1 for latency in results.values() if latency is not None)
+    PROBE_STATS["dead"] += sum(1 for latency in results.values() if latency is None)
+    return results
+
+def rank_configs(configs: list[ParsedConfig], latencies: dict[str, float | None]) -> list[ParsedConfig]:
+    """Упорядочивает конфиги: доступные по задержке, затем непроверенные, затем недоступные
+
+    Внутри одной корзины задержки сохраняется исходный порядок (сортировка устойчива).
+    """
+    bucket_ms = max(1, PROBE_LATENCY_BUCKET_MS)
+
+    def rank(parsed: ParsedConfig) -> tuple[int, float]:
+        target = probe_target(parsed)
+        endpoint = f"{target[0]}:{target[1]}" if target else None
+        if endpoint not in latencies:
+            return 1, 0
+        latency = latencies[endpoint]
+        if latency is None:
+            # keep - недоступные остаются среди непроверенных
+            return (1 if PROBE_DEAD_ACTION == "keep" else 2), 0
+        return 0, latency // bucket_ms
+
+    ranks = [rank(parsed) for parsed in configs]
+    order = sorted(range(len(configs)), key=ranks.__getitem__)
+    if PROBE_DEAD_ACTION == "drop":
+        return [configs[index] for index in order if ranks[index][0] != 2]
+    return [configs[index] for index in order]
+
+def rank_by_probe(unique_configs: list[ParsedConfig],
+                  whitelist_configs: list[ParsedConfig]) -> tuple[list[ParsedConfig], list[ParsedConfig]]:
+    """Проверяет серверы merged (whitelist - его подмножество) и упорядочивает оба списка"""
+    latencies = probe_endpoints(unique_configs)
+    ranked_unique = rank_configs(unique_configs, latencies)
+    ranked_whitelist = rank_configs(whitelist_configs, latencies)
+    action = {"demote": "опущены в конец", "drop": "отброшены", "keep": "оставлены среди непроверенных"}.get(
+        PROBE_DEAD_ACTION, PROBE_DEAD_ACTION
+    )
+    log(f"📡 Проверка серверов: {PROBE_STATS['endpoints']} адресов (кэш {PROBE_STATS['cached']}, "
+        f"проверено {PROBE_STATS['probed']}), доступно {PROBE_STATS['alive']}, "
+        f"недоступно {PROBE_STATS['dead']} - {action}; без проверки (UDP и т.п.) {PROBE_STATS['skipped']} конфигов")
+    return ranked_unique, ranked_whitelist
@@ -0,0 +1,803 @@
+"""
+Публикация результатов: GitHub, Cloud.ru (S3) и GitVerse.
+Клиенты всех направлений создаются при первом обращении, а не при импорте.
+"""
+
+from collections.abc import Callable, Iterable
+from datetime import datetime
+import urllib.parse
+import threading
+import requests
+import hashlib
+import gzip
+import base64
+import json
+import time
+import os
+
+from common import PATHS, URLS, log, run_timestamp
+from compression import ENCODING_CONTENT_TYPES, compressed_variants
+from delta import DELTA_FILE, DELTA_OUTPUTS
+from metrics import record_stage
+from shards import SHARD_OUTPUTS, shard_publish_files
+from whitelist import WHITELIST_SUBNETS
+
+GITHUB_TOKEN = os.environ.get("MY_TOKEN", "")
+REPO_NAME = os.environ.get("GITHUB_REPOSITORY", "bywarm/wlrusparser")
+
+# Cloud.ru S3 конфигурация
+CLOUD_RU_ENDPOINT = os.environ.get("CLOUD_RU_ENDPOINT", "https://s3.cloud.ru/bucket-93b250")
+CLOUD_RU_ACCESS_KEY = os.environ.get("CLOUD_RU_ACCESS_KEY", "28a54be8-b238-4edf-8079-7cee88d2ab3c:d103f9e8c17b5d760f0d713ca4af063c")
+CLOUD_RU_SECRET_KEY = os.environ.get("CLOUD_RU_SECRET_KEY", "")
+CLOUD_RU_BUCKET = os.environ.get("CLOUD_RU_BUCKET", "bucket-93b250")
+CLOUD_RU_REGION = os.environ.get("CLOUD_RU_REGION", "ru-central-1")
+# Загружать объекты сжатыми gzip с Content-Encoding: gzip
+CLOUD_RU_GZIP = os.environ.get("CLOUD_RU_GZIP", "0") == "1"
+
+# GitVerse API конфигурация (только токен в секретах)
+GITVERSE_TOKEN = os.environ.get("GITVERSE_TOKEN", "")
+
+# Остальные параметры GitVerse заданы явно в коде
+if GITVERSE_TOKEN:
+    # Настройки по умолчанию - замените на ваши
+    GITVERSE_ENDPOINT = "https://api.gitverse.ru"  # Основной endpoint согласно документации
+    GITVERSE_REPO_OWNER = "bywarm"  # ВАШ логин на GitVerse
+    GITVERSE_REPO_NAME = "rser"  # ВАШ репозиторий
+    GITVERSE_BRANCH = "master"
+else:
+    # Если токен не задан, параметры не важны
+    GITVERSE_ENDPOINT = ""
+    GITVERSE_REPO_OWNER = ""
+    GITVERSE_REPO_NAME = ""
+    GITVERSE_BRANCH = ""
+
+_github_repo = None
+_github_repo_loaded = False
+_github_repo_lock = threading.Lock()
+
+def get_github_repo():
+    """Репозиторий GitHub; клиент создаётся при первом обращении (None - нет подключения)"""
+    global _github_repo, _github_repo_loaded
+    with _github_repo_lock:
+        if not _github_repo_loaded:
+            _github_repo_loaded = True
+            try:
+                from github import Github, Auth
+                g = Github(auth=Auth.Token(GITHUB_TOKEN)) if GITHUB_TOKEN else Github()
+                _github_repo = g.get_repo(REPO_NAME)
+            except Exception as e:
+                log("Ошибка подключения к GitHub: " + str(e)[:100])
+        return _github_repo
+
+def __getattr__(name: str):
+    # REPO оставлен для совместимости: подключение к GitHub только при обращении
+    if name == "REPO":
+        return get_github_repo()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def read_text_for_upload(filename: str) -> str:
+    """Читает файл для загрузки, подбирая кодировку"""
+    # Читаем файл в бинарном режиме, затем декодируем
+    with open(filename, "rb") as f:
+        binary_content = f.read()
+    
+    # Декодируем содержимое с обработкой ошибок
+    try:
+        content = binary_content.decode("utf-8")
+    except UnicodeDecodeError:
+        # Если не удается декодировать как UTF-8, пробуем другие кодировки
+        log(f"⚠️  Ошибка декодирования UTF-8 в файле {filename}, пробую другие кодировки...")
+        try:
+            content = binary_content.decode("utf-8-sig")  # UTF-8 с BOM
+        except UnicodeDecodeError:
+            try:
+                content = binary_content.decode("cp1251")  # Windows-1251
+            except UnicodeDecodeError:
+                try:
+                    content = binary_content.decode("latin-1")  # Latin-1
+                except UnicodeDecodeError:
+                    # В крайнем случае игнорируем ошибки
+                    content = binary_content.decode("utf-8", errors="replace")
+                    log(f"⚠️  Использована замена некорректных символов в файле {filename}")
+    return content
+
+def upload_to_github(filename: str, remote_path: str = None, branch: str = "main"):
+    """Загружает файл на GitHub в указанную ветку"""
+    repo = get_github_repo()
+    if not repo:
+        log("Пропускаю загрузку на GitHub (нет подключения)")
+        return
+    from github import GithubException
+    
+    if not os.path.exists(filename):
+        log(f"Файл {filename} не найден для загрузки")
+        return
+    
+    try:
+        content = read_text_for_upload(filename)
+        
+        if remote_path is None:
+            remote_path = filename
+        
+        try:
+            file_in_repo = repo.get_contents(remote_path, ref=branch)
+            current_sha = file_in_repo.sha
+            
+            remote_content = file_in_repo.decoded_content.decode("utf-8", errors="replace")
+            if remote_content == content:
+                log(f"Файл {remote_path} не изменился в ветке {branch}")
+                return
+            
+            repo.update_file(
+                path=remote_path,
+                message="🤖 Авто-обновление: " + run_timestamp(),
+                content=content,
+                sha=current_sha,
+                branch=branch
+            )
+            log(f"⬆️ Файл {remote_path} обновлён на GitHub в ветке {branch}")
+            
+        except GithubException as e:
+            if e.status == 404:
+                repo.create_file(
+                    path=remote_path,
+                    message="🤖 Первое создание: " + run_timestamp(),
+                    content=content,
+                    branch=branch
+                )
+                log(f"🆕 Файл {remote_path} создан на GitHub в ветке {branch}")
+            else:
+                error_msg = e.data.get('message', str(e))
+                log("Ошибка GitHub: " + error_msg)
+                
+    except Exception as e:
+        log("Ошибка при загрузке на GitHub: " + str(e))
+
+def build_readme(total_configs: int, wl_configs_count: int) -> str:
+    """Формирует содержимое README.md со статистикой"""
+    # Формируем ссылки на файлы
+    raw_url_merged = "https://github.com/" + REPO_NAME + "/raw/main/merged.txt"
+    raw_url_wl = "https://github.com/" + REPO_NAME + "/raw/main/githubmirror/wl.txt"
+    raw_url_selected = "https://github.com/" + REPO_NAME + "/raw/main/githubmirror/selected.txt"
+    
+    # Разделяем время и дату
+    time_parts = run_timestamp().split(" | ")
+    time_part = time_parts[0] if len(time_parts) > 0 else ""
+    date_part = time_parts[1] if len(time_parts) > 1 else ""
+    
+    new_section = "\n## 📊 Статус обновления\n\n"
+    new_section += "| Файл | Описание | Конфигов | Время обновления | Дата |\n"
+    new_section += "|------|----------|----------|------------------|------|\n"
+    new_section += f"| [`merged.txt`]({raw_url_merged}) | Все конфиги из {len(URLS)} источников | {total_configs} | {time_part} | {date_part} |\n"
+    new_section += f"| [`wl.txt`]({raw_url_wl}) | Только конфиги из {len(WHITELIST_SUBNETS)} подсетей | {wl_configs_count} | {time_part} | {date_part} |\n"
+    new_section += f"| [`selected.txt`]({raw_url_selected}) | Отборные админами конфиги, самый надежный список | не знаю | {time_part} | {date_part} |\n\n"
+    return new_section
+
+def commit_to_github(files: dict[str, str], message: str, branch: str = "main", attempts: int = 2) -> bool:
+    """Публикует несколько файлов одним коммитом через Git Data API
+
+    files - удалённый путь -> содержимое. Дерево строится поверх текущего коммита ветки,
+    поэтому снимок обновляется атомарно: 5 запросов к API на весь набор файлов.
+    Возвращает True, если коммит создан или изменений нет.
+    """
+    repo = get_github_repo()
+    if not repo:
+        log("Пропускаю загрузку на GitHub (нет подключения)")
+        return False
+    from github import GithubException, InputGitTreeElement
+    if not files:
+        return True
+    
+    for attempt in range(1, attempts + 1):
+        try:
+            ref = repo.get_git_ref(f"heads/{branch}")
+            base_commit = repo.get_git_commit(ref.object.sha)
+            elements = [
+                InputGitTreeElement(path=path, mode="100644", type="blob", content=content)
+                for path, content in files.items()
+            ]
+            tree = repo.create_git_tree(elements, base_commit.tree)
+            if tree.sha == base_commit.tree.sha:
+                log(f"Файлы не изменились в ветке {branch}")
+                return True
+            commit = repo.create_git_commit(message, tree, [base_commit])
+            # Без force: если ветку успели сдвинуть, ref не перезапишется и попытка повторится
+            ref.edit(commit.sha)
+            log(f"⬆️ Одним коммитом {commit.sha[:7]} обновлено на GitHub: {', '.join(files)}")
+            return True
+        except GithubException as e:
+            error_msg = e.data.get('message', str(e)) if isinstance(e.data, dict) else str(e)
+            if attempt < attempts and e.status in (409, 422):
+                log(f"⚠️  Ветка {branch} изменилась во время публикации, повторяю...")
+                continue
+            log("Ошибка GitHub: " + error_msg)
+            return False
+        except Exception as e:
+            log("Ошибка при загрузке на GitHub: " + str(e))
+            return False
+    return False
+
+def update_readme(total_configs: int, wl_configs_count: int):
+    """Обновляет README.md со статистикой"""
+    repo = get_github_repo()
+    if not repo:
+        log("Пропускаю обновление README (нет подключения)")
+        return
+    from github import GithubException
+    
+    try:
+        try:
+            readme_file = repo.get_contents("README.md")
+            old_content = readme_file.decoded_content.decode("utf-8")
+        except GithubException:
+            old_content = "# Объединенные конфиги VPN\n\n"
+        
+        new_section = build_readme(total_configs, wl_configs_count)
+        
+        # Обновляем файл
+        sha = readme_file.sha if 'readme_file' in locals() else None
+        repo.update_file(
+            path="README.md",
+            message="📝 Обновление README: " + str(total_configs) + " конфигов, " + str(wl_configs_count) + " в whitelist",
+            content=new_section,
+            sha=sha
+        )
+        log("📝 README.md обновлён")
+        
+    except Exception as e:
+        log("Ошибка обновления README: " + str(e))
+
+class S3Publisher:
+    """Загрузчик в S3-совместимое хранилище с одним клиентом на запуск
+
+    Перед загрузкой сверяет хэш объекта (метаданные sha256 или ETag = MD5 тела)
+    и пропускает PUT, если объект уже совпадает. С gzip=True тело сжимается
+    детерминированно (без mtime), поэтому ETag сжатой версии тоже стабилен.
+    Клиент можно передать явно, например для проверки на локальной замене S3.
+    """
+
+    def __init__(self, endpoint: str, access_key: str, secret_key: str, bucket: str,
+                 region: str, use_gzip: bool = False, client=None):
+        self.endpoint = endpoint
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.bucket = bucket
+        self.region = region
+        self.use_gzip = use_gzip
+        self.stats = {"uploaded": 0, "skipped": 0, "bytes_raw": 0, "bytes_sent": 0}
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Клиент S3, создаётся при первом обращении (ImportError, если нет boto3)"""
+        with self._lock:
+            if self._client is None:
+                import boto3
+                from botocore.config import Config
+                self._client = boto3.client(
+                    's3',
+                    endpoint_url=self.endpoint,
+                    aws_access_key_id=self.access_key,
+                    aws_secret_access_key=self.secret_key,
+                    region_name=self.region,
+                    config=Config(
+                        signature_version='s3v4',
+                        s3={'addressing_style': 'path'},
+                        max_pool_connections=max(1, PUBLISH_WORKERS),
+                    )
+                )
+            return self._client
+
+    def _is_current(self, key: str, content_sha256: str, body_md5: str, encoding: str, content_type: str) -> bool:
+        """Проверяет по HEAD, что в bucket уже лежит тот же объект"""
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            status = getattr(e, "response", {}).get("ResponseMetadata", {}).get("HTTPStatusCode")
+            if status not in (404, 403, None):
+                log(f"⚠️  Не удалось проверить {key} в Cloud.ru: {str(e)[:100]}")
+            return False
+        if head.get("ContentEncoding", "") != encoding:
+            return False
+        # Параметры типа (charset) хранилище может переписать - сравниваем только сам тип
+        if head.get("ContentType", "").split(";")[0].strip().lower() != content_type.split(";")[0]:
+            return False
+        if head.get("Metadata", {}).get("sha256") == content_sha256:
+            return True
+        return head.get("ETag", "").strip('"') == body_md5
+
+    def upload(self, file_path: str, key: str, content_type: str = "") -> bool:
+        """Загружает файл под именем key; False - объект в bucket уже совпадал
+
+        content_type - тип уже сжатой копии (merged.txt.gz -> application/gzip): тело
+        загружается как есть и без Content-Encoding, чтобы клиенты не распаковывали его
+        на лету и скачивали именно архив.
+        """
+        with open(file_path, "rb") as f:
+            data = f.read()
+        content_sha256 = hashlib.sha256(data).hexdigest()
+        body = data
+        encoding = ""
+        if not content_type and self.use_gzip:
+            encoding = "gzip"
+            # Сжатая копия, записанная вместе с файлом, избавляет от повторного сжатия
+            precompressed = compressed_variants(file_path).get("gzip")
+            if precompressed:
+                with open(precompressed, "rb") as f:
+                    body = f.read()
+            else:
+                body = gzip.compress(data, compresslevel=9, mtime=0)
+        body_md5 = hashlib.md5(body).digest()
+        content_type = content_type or 'text/plain; charset=utf-8'
+
+        if self._is_current(key, content_sha256, body_md5.hex(), encoding, content_type):
+            self.stats["skipped"] += 1
+            return False
+
+        extra = {"ContentEncoding": encoding} if encoding else {}
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=body,
+            ContentType=content_type,
+            ContentMD5=base64.b64encode(body_md5).decode("ascii"),
+            Metadata={"sha256": content_sha256},
+            **extra,
+        )
+        self.stats["uploaded"] += 1
+        self.stats["bytes_raw"] += len(data)
+        self.stats["bytes_sent"] += len(body)
+        if encoding and body is not data:
+            log(f"🗜️  {key}: {len(data)} → {len(body)} байт ({encoding})")
+        return True
+
+_s3_publisher = None
+_s3_publisher_lock = threading.Lock()
+
+def get_s3_publisher() -> S3Publisher:
+    """Общий на весь запуск загрузчик в Cloud.ru"""
+    global _s3_publisher
+    with _s3_publisher_lock:
+        if _s3_publisher is None:
+            _s3_publisher = S3Publisher(
+                CLOUD_RU_ENDPOINT, CLOUD_RU_ACCESS_KEY, CLOUD_RU_SECRET_KEY,
+                CLOUD_RU_BUCKET, CLOUD_RU_REGION, use_gzip=CLOUD_RU_GZIP,
+            )
+        return _s3_publisher
+
+def upload_to_cloud_ru(file_path: str, s3_path: str = None, content_type: str = "") -> bool:
+    """Загружает файл в bucket Cloud.ru по S3 API, возвращает признак успеха
+
+    content_type - тип уже сжатой копии (application/gzip и т.п.), загружаемой как есть.
+    """
+    if not all([CLOUD_RU_ENDPOINT, CLOUD_RU_ACCESS_KEY, CLOUD_RU_SECRET_KEY, CLOUD_RU_BUCKET]):
+        log("❌ Пропускаю загрузку в Cloud.ru: отсутствуют необходимые переменные окружения")
+        return False
+    
+    if not os.path.exists(file_path):
+        log(f"❌ Файл {file_path} не найден для загрузки в Cloud.ru")
+        return False
+    
+    try:
+        # Определяем имя файла в bucket
+        if s3_path is None:
+            s3_path = os.path.basename(file_path)
+        
+        log(f"☁️  Загружаю {file_path} в Cloud.ru bucket {CLOUD_RU_BUCKET} как {s3_path}")
+        
+        if get_s3_publisher().upload(file_path, s3_path, content_type):
+            log(f"✅ Файл успешно загружен в Cloud.ru: {s3_path}")
+        else:
+            log(f"⏭️  {s3_path} в Cloud.ru уже актуален, загрузка не нужна")
+        
+        # Формируем ссылку на файл
+        file_url = f"{CLOUD_RU_ENDPOINT}/{CLOUD_RU_BUCKET}/{s3_path}"
+        log(f"🔗 Ссылка на файл: {file_url}")
+        return True
+        
+    except ImportError:
+        log("❌ Модуль boto3 не установлен. Установите: pip install boto3")
+        return False
+    except Exception as e:
+        error_msg = str(e)
+        # Более подробное логирование ошибки
+        if "AuthorizationHeaderMalformed" in error_msg:
+            log(f"❌ Ошибка авторизации Cloud.ru: неверный регион или endpoint. Убедитесь, что регион: {CLOUD_RU_REGION}")
+        else:
+            log(f"❌ Ошибка при загрузке в Cloud.ru: {error_msg[:200]}")
+        return False
+        
+class GitVerseClient:
+    """Клиент API GitVerse на один запуск
+
+    Аутентификация и выбор версии API выполняются один раз, все запросы идут через
+    одну keep-alive сессию. Файлы загружаются одним коммитом (POST /contents),
+    а если сервер его не поддерживает - по одному через PUT.
+    """
+
+    def __init__(self, token: str, owner: str, repo: str, branch: str = "",
+                 base_url: str = "https://api.gitverse.ru", session: requests.Session = None):
+        self.owner = owner
+        self.repo = repo
+        self.branch = branch
+        self.base_url = base_url.rstrip("/")
+        self.session = session or requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.gitverse.object+json;version=1",
+            "Content-Type": "application/json",
+        })
+        self._ready = None  # None - ещё не проверяли, True/False - результат проверки
+        self._batch = True  # Сервер поддерживает коммит нескольких файлов
+        self._lock = threading.Lock()
+
+    @property
+    def api_version(self) -> str:
+        return self.session.headers["Accept"].split("version=")[1]
+
+    def _request(self, method: str, path: str, timeout: float = 15, **kwargs) -> requests.Response:
+        response = self.session.request(method, f"{self.base_url}{path}", timeout=timeout, **kwargs)
+        # Проверяем, не устарела ли используемая версия API
+        if response.headers.get('Gitverse-Api-Deprecation') == 'true':
+            latest = response.headers.get('Gitverse-Api-Latest-Version')
+            decommission = response.headers.get('Gitverse-Api-Decommissioning')
+            log(f"⚠️  ВНИМАНИЕ: Используемая версия API устарела!")
+            log(f"    Актуальная версия: {latest}")
+            log(f"    Отключение: {decommission}")
+        return response
+
+    def connect(self) -> bool:
+        """Проверяет доступ и согласует версию API (один раз за запуск)"""
+        with self._lock:
+            if self._ready is None:
+                self._ready = self._negotiate()
+            return self._ready
+
+    def _negotiate(self) -> bool:
+        log(f"🔍 Проверяю доступ к API GitVerse...")
+        try:
+            response = self._request("GET", "/user", timeout=10)
+            # Если получили 400, возможно, версия устарела
+            if response.status_code == 400:
+                latest_version = response.headers.get('Gitverse-Api-Latest-Version')
+                if latest_version:
+                    log(f"⚠️  Версия {self.api_version} устарела. Актуальная версия: {latest_version}")
+                    self.session.headers["Accept"] = f"application/vnd.gitverse.object+json;version={latest_version}"
+                    response = self._request("GET", "/user", timeout=10)
+        except requests.exceptions.RequestException as e:
+            log(f"❌ Ошибка подключения: {str(e)[:100]}")
+            return False
+
+        if response.status_code == 200:
+            log(f"✅ Аутентифицирован как: {response.json().get('login', 'Unknown')}")
+            log(f"✅ Версия API: {self.api_version}")
+        elif response.status_code in [401, 403]:
+            log(f"❌ Ошибка доступа ({response.status_code}). Проверьте токен.")
+            return False
+        else:
+            log(f"⚠️  Неожиданный ответ от API: {response.status_code}")
+        return True
+
+    def _contents_path(self, path: str = "") -> str:
+        return f"/repos/{self.owner}/{self.repo}/contents/{urllib.parse.quote(path)}".rstrip("/")
+
+    def file_shas(self, paths: Iterable[str]) -> dict[str, str]:
+        """SHA существующих файлов: один листинг на каталог вместо запроса на файл"""
+        params = {'ref': self.branch} if self.branch else {}
+        shas = {}
+        for directory in sorted({os.path.dirname(path) for path in paths}):
+            try:
+                response = self._request("GET", self._contents_path(directory), timeout=10, params=params)
+            except requests.exceptions.RequestException:
+                continue  # Без SHA файл будет создан; при конфликте сервер вернёт ошибку
+            if response.status_code != 200:
+                if response.status_code != 404:
+                    log(f"⚠️  Не удалось получить список файлов '{directory or '/'}' ({response.status_code})")
+                continue
+            entries = response.json()
+            for entry in entries if isinstance(entries, list) else [entries]:
+                if entry.get("type", "file") == "file" and entry.get("path"):
+                    shas[entry["path"]] = entry.get("sha", "")
+        return shas
+
+    def _log_error(self, response: requests.Response):
+        if response.status_code == 400:
+            log(f"❌ Ошибка 400: {response.text[:200]}")
+            # Если в ответе есть указание на последнюю версию
+            latest_in_response = response.headers.get('Gitverse-Api-Latest-Version')
+            if latest_in_response and latest_in_response != self.api_version:
+                log(f"🔄 Обнаружена новая актуальная версия: {latest_in_response}")
+        elif response.status_code == 403:
+            log(f"❌ Ошибка 403: Доступ запрещён")
+            log(f"   Проверьте:")
+            log(f"   1. Существует ли репозиторий '{self.owner}/{self.repo}'")
+            log(f"   2. Имеет ли токен права на запись (scope 'repo' или 'write:repo')")
+            log(f"   Полный ответ: {response.text[:300]}")
+        elif response.status_code == 409:
+            log(f"❌ Конфликт: SHA файла изменился. Обновите локальный SHA.")
+        else:
+            log(f"❌ Ошибка {response.status_code}: {response.text[:200]}")
+
+    def _commit_batch(self, files: dict[str, str], shas: dict[str, str], message: str) -> "bool | None":
+        """Один коммит на все файлы; None - сервер не поддерживает или не принимает такой запрос"""
+        data = {
+            "message": message,
+            "files": [
+                {
+                    "operation": "update" if shas.get(path) else "create",
+                    "path": path,
+                    "content": base64.b64encode(content.encode('utf-8')).decode('utf-8'),
+                    **({"sha": shas[path]} if shas.get(path) else {}),
+                }
+                for path, content in files.items()
+            ],
+        }
+        if self.branch:
+            data["branch"] = self.branch
+        response = self._request("POST", self._contents_path(), json=data)
+        if response.status_code in [200, 201]:
+            log(f"✅ Одним коммитом обновлено на GitVerse: {', '.join(files)}")
+            return True
+        if response.status_code in [404, 405, 501]:
+            return None
+        if response.status_code in [400, 422]:
+            # Эндпоинт есть, но формат пакетного коммита не принят - загрузка по одному файлу
+            log(f"ℹ️  GitVerse отклонил коммит нескольких файлов ({response.status_code}): {response.text[:200]}")
+            return None
+        self._log_error(response)
+        return False
+
+    def _put_file(self, path: str, content: str, sha: str, message: str) -> bool:
+        data = {
+            "message": message,
+            "content": base64.b64encode(content.encode('utf-8')).decode('utf-8'),
+        }
+        if self.branch:
+            data["branch"] = self.branch
+        if sha:
+            data["sha"] = sha  # Обязательно для обновления существующего файла
+        log(f"📤 {'Обновляю' if sha else 'Создаю'} файл '{path}'...")
+        response = self._request("PUT", self._contents_path(path), json=data)
+        if response.status_code in [200, 201]:
+            log(f"✅ Файл успешно {'обновлён' if sha else 'создан'}!")
+            return True
+        self._log_error(response)
+        return False
+
+    def commit_files(self, files: dict[str, str], message: str = None) -> set[str]:
+        """Загружает файлы (удалённый путь -> текст), возвращает успешно загруженные пути"""
+        if not files or not self.connect():
+            return set()
+        message = message or f"🤖 Авто-обновление: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        try:
+            shas = self.file_shas(files)
+            if self._batch and len(files) > 1:
+                result = self._commit_batch(files, shas, message)
+                if result is not None:
+                    return set(files) if result else set()
+                log("ℹ️  GitVerse не поддерживает коммит нескольких файлов, загружаю по одному")
+                self._batch = False
+            return {path for path, content in files.items() if self._put_file(path, content, shas.get(path, ""), message)}
+        except requests.exceptions.RequestException as e:
+            log(f"❌ Сетевая ошибка: {str(e)[:100]}")
+        except Exception as e:
+            log(f"❌ Общая ошибка: {str(e)}")
+        return set()
+
+_gitverse_client = None
+_gitverse_client_lock = threading.Lock()
+
+def get_gitverse_client() -> GitVerseClient:
+    """Общий на весь запуск клиент GitVerse"""
+    global _gitverse_client
+    with _gitverse_client_lock:
+        if _gitverse_client is None:
+            _gitverse_client = GitVerseClient(
+                GITVERSE_TOKEN, GITVERSE_REPO_OWNER, GITVERSE_REPO_NAME, GITVERSE_BRANCH,
+                base_url=GITVERSE_ENDPOINT or "https://api.gitverse.ru",
+            )
+        return _gitverse_client
+
+def upload_to_gitverse(filename: str, remote_path: str = None) -> bool:
+    """Загружает файл на GitVerse через API с корректным версионированием, возвращает признак успеха"""
+    if not GITVERSE_TOKEN:
+        log("❌ Пропускаю загрузку на GitVerse: отсутствует токен")
+        return False
+    
+    if not os.path.exists(filename):
+        log(f"❌ Файл {filename} не найден для загрузки на GitVerse")
+        return False
+    
+    remote_path = remote_path or os.path.basename(filename)
+    with open(filename, "r", encoding="utf-8") as f:
+        content = f.read()
+    return remote_path in get_gitverse_client().commit_files({remote_path: content})
+    
+# Параллельная публикация: число одновременных направлений и общий дедлайн, секунды
+PUBLISH_WORKERS = int(os.environ.get("PUBLISH_WORKERS", "3"))
+PUBLISH_DEADLINE = float(os.environ.get("PUBLISH_DEADLINE", "300"))
+
+# Манифест публикации: хэш содержимого каждого файла, уже опубликованного в каждое направление
+PUBLISH_MANIFEST_FILE = os.environ.get("PUBLISH_MANIFEST_FILE", ".cache/publish_manifest.json")
+PUBLISH_FORCE = os.environ.get("PUBLISH_FORCE", "0") == "1"
+# Строки заголовка, меняющиеся каждый запуск без изменения самих конфигов
+VOLATILE_HEADER_PREFIXES = ("# Обновлено:".encode("utf-8"),)
+
+_publish_manifest = None
+_publish_manifest_lock = threading.Lock()
+
+def output_digest(file_path: str) -> str:
+    """SHA-256 содержимого файла без изменчивых строк заголовка"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for line in f:
+            if not line.startswith(VOLATILE_HEADER_PREFIXES):
+                digest.update(line)
+    return digest.hexdigest()
+
+def load_publish_manifest() -> dict:
+    """Читает манифест публикации (один раз за запуск)"""
+    global _publish_manifest
+    with _publish_manifest_lock:
+        if _publish_manifest is None:
+            _publish_manifest = {}
+            if PUBLISH_MANIFEST_FILE:
+                try:
+                    with open(PUBLISH_MANIFEST_FILE, "r", encoding="utf-8") as f:
+                        manifest = json.load(f)
+                    if isinstance(manifest, dict):
+                        _publish_manifest = manifest
+                except (OSError, ValueError):
+                    pass
+        return _publish_manifest
+
+def save_publish_manifest():
+    """Сохраняет манифест публикации"""
+    if not PUBLISH_MANIFEST_FILE or _publish_manifest is None:
+        return
+    with _publish_manifest_lock:
+        try:
+            os.makedirs(os.path.dirname(PUBLISH_MANIFEST_FILE) or ".", exist_ok=True)
+            with open(PUBLISH_MANIFEST_FILE + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(_publish_manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(PUBLISH_MANIFEST_FILE + ".tmp", PUBLISH_MANIFEST_FILE)
+        except OSError as e:
+            log(f"⚠️  Не удалось сохранить манифест публикации: {str(e)[:100]}")
+
+def changed_publish_files(destination: str, files: dict[str, str]) -> dict[str, tuple[str, str]]:
+    """Отбирает файлы, содержимое которых изменилось с последней публикации в направление
+
+    Принимает удалённое имя -> локальный путь, возвращает удалённое имя -> (локальный путь, хэш).
+    Отсутствующие локально файлы пропускаются; PUBLISH_FORCE=1 отключает сравнение.
+    """
+    published = load_publish_manifest().get(destination, {})
+    changed = {}
+    unchanged = 0
+    for remote_path, local_path in files.items():
+        if not os.path.exists(local_path):
+            log(f"⚠️  Файл {local_path} не найден, пропускаю загрузку в {destination}")
+            continue
+        digest = output_digest(local_path)
+        if PUBLISH_FORCE or published.get(remote_path) != digest:
+            changed[remote_path] = (local_path, digest)
+        else:
+            unchanged += 1
+    if unchanged:
+        log(f"⏭️  {destination}: без изменений {unchanged} из {len(files)} файлов, пропускаю их")
+    return changed
+
+def mark_published(destination: str, remote_path: str, digest: str):
+    """Запоминает хэш успешно опубликованного файла"""
+    load_publish_manifest()
+    with _publish_manifest_lock:
+        _publish_manifest.setdefault(destination, {})[remote_path] = digest
+
+def get_publish_files() -> dict[str, str]:
+    """Файлы для публикации: удалённое имя -> локальный путь"""
+    files = {
+        "merged.txt": PATHS["merged"],
+        "wl.txt": PATHS["wl"],
+        "selected.txt": PATHS["selected"],
+    }
+    if DELTA_OUTPUTS:
+        files[DELTA_FILE] = os.path.join(PATHS["base_dir"], DELTA_FILE)
+    if SHARD_OUTPUTS:
+        # Манифест публикации отсеет шарды, хэш которых не изменился
+        files.update(shard_publish_files())
+    return files
+
+def publish_to_github(total_configs: int, wl_configs_count: int):
+    """Загружает изменившиеся файлы и README на GitHub одним коммитом
+
+    Если ни один файл не изменился, к GitHub не обращаемся вовсе.
+    """
+    changed = changed_publish_files("GitHub", {path: path for path in get_publish_files().values()})
+    if not changed:
+        log("⏭️  GitHub: файлы не изменились, коммит не нужен")
+        return
+    log("🌐 Загрузка на GitHub...")
+    files = {path: read_text_for_upload(local_path) for path, (local_path, _) in changed.items()}
+    files["README.md"] = build_readme(total_configs, wl_configs_count)
+    if commit_to_github(
+        files,
+        "🤖 Авто-обновление: " + run_timestamp() + " | " + str(total_configs) + " конфигов, "
+        + str(wl_configs_count) + " в whitelist",
+    ):
+        for path, (_, digest) in changed.items():
+            mark_published("GitHub", path, digest)
+
+def publish_to_cloud_ru():
+    """Загружает изменившиеся файлы в Cloud.ru"""
+    changed = changed_publish_files("Cloud.ru", get_publish_files())
+    if not changed:
+        return
+    log("☁️  Начинаю загрузку в Cloud.ru...")
+    for s3_name, (local_path, digest) in changed.items():
+        # Сжатые копии (merged.txt.gz и т.п.) следуют за своим файлом как архивы своего типа
+        uploaded = upload_to_cloud_ru(local_path, s3_name)
+        for encoding, variant_path in compressed_variants(local_path).items():
+            suffix = variant_path[len(local_path):]
+            uploaded = upload_to_cloud_ru(
+                variant_path, s3_name + suffix, ENCODING_CONTENT_TYPES[encoding]
+            ) and uploaded
+        if uploaded:
+            mark_published("Cloud.ru", s3_name, digest)
+    stats = get_s3_publisher().stats
+    log(f"☁️  Cloud.ru: загружено {stats['uploaded']}, уже актуальных {stats['skipped']}, "
+        f"отправлено {stats['bytes_sent']} из {stats['bytes_raw']} байт")
+
+def publish_to_gitverse():
+    """Загружает изменившиеся файлы на GitVerse"""
+    changed = changed_publish_files("GitVerse", get_publish_files())
+    if not changed:
+        return
+    log("🚀 Начинаю загрузку на GitVerse...")
+    files = {}
+    for remote_name, (local_path, _) in changed.items():
+        with open(local_path, "r", encoding="utf-8") as f:
+            files[remote_name] = f.read()
+    for remote_name in get_gitverse_client().commit_files(files):
+        mark_published("GitVerse", remote_name, changed[remote_name][1])
+
+def publish_outputs(destinations: dict[str, Callable[[], None]]) -> dict[str, float]:
+    """Публикует во все направления параллельно с общим дедлайном
+
+    Ошибка или зависание одного направления не задерживает остальные.
+    Возвращает время работы каждого завершившегося направления.
+    """
+    slots = threading.BoundedSemaphore(max(1, PUBLISH_WORKERS))
+    timings = {}
+    failures = {}
+
+    def run(name: str, publish: Callable[[], None]):
+        with slots:
+            started = time.monotonic()
+            try:
+                publish()
+            except Exception as e:
+                failures[name] = str(e)[:200]
+            timings[name] = time.monotonic() - started
+
+    # Потоки-демоны: направление, не уложившееся в дедлайн, не держит завершение процесса
+    threads = {
+        name: threading.Thread(target=run, args=(name, publish), name=f"publish-{name}", daemon=True)
+        for name, publish in destinations.items()
+    }
+    deadline = time.monotonic() + PUBLISH_DEADLINE
+    for thread in threads.values():
+        thread.start()
+    for thread in threads.values():
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+    for name, thread in threads.items():
+        if thread.is_alive():
+            log(f"⏱️ {name}: не уложился в общий дедлайн публикации {PUBLISH_DEADLINE:.0f} с")
+        elif name in failures:
+            log(f"❌ {name}: ошибка публикации за {timings[name]:.1f} с: {failures[name]}")
+        else:
+            log(f"⏱️ {name}: опубликовано за {timings[name]:.1f} с", stage=f"publish/{name}",
+                elapsed=round(timings[name], 3))
+        if name in timings:
+            record_stage(f"publish/{name}", timings[name])
+    return dict(timings)
@@ -0,0 +1,105 @@
+"""
+Шардированные подписки: срезы merged по протоколу, по флагу страны и куски фиксированного размера.
+
+Все срезы заполняются за один проход по дедуплицированному списку, рядом пишется
+index.json с именами, числом конфигов и sha256 каждого шарда. Заголовки шардов не содержат
+времени обновления, поэтому неизменившийся шард побайтно совпадает с прошлым и не перезаливается.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+
+from common import PATHS, log
+from compression import ENCODING_SUFFIXES, open_output
+from configs import ParsedConfig, process_configs_with_numbering
+
+SHARD_OUTPUTS = os.environ.get("SHARD_OUTPUTS", "0") == "1"
+# Размер куска для chunk/NNN.txt, конфигов
+SHARD_SIZE = int(os.environ.get("SHARD_SIZE", "500"))
+SHARDS_DIR = "shards"
+SHARD_INDEX = "index.json"
+
+_REGIONAL_INDICATOR_A = 0x1F1E6
+
+def flag_to_country(flag: str) -> str:
+    """🇷🇺 -> RU; пустая строка для конфига без флага"""
+    if len(flag) != 2:
+        return ""
+    return "".join(chr(ord(char) - _REGIONAL_INDICATOR_A + ord("A")) for char in flag)
+
+def shards_dir(base_dir: str | None = None) -> str:
+    return os.path.join(PATHS["base_dir"] if base_dir is None else base_dir, SHARDS_DIR)
+
+def _shard_names(parsed: ParsedConfig, position: int) -> list[tuple[str, str, str]]:
+    """Шарды, в которые попадает конфиг: (имя файла, вид, ключ)"""
+    scheme = parsed.scheme or "other"
+    country = flag_to_country(parsed.flag) or "other"
+    chunk = f"{position // max(1, SHARD_SIZE) + 1:03d}"
+    return [
+        (f"protocol/{scheme}.txt", "protocol", scheme),
+        (f"country/{country}.txt", "country", country),
+        (f"chunk/{chunk}.txt", "chunk", chunk),
+    ]
+
+def write_shards(configs: list[ParsedConfig], base_dir: str | None = None) -> dict:
+    """Пишет шарды и index.json, удаляет шарды, которых больше нет; возвращает индекс"""
+    directory = shards_dir(base_dir)
+    shards: dict[str, dict] = {}
+    for position, (parsed, line) in enumerate(zip(configs, process_configs_with_numbering(configs))):
+        for name, kind, key in _shard_names(parsed, position):
+            shards.setdefault(name, {"kind": kind, "key": key, "lines": []})["lines"].append(line)
+
+    # Без времени обновления: индекс меняется, только когда меняются сами шарды
+    index = {"total": len(configs), "shard_size": SHARD_SIZE, "shards": []}
+    for name in sorted(shards):
+        shard = shards[name]
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        body = "".join(line + "\n" for line in shard["lines"])
+        header = (f"#profile-title: WL RUS ({shard['kind']} {shard['key']})\n"
+                  "#profile-update-interval: 24\n"
+                  f"# Всего конфигов: {len(shard['lines'])}\n\n")
+        with open_output(path) as f:
+            f.write(header)
+            f.write(body)
+        index["shards"].append({
+            "name": name,
+            "kind": shard["kind"],
+            "key": shard["key"],
+            "count": len(shard["lines"]),
+            "sha256": hashlib.sha256((header + body).encode("utf-8", errors="replace")).hexdigest(),
+        })
+
+    # Шарды исчезнувших протоколов, стран и кусков удаляем вместе со сжатыми копиями
+    keep = set(shards) | {SHARD_INDEX}
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, directory).replace(os.sep, "/")
+            for suffix in ENCODING_SUFFIXES.values():
+                name = name.removesuffix(suffix)
+            if name not in keep:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+    index_path = os.path.join(directory, SHARD_INDEX)
+    with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(index_path + ".tmp", index_path)
+    log(f"🧩 Шарды: {len(shards)} файлов ({SHARD_SIZE} конфигов в куске) и {SHARD_INDEX} в {directory}")
+    return index
+
+def shard_publish_files(base_dir: str | None = None) -> dict[str, str]:
+    """Шарды для публикации по index.json: удалённое имя -> локальный путь"""
+    directory = shards_dir(base_dir)
+    try:
+        with open(os.path.join(directory, SHARD_INDEX), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    files = {f"{SHARDS_DIR}/{SHARD_INDEX}": os.path.join(directory, SHARD_INDEX)}
+    for shard in index.get("shards", []):
+        files[f"{SHARDS_DIR}/{shard['name']}"] = os.path.join(directory, shard["name"])
+    return files
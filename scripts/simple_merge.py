@@ -5,330 +5,73 @@
 (если вы будете продавать конфиги из парсера - это будет нарушение лицензии)
 """
 
+import time
+
+# Время начала импорта - для замера стоимости старта
+_IMPORT_STARTED = time.perf_counter()
+
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from collections import defaultdict
-from github import GithubException
-from github import Github, Auth
-from datetime import datetime
+from collections.abc import Iterable, Iterator
 import concurrent.futures
 import urllib.parse
+import asyncio
 import threading
-import ipaddress
-import zoneinfo
+import socket
 import requests
 import urllib3
 import calendar
-import base64
+import hashlib
+import logging
 import json
-import re
 import os
 
-LOGS_BY_FILE: dict[int, list[str]] = defaultdict(list)
-_LOG_LOCK = threading.Lock()
-
-def log(message: str):
-    """Добавляет сообщение в общий словарь логов потокобезопасно."""
-    with _LOG_LOCK:
-        LOGS_BY_FILE[0].append(message)
-
-zone = zoneinfo.ZoneInfo("Europe/Moscow")
-thistime = datetime.now(zone)
-offset = thistime.strftime("%H:%M | %d.%m.%Y")
-
-GITHUB_TOKEN = os.environ.get("MY_TOKEN", "")
-REPO_NAME = os.environ.get("GITHUB_REPOSITORY", "bywarm/wlrusparser")
-
-# Cloud.ru S3 конфигурация
-CLOUD_RU_ENDPOINT = os.environ.get("CLOUD_RU_ENDPOINT", "https://s3.cloud.ru/bucket-93b250")
-CLOUD_RU_ACCESS_KEY = os.environ.get("CLOUD_RU_ACCESS_KEY", "28a54be8-b238-4edf-8079-7cee88d2ab3c:d103f9e8c17b5d760f0d713ca4af063c")
-CLOUD_RU_SECRET_KEY = os.environ.get("CLOUD_RU_SECRET_KEY", "")
-CLOUD_RU_BUCKET = os.environ.get("CLOUD_RU_BUCKET", "bucket-93b250")
-CLOUD_RU_REGION = os.environ.get("CLOUD_RU_REGION", "ru-central-1")
-
-# GitVerse API конфигурация (только токен в секретах)
-GITVERSE_TOKEN = os.environ.get("GITVERSE_TOKEN", "")
-
-# Остальные параметры GitVerse заданы явно в коде
-if GITVERSE_TOKEN:
-    # Настройки по умолчанию - замените на ваши
-    GITVERSE_ENDPOINT = "https://api.gitverse.ru"  # Основной endpoint согласно документации
-    GITVERSE_REPO_OWNER = "bywarm"  # ВАШ логин на GitVerse
-    GITVERSE_REPO_NAME = "rser"  # ВАШ репозиторий
-    GITVERSE_BRANCH = "master"
-else:
-    # Если токен не задан, параметры не важны
-    GITVERSE_ENDPOINT = ""
-    GITVERSE_REPO_OWNER = ""
-    GITVERSE_REPO_NAME = ""
-    GITVERSE_BRANCH = ""
-
-if GITHUB_TOKEN:
-    g = Github(auth=Auth.Token(GITHUB_TOKEN))
-else:
-    g = Github()
-
-try:
-    REPO = g.get_repo(REPO_NAME)
-except Exception as e:
-    log("Ошибка подключения к GitHub: " + str(e)[:100])
-    REPO = None
-
-
-OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "confs")
-
-CONFIG = {
-    "output_dir": OUTPUT_DIR,
-    "merged_file": "merged.txt",
-    "wl_file": "wl.txt",
-    "selected_file": "selected.txt",
-    "custom_prefix": "",
-    "use_date_suffix": False,
-    "rotate_folders": False,
-}
-
-if CONFIG["rotate_folders"]:
-    month = datetime.now().month
-    year_short = datetime.now().strftime("%y")
-    CONFIG["output_dir_suffix"] = f"_{year_short}{month:02d}"
-
-def get_paths():
-    """Возвращает актуальные пути к файлам"""
-    base_dir = CONFIG["output_dir"]
-    
-    paths = {
-        "base_dir": base_dir,
-        "merged": f"{base_dir}/{CONFIG['merged_file']}",
-        "wl": f"{base_dir}/{CONFIG['wl_file']}",
-        "selected": f"{base_dir}/{CONFIG['selected_file']}",
-        "gh_pages_merged": "merged.txt",
-        "gh_pages_wl": "wl.txt",
-    }
-    return paths
-
-PATHS = get_paths()
-
-EXCLUDE_PATTERNS = [
-    "rootface-@pwn1337-telegram",
-    "01010101",
-    "9292929",
-    "38388282",
-    "star_test1",
-    "11111111-1111-1111-1111-111111111111",
-]
-
-# Дополнительные настройки
-EXCLUDE_SETTINGS = {
-    "case_sensitive": False,  # Регистрозависимость
-    "log_excluded": True,     # Логировать исключенные конфиги
-    "save_excluded": True,    # Сохранять исключенные в отдельный файл
-}
-
-WHITELIST_SUBNETS = [
-    "5.188.0.0/16",
-    "37.18.0.0/16",
-    "37.139.0.0/16",
-    "45.15.0.0/16",
-    "45.129.0.0/16",
-    "51.250.0.0/16", 
-    "51.250.0.0/17", 
-    "77.88.21.0/24", 
-    "78.159.0.0/16",
-    "78.159.247.0/24", 
-    "79.174.91.0/24",  
-    "79.174.92.0/24",  
-    "79.174.93.0/24",  
-    "79.174.94.0/24", 
-    "79.174.95.0/24",  
-    "83.166.0.0/16",
-    "84.201.0.0/16",   
-    "84.201.128.0/18", 
-    "87.250.247.0/24", 
-    "87.250.250.0/24",
-    "87.250.251.0/24", 
-    "87.250.254.0/24", 
-    "89.208.0.0/16",
-    "89.253.200.0/21", 
-    "91.219.0.0/16",
-    "91.222.239.0/24", 
-    "95.163.0.0/16",
-    "95.163.248.0/22", 
-    "95.181.182.0/24", 
-    "103.111.114.0/24", 
-    "109.120.0.0/16",
-    "109.73.201.0/24", 
-    "130.193.0.0/16",
-    "134.17.94.0/24",  
-    "158.160.0.0/16",
-    "176.32.0.0/16",
-    "176.108.0.0/16",
-    "176.109.0.0/16",
-    "176.122.0.0/16",
-    "178.154.0.0/16",
-    "185.39.206.0/24",
-    "185.130.0.0/16",
-    "185.141.216.0/24", 
-    "185.177.0.0/16",
-    "185.177.73.0/24", 
-    "185.241.192.0/22", 
-    "193.53.0.0/16",
-    "212.233.72.0/21",
-    "217.12.0.0/16",
-    "217.16.0.0/16",    
-    "217.16.24.0/21",  
-    "37.9.38.0/24",
-    "37.220.166.0/24",
-    "77.41.174.0/24",
-    "79.126.125.0/24",
-    "81.22.206.0/24",
-    "81.177.73.0/24",
-    "81.211.48.0/24",
-    "82.208.79.0/24",
-    "82.209.65.0/24",
-    "85.26.166.0/24",
-    "85.234.38.0/24",
-    "89.248.230.0/24",
-    "91.233.216.0/24",
-    "91.233.217.0/24",
-    "91.233.218.0/24",
-    "92.223.43.0/24",
-    "94.229.232.0/24",
-    "95.142.205.0/24",
-    "95.163.43.0/24",
-    "95.167.222.0/24",
-    "95.181.181.0/24",
-    "109.120.190.0/24",
-    "128.75.235.0/24",
-    "128.75.253.0/24",
-    "128.140.170.0/24",
-    "146.185.209.0/24",
-    "151.236.75.0/24",
-    "151.236.87.0/24",
-    "151.236.90.0/24",
-    "151.236.96.0/24",
-    "151.236.99.0/24",
-    "155.212.192.0/24",
-    "176.211.118.0/24",
-    "178.176.128.0/24",
-    "178.176.145.0/24",
-    "178.178.103.0/24",
-    "178.237.22.0/24",
-    "178.248.232.0/24",
-    "178.248.233.0/24",
-    "178.248.234.0/24",
-    "178.248.235.0/24",
-    "178.248.238.0/24",
-    "178.248.239.0/24",
-    "185.9.230.0/24",
-    "185.16.150.0/24",
-    "185.27.192.0/24",
-    "185.32.187.0/24",
-    "185.32.251.0/24",
-    "185.45.82.0/24",
-    "185.62.201.0/24",
-    "185.65.148.0/24",
-    "185.65.149.0/24",
-    "185.72.228.0/24",
-    "185.72.229.0/24",
-    "185.72.231.0/24",
-    "185.73.192.0/24",
-    "185.73.193.0/24",
-    "185.73.194.0/24",
-    "185.73.195.0/24",
-    "185.163.159.0/24",
-    "185.226.55.0/24",
-    "185.241.193.0/24",
-    "185.242.16.0/24",
-    "188.43.2.0/24",
-    "188.43.3.0/24",
-    "188.43.5.0/24",
-    "188.170.146.0/24",
-    "194.67.49.0/24",
-    "194.85.149.0/24",
-    "194.154.70.0/24",
-    "194.154.71.0/24",
-    "194.154.73.0/24",
-    "194.154.76.0/24",
-    "194.154.80.0/24",
-    "194.186.16.0/24",
-    "194.186.17.0/24",
-    "194.186.26.0/24",
-    "194.186.31.0/24",
-    "194.186.81.0/24",
-    "194.186.86.0/24",
-    "194.186.91.0/24",
-    "194.186.96.0/24",
-    "194.186.158.0/24",
-    "194.186.168.0/24",
-    "194.186.172.0/24",
-    "194.186.174.0/24",
-    "194.186.244.0/24",
-    "194.186.249.0/24",
-    "194.186.250.0/24",
-    "195.34.36.0/24",
-    "195.34.37.0/24",
-    "195.34.38.0/24",
-    "195.34.58.0/24",
-    "195.239.1.0/24",
-    "195.239.7.0/24",
-    "195.239.9.0/24",
-    "195.239.13.0/24",
-    "195.239.38.0/24",
-    "195.239.57.0/24",
-    "195.239.67.0/24",
-    "195.239.68.0/24",
-    "195.239.94.0/24",
-    "195.239.109.0/24",
-    "195.239.156.0/24",
-    "195.239.158.0/24",
-    "195.239.159.0/24",
-    "212.46.197.0/24",
-    "212.46.198.0/24",
-    "212.46.200.0/24",
-    "212.46.208.0/24",
-    "212.46.210.0/24",
-    "212.46.254.0/24",
-    "212.188.4.0/24",
-    "212.188.6.0/24",
-    "212.188.8.0/24",
-    "212.188.12.0/24",
-    "212.188.15.0/24",
-    "212.188.16.0/24",
-    "212.193.146.0/24",
-    "212.193.147.0/24",
-    "213.87.71.0/24",
-    "213.184.156.0/24",
-    "217.20.158.0/24",
-    "217.118.183.0/24",
-    "217.174.188.0/24",
-    "80.68.251.0/24",
-    "91.208.84.0/24",
-    "91.232.131.0/24",
-    "109.207.4.0/24",
-]
-
-WHITELIST_NETWORKS = [ipaddress.ip_network(subnet) for subnet in WHITELIST_SUBNETS]
-
-URLS = [
-    "https://raw.githubusercontent.com/igareck/vpn-configs-for-russia/refs/heads/main/WHITE-CIDR-RU-all.txt",
-    "https://raw.githubusercontent.com/zieng2/wl/refs/heads/main/vless_universal.txt",
-    "https://raw.githubusercontent.com/zieng2/wl/main/vless_lite.txt",
-    "https://gitverse.ru/api/repos/Vsevj/OBS/raw/branch/master/wwh",
-    "https://storage.yandexcloud.net/cid-vpn/whitelist.txt",
-    "https://raw.githubusercontent.com/koteey/Ms.Kerosin-VPN/refs/heads/main/proxies.txt",
-    "https://raw.githubusercontent.com/HikaruApps/WhiteLattice/refs/heads/main/subscriptions/main-sub.txt",
-    "https://raw.githubusercontent.com/FalerChannel/FalerChannel/refs/heads/main/configs",
-    "https://raw.githubusercontent.com/officialdakari/psychic-octo-tribble/refs/heads/main/subwl.txt",
-    "https://raw.githubusercontent.com/RKPchannel/RKP_bypass_configs/refs/heads/main/configs",
-    "https://raw.githubusercontent.com/Ai123999/WhiteeListSub/refs/heads/main/whitelistkeys",
-    "https://raw.githubusercontent.com/EtoNeYaProject/etoneyaproject.github.io/refs/heads/main/whitelist",
-    "https://raw.githubusercontent.com/gbwltg/gbwl/refs/heads/main/m2EsPqwmlc",
-    "https://gitverse.ru/api/repos/LowiK/LowiKLive/raw/branch/main/ObhodBSfree.txt",
-    "https://sub-rostunnel.vercel.app/subs/gen.txt",
-    "https://raw.githubusercontent.com/igareck/vpn-configs-for-russia/refs/heads/main/WHITE-CIDR-RU-checked.txt",
-]
+# Разбор, whitelist и публикация вынесены в модули; имена доступны и как simple_merge.<имя>
+from common import (
+    CONFIG, OUTPUT_DIR, PATHS, SOURCE_MIRRORS, URLS, get_paths, log, logger, run_timestamp, shutdown_logging,
+)
+from whitelist import (
+    WHITELIST_SUBNETS, SubnetIndex, classify_ips, get_whitelist_index, ip_to_int,
+    is_ip_in_subnets, load_whitelist_index,
+)
+from configs import (
+    CONFIG_SCHEMES, EXCLUDE_PATTERNS, EXCLUDE_SETTINGS, FLAG_RE, RECORD_VERSION, ExclusionMatcher, ParsedConfig,
+    add_numbering_to_name, compile_exclusions, config_scheme, extract_existing_info,
+    extract_host_port, filter_excluded_configs, generate_config_key, is_config_line,
+    iter_configs_from_chunks, merge_and_deduplicate, parse_config, parse_many, process_configs_with_numbering,
+    save_excluded_configs,
+)
+from health import (
+    HALF_OPEN, HEALTH_STATS, OPEN, breaker_state, latency_percentile, load_source_health, log_source_health,
+    record_fetch, save_source_health, source_timeout,
+)
+from compression import compressed_variants, open_output
+from probe import PROBE_ENABLED, PROBE_STATS, rank_by_probe
+from shards import SHARD_OUTPUTS, write_shards
+from delta import DELTA_OUTPUTS, write_delta
+from catalogue import CATALOGUE_FILE, SELECTED_SOURCE, update_catalogue
+from metrics import count_duplicates, record_source, record_stage, set_counter, stage, write_metrics
+from publishers import (
+    CLOUD_RU_BUCKET, GITVERSE_TOKEN, GitVerseClient, S3Publisher, build_readme, commit_to_github,
+    get_gitverse_client, get_github_repo, get_s3_publisher, publish_outputs, publish_to_cloud_ru,
+    publish_to_github, publish_to_gitverse, save_publish_manifest, update_readme, upload_to_cloud_ru,
+    upload_to_github, upload_to_gitverse,
+)
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Офлайн-режим: загрузка и обработка без публикации (клиенты GitHub, S3, GitVerse не создаются)
+OFFLINE = os.environ.get("OFFLINE", "0") == "1"
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+def __getattr__(name: str):
+    # offset и REPO оставлены для совместимости и вычисляются только при обращении
+    if name == "offset":
+        return run_timestamp()
+    if name == "REPO":
+        return get_github_repo()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 CHROME_UA = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
     "AppleWebKit/537.36 (KHTML, like Gecko) "
@@ -336,29 +79,196 @@ CHROME_UA = (
 )
 
 DEFAULT_MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "10"))
+# Одновременных запросов к одному хосту (большинство источников - raw.githubusercontent.com)
+HOST_CONCURRENCY = int(os.environ.get("HOST_CONCURRENCY", "4"))
+# Дедлайн одного источника и всей фазы загрузки, секунды
+SOURCE_DEADLINE = float(os.environ.get("SOURCE_DEADLINE", "60"))
+FETCH_DEADLINE = float(os.environ.get("FETCH_DEADLINE", "180"))
+# Резервный запрос к зеркалу, если основной URL не ответил за этот процентиль своих задержек
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "1") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "0.95"))
+# Задержка резервного запроса без истории задержек и её нижняя граница, секунды
+HEDGE_DEFAULT_DELAY = float(os.environ.get("HEDGE_DEFAULT_DELAY", "5"))
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.5"))
+# Автоматическое зеркало jsDelivr для raw.githubusercontent.com. По умолчанию выключено:
+# jsDelivr кэширует ветки до 12 ч, и выигравшее зеркало может отдать устаревший список
+HEDGE_CDN_MIRRORS = os.environ.get("HEDGE_CDN_MIRRORS", "0") == "1"
+HEDGE_STATS = {"hedged": 0, "mirror_wins": 0}
 
 def _build_session(max_pool_size: int) -> requests.Session:
     session = requests.Session()
+    # Повторы делает только open_url_stream: повторы адаптера умножались бы на его попытки
     adapter = HTTPAdapter(
         pool_connections=max_pool_size,
         pool_maxsize=max_pool_size,
-        max_retries=Retry(
-            total=2,
-            backoff_factor=0.5,
-            status_forcelist=(429, 500, 502, 503, 504),
-            allowed_methods=("HEAD", "GET", "OPTIONS"),
-        ),
+        max_retries=0,
     )
     session.mount("http://", adapter)
     session.mount("https://", adapter)
-    session.headers.update({"User-Agent": CHROME_UA})
+    # Явно запрашиваем сжатие: gzip и deflate, а br и zstd - если установлены brotli и zstandard
+    session.headers.update({"User-Agent": CHROME_UA, **urllib3.util.make_headers(accept_encoding=True)})
     return session
 
-REQUESTS_SESSION = _build_session(max_pool_size=min(DEFAULT_MAX_WORKERS, len(URLS)))
+_SESSION_LOCAL = threading.local()
+
+def get_requests_session() -> requests.Session:
+    """Возвращает сессию текущего потока (requests.Session не потокобезопасна)"""
+    session = getattr(_SESSION_LOCAL, "session", None)
+    if session is None:
+        session = _build_session(max_pool_size=HOST_CONCURRENCY)
+        _SESSION_LOCAL.session = session
+    return session
+
+# Кэш источников между запусками (ETag / Last-Modified + тело ответа)
+HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", ".cache/http")
+HTTP_CACHE_STATS = {"requests": 0, "hits": 0, "bytes_saved": 0}
+_HTTP_CACHE_LOCK = threading.Lock()
+
+# Потоковая загрузка: размер куска и предельный объём одного источника
+STREAM_CHUNK_SIZE = 64 * 1024
+MAX_SOURCE_BYTES = int(os.environ.get("MAX_SOURCE_BYTES", str(16 * 1024 * 1024)))
+
+def _http_cache_paths(url: str) -> tuple[str, str]:
+    """Возвращает пути к метаданным и телу закэшированного ответа"""
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    base = os.path.join(HTTP_CACHE_DIR, digest)
+    return base + ".json", base + ".body"
+
+def load_http_cache(url: str) -> dict | None:
+    """Читает метаданные закэшированного ответа для URL"""
+    if not HTTP_CACHE_DIR:
+        return None
+    meta_path, body_path = _http_cache_paths(url)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("url") != url or not os.path.exists(body_path):
+        return None
+    return meta
+
+def _iter_file_chunks(path: str) -> Iterator[bytes]:
+    """Читает файл кусками по STREAM_CHUNK_SIZE"""
+    with open(path, "rb") as f:
+        while chunk := f.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
+def _log_transfer_compression(url: str, response: requests.Response, size: int):
+    """Сверяет, пришло ли тело сжатым, и выводит степень сжатия при передаче"""
+    content_encoding = response.headers.get("Content-Encoding", "")
+    try:
+        # raw.tell() - байты, прочитанные из сокета до распаковки
+        wire = response.raw.tell()
+    except (AttributeError, OSError):
+        return
+    record_source(url, wire_bytes=wire, content_encoding=content_encoding or "identity")
+    if content_encoding and wire:
+        log(f"🗜️  {content_encoding}: {wire / 1024:.0f} → {size / 1024:.0f} КБ (x{size / wire:.1f})", source=url)
+    elif size >= STREAM_CHUNK_SIZE:
+        log(f"ℹ️  Источник отдаётся без сжатия ({size / 1024:.0f} КБ): {url}", source=url)
+
+def _iter_response_chunks(url: str, response: requests.Response, encoding: str) -> Iterator[bytes]:
+    """Отдаёт тело ответа кусками, попутно сохраняя его в HTTP-кэш"""
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    meta_path, body_path = _http_cache_paths(url)
+    cache_file = None
+    if HTTP_CACHE_DIR and (etag or last_modified):
+        try:
+            os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+            cache_file = open(body_path + ".tmp", "wb")
+        except OSError as e:
+            log(f"⚠️  Не удалось записать HTTP-кэш для {url}: {str(e)[:100]}")
+
+    size = 0
+    digest = hashlib.sha256()
+    complete = False
+    try:
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            if not chunk:
+                continue
+            size += len(chunk)
+            digest.update(chunk)
+            if cache_file:
+                cache_file.write(chunk)
+            yield chunk
+        complete = True
+        _log_transfer_compression(url, response, size)
+    finally:
+        response.close()
+        if cache_file:
+            cache_file.close()
+            # Обрезанное или прерванное тело в кэш не попадает
+            if complete:
+                meta = {
+                    "url": url,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "encoding": encoding,
+                    "size": size,
+                    "sha256": digest.hexdigest(),
+                }
+                try:
+                    os.replace(body_path + ".tmp", body_path)
+                    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                        json.dump(meta, f)
+                    os.replace(meta_path + ".tmp", meta_path)
+                except OSError as e:
+                    log(f"⚠️  Не удалось записать HTTP-кэш для {url}: {str(e)[:100]}")
+            else:
+                try:
+                    os.remove(body_path + ".tmp")
+                except OSError:
+                    pass
+
+def _conditional_headers(meta: dict | None) -> dict:
+    """Формирует заголовки условного GET по закэшированным валидаторам"""
+    headers = {}
+    if meta:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+RETRY_BACKOFF = 0.5
+_RETRYABLE_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+
+def _is_retryable(exc: requests.exceptions.RequestException, status: int) -> bool:
+    """Может ли следующая попытка (без проверки сертификата или по http) помочь"""
+    if isinstance(exc, requests.exceptions.Timeout):
+        # Источник не ответил за отведённое время - ещё одна попытка лишь удвоит ожидание
+        return False
+    if status:
+        return status in _RETRYABLE_STATUSES
+    return isinstance(exc, requests.exceptions.ConnectionError)
+
+def open_url_stream(url: str, timeout: float = 15, max_attempts: int = 3,
+                    deadline: float | None = None) -> tuple[Iterator[bytes], str, str] | None:
+    """Открывает поток тела URL (с условным GET по HTTP-кэшу)
+
+    Возвращает (итератор кусков, кодировка, sha256 тела из кэша) или None, если загрузить
+    не удалось. Хэш заполнен только когда тело отдаётся из кэша по ответу 304.
+    deadline - момент time.monotonic(), после которого новые попытки не делаются,
+    а таймаут каждой попытки урезается до оставшегося времени.
+
+    Это единственный слой повторов: вторая попытка без проверки сертификата, третья по http.
+    Повторяются только ошибки, которые следующая попытка может исправить: TLS, обрыв
+    соединения, 408/429/5xx. Таймаут и остальные 4xx завершают загрузку сразу.
+    """
+    cache_meta = load_http_cache(url)
+    with _HTTP_CACHE_LOCK:
+        HTTP_CACHE_STATS["requests"] += 1
+    session = get_requests_session()
 
-def fetch_url(url: str, timeout: int = 15, max_attempts: int = 3) -> str:
-    """Загружает данные с URL"""
     for attempt in range(1, max_attempts + 1):
+        attempt_timeout = timeout
+        if deadline is not None:
+            attempt_timeout = min(timeout, deadline - time.monotonic())
+            if attempt_timeout <= 0:
+                log("⏱️ Дедлайн источника истёк: " + url)
+                return None
         try:
             modified_url = url
             verify = True
@@ -371,444 +281,699 @@ def fetch_url(url: str, timeout: int = 15, max_attempts: int = 3) -> str:
                     modified_url = parsed._replace(scheme="http").geturl()
                 verify = False
 
-            response = REQUESTS_SESSION.get(modified_url, timeout=timeout, verify=verify)
+            response = session.get(
+                modified_url,
+                timeout=attempt_timeout,
+                verify=verify,
+                headers=_conditional_headers(cache_meta),
+                stream=True,
+            )
+            record_source(url, status=response.status_code, attempts=attempt)
+            if response.status_code == 304 and cache_meta:
+                response.close()
+                _, body_path = _http_cache_paths(url)
+                if os.path.exists(body_path):
+                    with _HTTP_CACHE_LOCK:
+                        HTTP_CACHE_STATS["hits"] += 1
+                        HTTP_CACHE_STATS["bytes_saved"] += cache_meta.get("size", 0)
+                    return (
+                        _iter_file_chunks(body_path),
+                        cache_meta.get("encoding") or "utf-8",
+                        cache_meta.get("sha256", ""),
+                    )
+                # Тело пропало из кэша - повторяем без валидаторов
+                cache_meta = None
+                response = session.get(modified_url, timeout=attempt_timeout, verify=verify, stream=True)
+            if not response.ok:
+                response.close()
             response.raise_for_status()
-            return response.text
+            encoding = response.encoding or "utf-8"
+            return _iter_response_chunks(url, response, encoding), encoding, ""
 
         except requests.exceptions.RequestException as exc:
-            last_exc = exc
-            if attempt < max_attempts:
+            failed = getattr(exc, "response", None)
+            status = failed.status_code if failed is not None else 0
+            record_source(url, status=status, attempts=attempt)
+            if attempt < max_attempts and _is_retryable(exc, status):
+                if status in (429, 503):
+                    time.sleep(RETRY_BACKOFF * attempt)
                 continue
             error_msg = str(exc)
             if len(error_msg) > 100:
                 error_msg = error_msg[:100]
-            log("Ошибка загрузки " + url + ": " + error_msg)
-            return ""
-    
-    return ""
+            log("Ошибка загрузки " + url + ": " + error_msg, level=logging.ERROR, source=url)
+            return None
 
-def extract_host_port(config: str) -> tuple[str, int] | None:
-    """Извлекает хост и порт из конфигурационной строки для дедупликации"""
-    if not config:
-        return None
-    
-    try:
-        if config.startswith("vmess://"):
-            try:
-                payload = config[8:]
-                rem = len(payload) % 4
-                if rem:
-                    payload += '=' * (4 - rem)
-                
-                decoded = base64.b64decode(payload).decode('utf-8', errors='ignore')
-                
-                if decoded.startswith('{'):
-                    j = json.loads(decoded)
-                    host = j.get('add') or j.get('host') or j.get('ip')
-                    port = j.get('port')
-                    
-                    if host and port:
-                        return str(host), int(port)
-            except Exception:
-                pass
-        
-        patterns = [
-            r'@([\w\.-]+):(\d{1,5})',
-            r'host=([\w\.-]+).*?port=(\d{1,5})',
-            r'address=([\w\.-]+).*?port=(\d{1,5})',
-            r'//([\w\.-]+):(\d{1,5})',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, config, re.IGNORECASE)
-            if match:
-                host = match.group(1)
-                port = int(match.group(2))
-                return host, port
-        
-        match = re.search(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d{1,5})', config)
-        if match:
-            return match.group(1), int(match.group(2))
-        
-        match = re.search(r'([\w\.-]+):(\d{1,5})', config)
-        if match:
-            host = match.group(1)
-            port = int(match.group(2))
-            if len(host) > 1 and ('.' in host or host.replace('.', '').replace('-', '').isalnum()):
-                return host, port
-                
-    except Exception:
-        pass
-    
     return None
 
-def generate_config_key(config: str) -> str:
-    """Генерирует уникальный ключ для конфига на основе всех параметров"""
-    if not config:
+def fetch_url(url: str, timeout: float = 15, max_attempts: int = 3, deadline: float | None = None) -> str:
+    """Загружает данные с URL целиком"""
+    stream = open_url_stream(url, timeout, max_attempts, deadline)
+    if stream is None:
         return ""
-    
-    try:
-        # Для VLESS
-        if config.startswith("vless://"):
-            parsed = urllib.parse.urlparse(config)
-            
-            # Извлекаем основные параметры
-            username = parsed.username or ""
-            host = parsed.hostname or ""
-            port = parsed.port or 443
-            
-            # Парсим query параметры
-            query_params = urllib.parse.parse_qs(parsed.query)
-            
-            # Собираем ключевые параметры для уникальности
-            key_parts = [
-                username,  # UUID
-                host,
-                str(port),
-                query_params.get('security', [''])[0],
-                query_params.get('sni', [''])[0],
-                query_params.get('sid', [''])[0],
-                query_params.get('pbk', [''])[0],
-                query_params.get('type', [''])[0],
-                query_params.get('flow', [''])[0],
-                query_params.get('fp', [''])[0],
-                query_params.get('encryption', [''])[0],
-            ]
-            
-            # Фильтруем пустые значения и объединяем
-            return "|".join([part for part in key_parts if part])
-        
-        # Для VMESS
-        elif config.startswith("vmess://"):
-            try:
-                payload = config[8:]
-                rem = len(payload) % 4
-                if rem:
-                    payload += '=' * (4 - rem)
-                
-                decoded = base64.b64decode(payload).decode('utf-8', errors='ignore')
-                
-                if decoded.startswith('{'):
-                    j = json.loads(decoded)
-                    key_parts = [
-                        j.get('id', ''),  # UUID
-                        j.get('add', ''),  # Host
-                        str(j.get('port', '')),  # Port
-                        j.get('net', ''),  # Network type
-                        j.get('host', ''),  # Host header
-                        j.get('path', ''),  # Path
-                        j.get('tls', ''),  # TLS
-                        j.get('sni', ''),  # SNI
-                        j.get('type', ''),  # Type
-                        j.get('ps', ''),  # Remark/name
-                    ]
-                    return "|".join([part for part in key_parts if part])
-            except Exception:
-                pass
-        
-        # Для Trojan
-        elif config.startswith("trojan://"):
-            parsed = urllib.parse.urlparse(config)
-            username = parsed.username or ""  # Password for Trojan
-            host = parsed.hostname or ""
-            port = parsed.port or 443
-            
-            query_params = urllib.parse.parse_qs(parsed.query)
-            key_parts = [
-                username,
-                host,
-                str(port),
-                query_params.get('security', [''])[0],
-                query_params.get('sni', [''])[0],
-                query_params.get('type', [''])[0],
-                query_params.get('flow', [''])[0],
-                query_params.get('fp', [''])[0],
-            ]
-            return "|".join([part for part in key_parts if part])
-        
-        # Для других протоколов используем полную строку как ключ
+    chunks, encoding, _ = stream
+    return b"".join(chunks).decode(encoding, errors="replace")
+
+def log_http_cache_stats():
+    """Выводит статистику HTTP-кэша источников"""
+    total = HTTP_CACHE_STATS["requests"]
+    hits = HTTP_CACHE_STATS["hits"]
+    if not total:
+        return
+    saved_kb = HTTP_CACHE_STATS["bytes_saved"] / 1024
+    log(f"🗄️ HTTP-кэш: {hits}/{total} попаданий ({hits / total:.0%}), сэкономлено {saved_kb:.1f} КБ")
+
+def mirror_urls(url: str) -> list[str]:
+    """URL источника и его зеркала в порядке предпочтения"""
+    candidates = [url, *SOURCE_MIRRORS.get(url, [])]
+    parsed = urllib.parse.urlparse(url)
+    if HEDGE_CDN_MIRRORS and parsed.hostname == "raw.githubusercontent.com":
+        parts = parsed.path.strip("/").split("/")
+        if len(parts) >= 5 and parts[2:4] == ["refs", "heads"]:
+            owner, repo, branch, path = parts[0], parts[1], parts[4], parts[5:]
+        elif len(parts) >= 4:
+            owner, repo, branch, path = parts[0], parts[1], parts[2], parts[3:]
         else:
-            return config[:200]  # Используем начало конфига
-        
-    except Exception as e:
-        # В случае ошибки используем начало конфига
-        return config[:100]
-    
-    # Фолбэк
-    return config[:100]
+            path = []
+        if path:
+            candidates.append(f"https://cdn.jsdelivr.net/gh/{owner}/{repo}@{branch}/{'/'.join(path)}")
+    return list(dict.fromkeys(candidates))
 
-def is_ip_in_subnets(ip_str: str) -> bool:
-    """Проверяет, принадлежит ли IP-адрес одной из разрешенных подсетей"""
-    try:
-        ip = ipaddress.ip_address(ip_str)
-        
-        if ip.version != 4:
-            return False
-            
-        for network in WHITELIST_NETWORKS:
-            if ip in network:
-                return True
-        return False
-    except ValueError:
-        return False
+def hedge_delay(url: str) -> float:
+    """Через сколько секунд без ответа основного URL отправлять резервный запрос"""
+    delay = latency_percentile(url, HEDGE_PERCENTILE)
+    return max(HEDGE_MIN_DELAY, delay) if delay else HEDGE_DEFAULT_DELAY
+
+class SourceLimitReached(Exception):
+    """Источник превысил лимит объёма или дедлайн - незавершённый хвост отбрасывается"""
 
+def _limit_source(chunks: Iterable[bytes], url: str, deadline: float | None,
+                  cancelled: threading.Event | None = None) -> Iterator[bytes]:
+    """Ограничивает поток источника по объёму и дедлайну; cancelled прерывает загрузку"""
+    received = 0
+    for chunk in chunks:
+        if cancelled is not None and cancelled.is_set():
+            raise SourceLimitReached("загрузка отменена")
+        received += len(chunk)
+        if received > MAX_SOURCE_BYTES:
+            raise SourceLimitReached(f"превышен лимит {MAX_SOURCE_BYTES // 1024} КБ, источник обрезан")
+        if deadline is not None and time.monotonic() > deadline:
+            raise SourceLimitReached("дедлайн истёк во время загрузки, источник обрезан")
+        yield chunk
 
-def download_and_process_url(url: str) -> list[str]:
-    """Загружает и обрабатывает конфиги с одного URL"""
+class SourcePayload:
+    """Результат загрузки одного источника"""
+
+    __slots__ = ("url", "digest", "lines", "complete")
+
+    def __init__(self, url: str, digest: str = "", lines: list[str] | None = None, complete: bool = False):
+        self.url = url
+        # sha256 тела ответа; пусто - источник не загрузился
+        self.digest = digest
+        # Строки конфигов; None - тело не читалось, т.к. совпало с инкрементальным состоянием
+        self.lines = lines
+        # Тело получено целиком (не обрезано лимитом или дедлайном)
+        self.complete = complete
+
+def download_and_process_url(url: str, deadline: float | None = None, known_digest: str = "",
+                             timeout: float = 15, max_attempts: int = 3,
+                             cancelled: threading.Event | None = None) -> SourcePayload:
+    """Загружает и обрабатывает конфиги с одного URL
+
+    known_digest - хэш тела из инкрементального состояния: если кэш отдал то же тело,
+    оно даже не читается. cancelled - событие, по которому загрузка бросается
+    (проигравший резервный запрос).
+    """
+    started = time.perf_counter()
+    size = 0
     try:
-        data = fetch_url(url)
-        if not data:
-            return []
-        
-        data = re.sub(r'(vmess|vless|trojan|ss|ssr|tuic|hysteria|hysteria2)://', r'\n\1://', data)
-        lines = data.splitlines()
-        
+        stream = open_url_stream(url, timeout, max_attempts, deadline)
+        if stream is None:
+            return SourcePayload(url)
+        chunks, encoding, cached_digest = stream
+        if known_digest and cached_digest == known_digest:
+            chunks.close()
+            return SourcePayload(url, cached_digest, None, True)
+
+        digest = hashlib.sha256()
+
+        def hashed_chunks() -> Iterator[bytes]:
+            nonlocal size
+            for chunk in chunks:
+                size += len(chunk)
+                digest.update(chunk)
+                yield chunk
+
         configs = []
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('#') and len(line) > 10:
-                if any(line.startswith(p) for p in ['vmess://', 'vless://', 'trojan://', 
-                                                     'ss://', 'ssr://', 'tuic://', 
-                                                     'hysteria://', 'hysteria2://']):
-                    configs.append(line)
-                elif '@' in line and ':' in line and line.count(':') >= 2:
-                    configs.append(line)
-        
+        complete = True
         try:
-            repo_name = url.split('/')[3] if '/' in url else 'unknown'
-        except:
-            repo_name = 'unknown'
-        log("✅ " + repo_name + ": " + str(len(configs)) + " конфигов")
-        return configs
+            for config in iter_configs_from_chunks(_limit_source(hashed_chunks(), url, deadline, cancelled), encoding):
+                configs.append(config)
+        except SourceLimitReached as e:
+            if cancelled is not None and cancelled.is_set():
+                return SourcePayload(url)
+            complete = False
+            log(f"⚠️  {url}: {e}")
+        finally:
+            # Закрываем поток явно, чтобы освободить соединение даже при обрезке
+            chunks.close()
+        return SourcePayload(url, digest.hexdigest(), configs, complete)
         
     except Exception as e:
         error_msg = str(e)
         if len(error_msg) > 100:
             error_msg = error_msg[:100]
-        log("Ошибка обработки " + url + ": " + error_msg)
-        return []
-    
+        log("Ошибка обработки " + url + ": " + error_msg, level=logging.ERROR, source=url)
+        return SourcePayload(url)
+    finally:
+        record_source(url, seconds=round(time.perf_counter() - started, 3), bytes=size)
 
-def add_numbering_to_name(config: str, number: int) -> str:
-    """Добавляет нумерацию и вотермарк в поле name конфига"""
-    try:
-        if config.startswith("vmess://"):
+
+async def _fetch_sources_async(urls: list[str], known_digests: dict[str, str]) -> dict[str, SourcePayload]:
+    """Загружает источники в asyncio с лимитами на хост и дедлайнами"""
+    loop = asyncio.get_running_loop()
+    # requests блокирующий, поэтому сам запрос выполняется в ограниченном пуле потоков,
+    # а планирование, лимиты и дедлайны живут в event loop
+    max_workers = max(1, min(DEFAULT_MAX_WORKERS, len(urls)))
+    # Запас потоков под резервные запросы, чтобы они не ждали в очереди пула
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers * 2 if HEDGE_ENABLED else max_workers)
+    workers = asyncio.Semaphore(max_workers)
+    host_limits: dict[str, asyncio.Semaphore] = {}
+
+    async def fetch_one(url: str) -> SourcePayload:
+        state = breaker_state(url)
+        if state == OPEN:
+            HEALTH_STATS["skipped"] += 1
+            record_source(url, error="circuit_open")
+            log(f"⛔ Источник пропущен (автомат разомкнут): {url}", source=url)
+            return SourcePayload(url)
+        # Пробная загрузка после паузы - одна попытка; успех замыкает автомат
+        max_attempts = 1 if state == HALF_OPEN else 3
+        if state == HALF_OPEN:
+            HEALTH_STATS["probes"] += 1
+        timeout = source_timeout(url)
+        record_source(url, timeout=round(timeout, 1))
+
+        host = urllib.parse.urlparse(url).hostname or ""
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(HOST_CONCURRENCY))
+        async with host_limit, workers:
+            deadline = time.monotonic() + SOURCE_DEADLINE
+            started = time.monotonic()
             try:
-                payload = config[8:]
-                rem = len(payload) % 4
-                if rem:
-                    payload += '=' * (4 - rem)
-                
-                decoded = base64.b64decode(payload).decode('utf-8', errors='ignore')
-                
-                if decoded.startswith('{'):
-                    j = json.loads(decoded)
-                    existing_ps = j.get('ps', '')
-                    
-                    flag = ""
-                    flag_match = re.search(r'[\U0001F1E6-\U0001F1FF]{2}', existing_ps)
-                    if flag_match:
-                        flag = flag_match.group(0) + " "
-                    
-                    new_name = f"{number}. {flag}VMESS | TG: @wlrustg"
-                    j['ps'] = new_name
-                    
-                    new_json = json.dumps(j, separators=(',', ':'))
-                    encoded = base64.b64encode(new_json.encode()).decode()
-                    return f"vmess://{encoded}"
-            except Exception:
-                pass
-            return config
-            
-        elif config.startswith("vless://"):
-            parsed = urllib.parse.urlparse(config)
-            
-            existing_fragment = urllib.parse.unquote(parsed.fragment) if parsed.fragment else ""
-            
-            flag = ""
-            flag_match = re.search(r'[\U0001F1E6-\U0001F1FF]{2}', existing_fragment)
-            if flag_match:
-                flag = flag_match.group(0) + " "
-            
-            new_name = f"{number}. {flag}VLESS | TG: @wlrustg"
-            
-            new_fragment = urllib.parse.quote(new_name, safe='')
-            
-            new_parsed = parsed._replace(fragment=new_fragment)
-            new_config = urllib.parse.urlunparse(new_parsed)
-            
-            return new_config
-            
-        elif config.startswith("trojan://"):
-            parsed = urllib.parse.urlparse(config)
-            
-            existing_fragment = urllib.parse.unquote(parsed.fragment) if parsed.fragment else ""
-            
-            flag = ""
-            flag_match = re.search(r'[\U0001F1E6-\U0001F1FF]{2}', existing_fragment)
-            if flag_match:
-                flag = flag_match.group(0) + " "
-            
-            new_name = f"{number}. {flag}TROJAN | TG: @wlrustg"
-            
-            new_fragment = urllib.parse.quote(new_name, safe='')
-            
-            new_parsed = parsed._replace(fragment=new_fragment)
-            new_config = urllib.parse.urlunparse(new_parsed)
-            
-            return new_config
-            
-        elif config.startswith("ss://"):
-            parsed = urllib.parse.urlparse(config)
-            
-            existing_fragment = urllib.parse.unquote(parsed.fragment) if parsed.fragment else ""
-            
-            name_from_query = ""
-            if not existing_fragment and parsed.query:
-                params = urllib.parse.parse_qs(parsed.query)
-                if 'name' in params:
-                    name_from_query = urllib.parse.unquote(params['name'][0])
-            
-            existing_name = existing_fragment or name_from_query
-            
-            flag = ""
-            flag_match = re.search(r'[\U0001F1E6-\U0001F1FF]{2}', existing_name)
-            if flag_match:
-                flag = flag_match.group(0) + " "
-            
-            new_name = f"{number}. {flag}SS | TG: @wlrustg"
-            
-            new_fragment = urllib.parse.quote(new_name, safe='')
-            
-            new_parsed = parsed._replace(fragment=new_fragment)
-            new_config = urllib.parse.urlunparse(new_parsed)
-            
-            return new_config
-            
+                payload = await asyncio.wait_for(
+                    fetch_hedged(url, deadline, timeout, max_attempts), timeout=SOURCE_DEADLINE
+                )
+            except asyncio.TimeoutError:
+                record_source(url, error="timeout")
+                record_fetch(url, False, time.monotonic() - started, "timeout")
+                log(f"⏱️ Источник не уложился в {SOURCE_DEADLINE:.0f} с: {url}")
+                return SourcePayload(url)
+            record_fetch(url, bool(payload.digest), time.monotonic() - started)
+            return payload
+
+    async def fetch_hedged(url: str, deadline: float, timeout: float, max_attempts: int) -> SourcePayload:
+        """Загружает источник с зеркал: резервный запрос уходит, если основной не ответил
+        за hedge_delay или завершился ошибкой; побеждает первый успешный, остальные отменяются"""
+        candidates = mirror_urls(url) if HEDGE_ENABLED else [url]
+        delay = hedge_delay(url)
+        running: dict[asyncio.Future, tuple[str, threading.Event]] = {}
+        launched: list[str] = []
+
+        def launch():
+            candidate = candidates[len(launched)]
+            launched.append(candidate)
+            cancelled = threading.Event()
+            future = loop.run_in_executor(
+                executor, download_and_process_url, candidate, deadline,
+                known_digests.get(url, ""), timeout, max_attempts, cancelled,
+            )
+            running[future] = (candidate, cancelled)
+
+        launch()
+        try:
+            while running:
+                can_hedge = len(launched) < len(candidates)
+                done, _ = await asyncio.wait(
+                    running, timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Основной запрос не ответил вовремя - резервный к следующему зеркалу
+                    HEDGE_STATS["hedged"] += 1
+                    record_source(url, hedged=len(launched))
+                    log(f"🔀 Резервный запрос: {candidates[len(launched)]}", level=logging.DEBUG, source=url)
+                    launch()
+                    continue
+                for future in done:
+                    candidate, _ = running.pop(future)
+                    payload = future.result()
+                    if payload.digest:
+                        if candidate != url:
+                            HEDGE_STATS["mirror_wins"] += 1
+                            record_source(url, mirror=candidate)
+                            log(f"🔀 Источник получен с зеркала {candidate}", source=url)
+                        payload.url = url
+                        return payload
+                if not running and len(launched) < len(candidates):
+                    launch()  # Все запущенные завершились ошибкой - сразу следующее зеркало
+            return SourcePayload(url)
+        finally:
+            # Проигравшие потоки бросают загрузку на следующем куске
+            for _, cancelled in running.values():
+                cancelled.set()
+
+    tasks = {url: asyncio.create_task(fetch_one(url)) for url in urls}
+    try:
+        _, pending = await asyncio.wait(tasks.values(), timeout=FETCH_DEADLINE)
+        for task in pending:
+            task.cancel()
+        if pending:
+            log(f"⏱️ Общий дедлайн загрузки {FETCH_DEADLINE:.0f} с: отменено {len(pending)} источников")
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for url, task in tasks.items():
+        if task.cancelled():
+            results[url] = SourcePayload(url)
+        elif task.exception() is not None:
+            log("Ошибка загрузки " + url + ": " + str(task.exception())[:50])
+            results[url] = SourcePayload(url)
         else:
-            if '#' in config:
-                base_part, fragment = config.rsplit('#', 1)
-                existing_fragment = urllib.parse.unquote(fragment)
-                
-                flag = ""
-                flag_match = re.search(r'[\U0001F1E6-\U0001F1FF]{2}', existing_fragment)
-                if flag_match:
-                    flag = flag_match.group(0) + " "
-                
-                config_type = "CONFIG"
-                if config.startswith("ssr://"):
-                    config_type = "SSR"
-                elif config.startswith("tuic://"):
-                    config_type = "TUIC"
-                elif config.startswith("hysteria://"):
-                    config_type = "HYSTERIA"
-                elif config.startswith("hysteria2://"):
-                    config_type = "HYSTERIA2"
-                
-                new_name = f"{number}. {flag}{config_type} | TG: @wlrustg"
-                new_fragment = urllib.parse.quote(new_name, safe='')
-                
-                return f"{base_part}#{new_fragment}"
+            results[url] = task.result()
+    return results
+
+def fetch_all_sources(urls: list[str], known_digests: dict[str, str] | None = None) -> dict[str, SourcePayload]:
+    """Загружает все источники, результат упорядочен как urls"""
+    if not urls:
+        return {}
+    load_source_health()
+    payloads = asyncio.run(_fetch_sources_async(urls, known_digests or {}))
+    save_source_health(urls)
+    return payloads
+
+# Инкрементальное состояние: хэш тела и разобранные конфиги каждого источника
+SOURCE_STATE_FILE = os.environ.get("SOURCE_STATE_FILE", ".cache/sources_state.json")
+SOURCE_STATE_STATS = {"reused": 0, "mirrors": 0, "parsed": 0}
+
+def load_source_state() -> dict:
+    """Читает инкрементальное состояние источников: url -> {"digest", "configs"}
+
+    Состояние другой версии RECORD_VERSION отбрасывается целиком, источник с записями
+    неверной формы - по одному; такие источники загружаются и разбираются заново.
+    """
+    if not SOURCE_STATE_FILE:
+        return {}
+    try:
+        with open(SOURCE_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get("version") != RECORD_VERSION:
+        log("ℹ️ Состояние источников от другой версии разбора, источники будут разобраны заново")
+        return {}
+    sources = state.get("sources")
+    if not isinstance(sources, dict):
+        return {}
+    valid = {
+        url: entry for url, entry in sources.items()
+        if isinstance(entry, dict) and isinstance(entry.get("digest"), str) and isinstance(entry.get("configs"), list)
+        and all(ParsedConfig.is_record(record) for record in entry["configs"])
+    }
+    if len(valid) < len(sources):
+        log(f"⚠️  Повреждённое состояние у {len(sources) - len(valid)} источников, они будут разобраны заново")
+    return valid
+
+def save_source_state(state: dict):
+    """Сохраняет инкрементальное состояние источников"""
+    if not SOURCE_STATE_FILE:
+        return
+    try:
+        os.makedirs(os.path.dirname(SOURCE_STATE_FILE) or ".", exist_ok=True)
+        with open(SOURCE_STATE_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": RECORD_VERSION, "sources": state}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(SOURCE_STATE_FILE + ".tmp", SOURCE_STATE_FILE)
+    except OSError as e:
+        log(f"⚠️  Не удалось сохранить состояние источников: {str(e)[:100]}")
+
+def _payloads_to_parse(payloads: dict[str, SourcePayload], state: dict) -> list[str]:
+    """Источники, которые process_source_payloads будет разбирать, а не восстанавливать"""
+    urls = []
+    seen_digests = set()
+    for url, payload in payloads.items():
+        if not payload.digest:
+            continue
+        entry = state.get(url)
+        if (payload.digest not in seen_digests
+                and not (payload.complete and entry and entry.get("digest") == payload.digest)
+                and payload.lines is not None):
+            urls.append(url)
+        if payload.complete:
+            seen_digests.add(payload.digest)
+    return urls
+
+def process_source_payloads(payloads: dict[str, SourcePayload], state: dict) -> dict[str, list["ParsedConfig"]]:
+    """Разбирает загруженные источники, переиспользуя результаты неизменившихся
+
+    Источник с тем же хэшем тела, что в состоянии, восстанавливается из него без разбора;
+    источники-зеркала с одинаковым телом в одном запуске разбираются один раз.
+    """
+    results = {}
+    parsed_by_digest = {}
+    changed = False
+
+    # Строки всех изменившихся источников разбираются одной пачкой (в пуле процессов при PARSE_WORKERS > 1)
+    pending = _payloads_to_parse(payloads, state)
+    parsed_lines = parse_many([line for url in pending for line in payloads[url].lines])
+    parsed_by_url = {}
+    offset = 0
+    for url in pending:
+        parsed_by_url[url] = parsed_lines[offset:offset + len(payloads[url].lines)]
+        offset += len(payloads[url].lines)
+
+    for url, payload in payloads.items():
+        if not payload.digest:
+            results[url] = []
+            continue
+
+        entry = state.get(url)
+        note = ""
+        configs = None
+        if payload.digest in parsed_by_digest:
+            configs = parsed_by_digest[payload.digest]
+            SOURCE_STATE_STATS["mirrors"] += 1
+            note = " (зеркало)"
+        elif payload.complete and entry and entry.get("digest") == payload.digest:
+            try:
+                configs = [ParsedConfig.from_record(record) for record in entry["configs"]]
+                SOURCE_STATE_STATS["reused"] += 1
+                note = " (без изменений)"
+            except (KeyError, TypeError, ValueError) as e:
+                log(f"⚠️  Повреждённое состояние для {url}, разбор заново: {str(e)[:100]}")
+                del state[url]
+                entry = None
+                changed = True
+
+        if configs is None and payload.lines is None:
+            # Тело не читалось, а восстановить не из чего: без записи в состоянии
+            # следующий запуск загрузит источник целиком
+            log(f"⚠️  Нет сохранённого состояния для {url}")
+            results[url] = []
+            record_source(url, configs=0, reused=False)
+            continue
+        if configs is None:
+            if url in parsed_by_url:
+                configs = parsed_by_url[url]
             else:
-                config_type = "CONFIG"
-                if config.startswith("ssr://"):
-                    config_type = "SSR"
-                elif config.startswith("tuic://"):
-                    config_type = "TUIC"
-                elif config.startswith("hysteria://"):
-                    config_type = "HYSTERIA"
-                elif config.startswith("hysteria2://"):
-                    config_type = "HYSTERIA2"
-                
-                new_name = f"{number}. {config_type} | TG: @wlrustg"
-                new_fragment = urllib.parse.quote(new_name, safe='')
-                
-                return f"{config}#{new_fragment}"
-                
-    except Exception as e:
-        log(f"Ошибка добавления нумерации к конфигу: {str(e)[:100]}")
-        return config
+                configs = [parse_config(line) for line in payload.lines]
+            SOURCE_STATE_STATS["parsed"] += 1
 
+        if payload.complete:
+            parsed_by_digest[payload.digest] = configs
+            if not entry or entry.get("digest") != payload.digest:
+                state[url] = {"digest": payload.digest, "configs": [config.to_record() for config in configs]}
+                changed = True
+        results[url] = configs
+        record_source(url, configs=len(configs), reused=bool(note))
 
-def extract_existing_info(config: str) -> tuple:
-    """Извлекает существующие информацию из конфига: номер, флаг, вотермарк"""
-    config_clean = config.strip()
-    
-    number_match = re.search(r'(?:#?\s*)(\d{1,3})(?:\.|\s+|$)', config_clean)
-    number = number_match.group(1) if number_match else None
-    
-    flag_match = re.search(r'[\U0001F1E6-\U0001F1FF]{2}', config_clean)
-    flag = flag_match.group(0) if flag_match else ""
-    
-    tg_match = re.search(r'TG\s*:\s*@wlrustg', config_clean, re.IGNORECASE)
-    tg = tg_match.group(0) if tg_match else ""
-    
-    return number, flag, tg
+        try:
+            repo_name = url.split('/')[3] if '/' in url else 'unknown'
+        except:
+            repo_name = 'unknown'
+        log("✅ " + repo_name + ": " + str(len(configs)) + " конфигов" + note, source=url)
 
+    # Источники, убранные из URLS, больше не храним
+    for url in list(state):
+        if url not in payloads:
+            del state[url]
+            changed = True
+    if changed:
+        save_source_state(state)
+    return results
 
-def process_configs_with_numbering(configs: list[str]) -> list[str]:
-    """Добавляет нумерацию и вотермарк в поле name конфигов"""
-    processed_configs = []
-    
-    for i, config in enumerate(configs, 1):
-        existing_number, _, existing_tg = extract_existing_info(config)
-        
-        # Если уже есть номер и наш вотермарк, не меняем
-        if existing_number and "TG: @wlrustg" in config:
-            processed_configs.append(config)
+# DNS-резолвинг доменных серверов для whitelist
+RESOLVE_HOSTNAMES = os.environ.get("RESOLVE_HOSTNAMES", "1") == "1"
+# Адрес DNS-резолвера "host:port"; пусто - первый nameserver из /etc/resolv.conf
+DNS_RESOLVER = os.environ.get("DNS_RESOLVER", "")
+DNS_CONCURRENCY = int(os.environ.get("DNS_CONCURRENCY", "64"))
+DNS_TIMEOUT = float(os.environ.get("DNS_TIMEOUT", "2"))
+DNS_CACHE_FILE = os.environ.get("DNS_CACHE_FILE", ".cache/dns.json")
+# Границы TTL кэша: отрицательные ответы и системный резолвер без TTL
+DNS_MIN_TTL = 60
+DNS_MAX_TTL = 24 * 3600
+DNS_NEGATIVE_TTL = 600
+DNS_DEFAULT_TTL = 1800
+DNS_STATS = {"hosts": 0, "hits": 0, "misses": 0, "failures": 0}
+
+_DNS_TYPE_A = 1
+_DNS_TYPE_AAAA = 28
+
+def _system_nameserver() -> tuple[str, int] | None:
+    """Возвращает первый nameserver из /etc/resolv.conf"""
+    try:
+        with open("/etc/resolv.conf", "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    return parts[1], 53
+    except OSError:
+        pass
+    return None
+
+def _dns_resolver_address() -> tuple[str, int] | None:
+    if not DNS_RESOLVER:
+        return _system_nameserver()
+    host, sep, port = DNS_RESOLVER.rpartition(":")
+    if sep and port.isdigit() and host:
+        return host.strip("[]"), int(port)
+    return DNS_RESOLVER, 53
+
+def _build_dns_query(query_id: int, hostname: str, qtype: int) -> bytes:
+    """Собирает DNS-запрос с одним вопросом и флагом рекурсии"""
+    labels = b"".join(
+        len(label).to_bytes(1, "big") + label
+        for label in hostname.rstrip(".").encode("idna").split(b".")
+    )
+    header = query_id.to_bytes(2, "big") + b"\x01\x00" + b"\x00\x01" + b"\x00\x00" * 3
+    return header + labels + b"\x00" + qtype.to_bytes(2, "big") + b"\x00\x01"
+
+def _skip_dns_name(message: bytes, offset: int) -> int:
+    """Пропускает имя (с учётом сжатия) и возвращает смещение после него"""
+    while True:
+        length = message[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+
+def _parse_dns_response(message: bytes, query_id: int) -> tuple[int, list[str], int, bool] | None:
+    """Разбирает ответ: (rcode, адреса A/AAAA, минимальный TTL, обрезан ли) или None для чужого ответа
+
+    Обрезанный ответ (флаг TC) может содержать не все адреса и не должен кэшироваться.
+    """
+    if len(message) < 12 or int.from_bytes(message[0:2], "big") != query_id:
+        return None
+    truncated = bool(message[2] & 0x02)
+    rcode = message[3] & 0x0F
+    qdcount = int.from_bytes(message[4:6], "big")
+    ancount = int.from_bytes(message[6:8], "big")
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_dns_name(message, offset) + 4
+
+    addresses = []
+    ttl = DNS_MAX_TTL
+    for _ in range(ancount):
+        offset = _skip_dns_name(message, offset)
+        rtype = int.from_bytes(message[offset:offset + 2], "big")
+        record_ttl = int.from_bytes(message[offset + 4:offset + 8], "big")
+        rdlength = int.from_bytes(message[offset + 8:offset + 10], "big")
+        rdata = message[offset + 10:offset + 10 + rdlength]
+        offset += 10 + rdlength
+        if rtype == _DNS_TYPE_A and rdlength == 4:
+            addresses.append(socket.inet_ntop(socket.AF_INET, rdata))
+        elif rtype == _DNS_TYPE_AAAA and rdlength == 16:
+            addresses.append(socket.inet_ntop(socket.AF_INET6, rdata))
         else:
-            # Добавляем нумерацию
-            processed = add_numbering_to_name(config, i)
-            processed_configs.append(processed)
-    
-    return processed_configs
+            continue
+        ttl = min(ttl, record_ttl)
+    return rcode, addresses, ttl, truncated
 
 
-def merge_and_deduplicate(all_configs: list[str]) -> tuple[list[str], list[str]]:
-    """Объединяет и дедуплицирует конфиги, возвращает два списка: все конфиги и whitelist конфиги"""
-    if not all_configs:
-        return [], []
-    
-    seen_full = set()
-    seen_config_keys = set()  # Уникальные ключи конфигов (по параметрам)
-    unique_configs = []
-    whitelist_configs = []
-    duplicate_count = 0
-    
-    for config in all_configs:
-        config = config.strip()
-        if not config or config in seen_full:
-            duplicate_count += 1
+class _DnsQueryProtocol(asyncio.DatagramProtocol):
+    """Отправляет один DNS-запрос по UDP и ждёт ответ с нужным id"""
+
+    def __init__(self, query: bytes, query_id: int, answer: asyncio.Future):
+        self.query = query
+        self.query_id = query_id
+        self.answer = answer
+
+    def connection_made(self, transport):
+        transport.sendto(self.query)
+
+    def datagram_received(self, data, addr):
+        try:
+            parsed = _parse_dns_response(data, self.query_id)
+        except (IndexError, ValueError):
+            parsed = None
+        if parsed is not None and not self.answer.done():
+            self.answer.set_result(parsed)
+
+    def error_received(self, exc):
+        if not self.answer.done():
+            self.answer.set_exception(exc)
+
+
+async def _dns_query(resolver: tuple[str, int], hostname: str, qtype: int) -> tuple[int, list[str], int, bool]:
+    loop = asyncio.get_running_loop()
+    query_id = int.from_bytes(os.urandom(2), "big")
+    answer = loop.create_future()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _DnsQueryProtocol(_build_dns_query(query_id, hostname, qtype), query_id, answer),
+        remote_addr=resolver,
+    )
+    try:
+        return await asyncio.wait_for(answer, timeout=DNS_TIMEOUT)
+    finally:
+        transport.close()
+
+async def _system_resolve(hostname: str) -> tuple[list[str], int]:
+    """Резолвит имя через getaddrinfo; TTL системный резолвер не сообщает"""
+    loop = asyncio.get_running_loop()
+    infos = await asyncio.wait_for(
+        loop.getaddrinfo(hostname, None, type=socket.SOCK_STREAM), timeout=DNS_TIMEOUT
+    )
+    return sorted({info[4][0] for info in infos}), DNS_DEFAULT_TTL
+
+async def _resolve_one(hostname: str, resolver: tuple[str, int] | None) -> tuple[list[str], int] | None:
+    """Резолвит одно имя: (адреса, TTL) или None при сбое резолвера"""
+    if resolver is None:
+        return await _system_resolve(hostname)
+
+    answers = await asyncio.gather(
+        _dns_query(resolver, hostname, _DNS_TYPE_A),
+        _dns_query(resolver, hostname, _DNS_TYPE_AAAA),
+        return_exceptions=True,
+    )
+    addresses = []
+    ttl = DNS_MAX_TTL
+    answered = False
+    for answer in answers:
+        if isinstance(answer, BaseException):
             continue
-        seen_full.add(config)
-        
-        # Генерируем уникальный ключ конфига на основе его параметров
-        config_key = generate_config_key(config)
-        if config_key and config_key in seen_config_keys:
-            duplicate_count += 1
+        rcode, records, record_ttl, truncated = answer
+        if truncated:
+            # По TCP стаб-резолвер не ходит: полный ответ даст системный резолвер
+            return await _system_resolve(hostname)
+        # NOERROR и NXDOMAIN - окончательные ответы, остальное (SERVFAIL и т.п.) не кэшируем
+        if rcode not in (0, 3):
             continue
-        seen_config_keys.add(config_key)
-        
-        unique_configs.append(config)
-        
-        # Проверка на whitelist (по IP)
-        host_port = extract_host_port(config)
-        if host_port:
-            host = host_port[0]
+        answered = True
+        if records:
+            addresses.extend(records)
+            ttl = min(ttl, record_ttl)
+    if not answered:
+        return None
+    if not addresses:
+        return [], DNS_NEGATIVE_TTL
+    return addresses, ttl
+
+def _load_dns_cache() -> dict:
+    if not DNS_CACHE_FILE:
+        return {}
+    try:
+        with open(DNS_CACHE_FILE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {host: entry for host, entry in cache.items() if entry.get("expires", 0) > now}
+
+def _save_dns_cache(cache: dict):
+    if not DNS_CACHE_FILE:
+        return
+    try:
+        os.makedirs(os.path.dirname(DNS_CACHE_FILE) or ".", exist_ok=True)
+        with open(DNS_CACHE_FILE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(DNS_CACHE_FILE + ".tmp", DNS_CACHE_FILE)
+    except OSError as e:
+        log(f"⚠️  Не удалось сохранить DNS-кэш: {str(e)[:100]}")
+
+async def _resolve_many(hostnames: list[str], resolver: tuple[str, int] | None) -> dict[str, tuple[list[str], int] | None]:
+    limit = asyncio.Semaphore(DNS_CONCURRENCY)
+
+    async def resolve(hostname: str):
+        async with limit:
             try:
-                ip = ipaddress.ip_address(host)
-                if ip.version == 4 and is_ip_in_subnets(str(ip)):
-                    whitelist_configs.append(config)
-            except ValueError:
-                pass
-    
-    if duplicate_count > 0:
-        log(f"🔍 Удалено {duplicate_count} дубликатов (полных или по параметрам)")
-    
-    return unique_configs, whitelist_configs
+                return hostname, await _resolve_one(hostname, resolver)
+            except (OSError, UnicodeError, asyncio.TimeoutError):
+                return hostname, None
+
+    return dict(await asyncio.gather(*(resolve(hostname) for hostname in hostnames)))
+
+def resolve_hostnames(hostnames: Iterable[str]) -> dict[str, list[str]]:
+    """Резолвит уникальные доменные имена параллельно, с TTL-кэшем между запусками"""
+    unique_hosts = sorted({host.lower().rstrip(".") for host in hostnames if host})
+    cache = _load_dns_cache()
+    result = {}
+    to_resolve = []
+    for host in unique_hosts:
+        if host in cache:
+            result[host] = cache[host]["addrs"]
+        else:
+            to_resolve.append(host)
+    DNS_STATS["hosts"] += len(unique_hosts)
+    DNS_STATS["hits"] += len(unique_hosts) - len(to_resolve)
+    DNS_STATS["misses"] += len(to_resolve)
+
+    if to_resolve:
+        resolved = asyncio.run(_resolve_many(to_resolve, _dns_resolver_address()))
+        now = time.time()
+        for host, answer in resolved.items():
+            if answer is None:
+                DNS_STATS["failures"] += 1
+                result[host] = []
+                continue
+            addresses, ttl = answer
+            ttl = max(DNS_MIN_TTL, min(DNS_MAX_TTL, ttl))
+            cache[host] = {"addrs": addresses, "expires": now + ttl}
+            result[host] = addresses
+        _save_dns_cache(cache)
+    return result
+
+def extend_whitelist_by_dns(unique_configs: list[ParsedConfig], whitelist_configs: list[ParsedConfig]) -> list[ParsedConfig]:
+    """Добавляет в whitelist конфиги с доменами, которые резолвятся в разрешенные подсети"""
+    by_host = {}
+    for parsed in unique_configs:
+        host_port = parsed.host_port
+        if host_port and ip_to_int(host_port[0]) is None and "." in host_port[0]:
+            by_host[id(parsed)] = host_port[0].lower().rstrip(".")
+    if not by_host:
+        return whitelist_configs
+
+    resolved = resolve_hostnames(by_host.values())
+    index = get_whitelist_index()
+    allowed_hosts = {host for host, addresses in resolved.items() if any(index.classify(addresses))}
+
+    in_whitelist = {id(parsed) for parsed in whitelist_configs}
+    extended = [
+        parsed for parsed in unique_configs
+        if id(parsed) in in_whitelist or by_host.get(id(parsed)) in allowed_hosts
+    ]
+    log(f"🌐 DNS: {DNS_STATS['hosts']} доменов (кэш: {DNS_STATS['hits']} попаданий, "
+        f"{DNS_STATS['misses']} запросов, {DNS_STATS['failures']} ошибок), "
+        f"в whitelist добавлено {len(extended) - len(whitelist_configs)} конфигов")
+    return extended
 
-def save_to_file(configs: list[str], file_type: str, description: str = "", add_numbering: bool = False):
-    """Сохраняет конфиги в файл с динамическим именем"""
+
+def save_to_file(configs: "list[str | ParsedConfig]", file_type: str, description: str = "",
+                 add_numbering: bool = False) -> list[str] | None:
+    """Сохраняет конфиги в файл с динамическим именем
+
+    Возвращает строки конфигов в том виде, как они записаны, или None при ошибке.
+    """
     if file_type == "merged":
         filepath = PATHS["merged"]
         filename = os.path.basename(filepath)
@@ -822,7 +987,8 @@ def save_to_file(configs: list[str], file_type: str, description: str = "", add_
     try:
         os.makedirs(PATHS["base_dir"], exist_ok=True)
         
-        with open(filepath, "w", encoding="utf-8", errors="replace") as f:
+        # Сжатые копии (merged.txt.gz и т.п.) пишутся тем же проходом
+        with open_output(filepath) as f:
             if 'Whitelist' in description:
                f.write("#profile-title: WL RUS (wl.txt)\n")
             else:
@@ -831,7 +997,7 @@ def save_to_file(configs: list[str], file_type: str, description: str = "", add_
         
             f.write("#profile-update-interval: 24\n")
             f.write("#announce: Сервера из подписки должны использоваться ТОЛЬКО при белых списках!\n")
-            f.write(f"# Обновлено: {offset}\n")
+            f.write(f"# Обновлено: {run_timestamp()}\n")
             f.write(f"# Всего конфигов: {len(configs)}\n")
             f.write("#" * 50 + "\n\n")
             
@@ -841,127 +1007,21 @@ def save_to_file(configs: list[str], file_type: str, description: str = "", add_
             else:
                 processed_configs = configs
             
-            for config in processed_configs:
-                f.write(config + "\n")
+            lines = [str(config) for config in processed_configs]
+            for line in lines:
+                f.write(line + "\n")
         
         log(f"💾 Сохранено {len(configs)} конфигов в {filename}")
+        variants = compressed_variants(filepath)
+        if variants:
+            size = os.path.getsize(filepath)
+            sizes = ", ".join(f"{encoding} {os.path.getsize(path) / 1024:.0f} КБ" for encoding, path in variants.items())
+            log(f"🗜️  {filename}: {size / 1024:.0f} КБ → {sizes}")
+        return lines
         
     except Exception as e:
         log(f"Ошибка сохранения файла {filename}: {str(e)}")
-
-def upload_to_github(filename: str, remote_path: str = None, branch: str = "main"):
-    """Загружает файл на GitHub в указанную ветку"""
-    if not REPO:
-        log("Пропускаю загрузку на GitHub (нет подключения)")
-        return
-    
-    if not os.path.exists(filename):
-        log(f"Файл {filename} не найден для загрузки")
-        return
-    
-    try:
-        # Читаем файл в бинарном режиме, затем декодируем
-        with open(filename, "rb") as f:
-            binary_content = f.read()
-        
-        # Декодируем содержимое с обработкой ошибок
-        try:
-            content = binary_content.decode("utf-8")
-        except UnicodeDecodeError:
-            # Если не удается декодировать как UTF-8, пробуем другие кодировки
-            log(f"⚠️  Ошибка декодирования UTF-8 в файле {filename}, пробую другие кодировки...")
-            try:
-                content = binary_content.decode("utf-8-sig")  # UTF-8 с BOM
-            except UnicodeDecodeError:
-                try:
-                    content = binary_content.decode("cp1251")  # Windows-1251
-                except UnicodeDecodeError:
-                    try:
-                        content = binary_content.decode("latin-1")  # Latin-1
-                    except UnicodeDecodeError:
-                        # В крайнем случае игнорируем ошибки
-                        content = binary_content.decode("utf-8", errors="replace")
-                        log(f"⚠️  Использована замена некорректных символов в файле {filename}")
-        
-        if remote_path is None:
-            remote_path = filename
-        
-        try:
-            file_in_repo = REPO.get_contents(remote_path, ref=branch)
-            current_sha = file_in_repo.sha
-            
-            remote_content = file_in_repo.decoded_content.decode("utf-8", errors="replace")
-            if remote_content == content:
-                log(f"Файл {remote_path} не изменился в ветке {branch}")
-                return
-            
-            REPO.update_file(
-                path=remote_path,
-                message="🤖 Авто-обновление: " + offset,
-                content=content,
-                sha=current_sha,
-                branch=branch
-            )
-            log(f"⬆️ Файл {remote_path} обновлён на GitHub в ветке {branch}")
-            
-        except GithubException as e:
-            if e.status == 404:
-                REPO.create_file(
-                    path=remote_path,
-                    message="🤖 Первое создание: " + offset,
-                    content=content,
-                    branch=branch
-                )
-                log(f"🆕 Файл {remote_path} создан на GitHub в ветке {branch}")
-            else:
-                error_msg = e.data.get('message', str(e))
-                log("Ошибка GitHub: " + error_msg)
-                
-    except Exception as e:
-        log("Ошибка при загрузке на GitHub: " + str(e))
-
-def update_readme(total_configs: int, wl_configs_count: int):
-    """Обновляет README.md со статистикой"""
-    if not REPO:
-        log("Пропускаю обновление README (нет подключения)")
-        return
-    
-    try:
-        try:
-            readme_file = REPO.get_contents("README.md")
-            old_content = readme_file.decoded_content.decode("utf-8")
-        except GithubException:
-            old_content = "# Объединенные конфиги VPN\n\n"
-        
-        # Формируем ссылки на файлы
-        raw_url_merged = "https://github.com/" + REPO_NAME + "/raw/main/merged.txt"
-        raw_url_wl = "https://github.com/" + REPO_NAME + "/raw/main/githubmirror/wl.txt"
-        raw_url_selected = "https://github.com/" + REPO_NAME + "/raw/main/githubmirror/selected.txt"
-        
-        # Разделяем время и дату
-        time_parts = offset.split(" | ")
-        time_part = time_parts[0] if len(time_parts) > 0 else ""
-        date_part = time_parts[1] if len(time_parts) > 1 else ""
-        
-        new_section = "\n## 📊 Статус обновления\n\n"
-        new_section += "| Файл | Описание | Конфигов | Время обновления | Дата |\n"
-        new_section += "|------|----------|----------|------------------|------|\n"
-        new_section += f"| [`merged.txt`]({raw_url_merged}) | Все конфиги из {len(URLS)} источников | {total_configs} | {time_part} | {date_part} |\n"
-        new_section += f"| [`wl.txt`]({raw_url_wl}) | Только конфиги из {len(WHITELIST_SUBNETS)} подсетей | {wl_configs_count} | {time_part} | {date_part} |\n"
-        new_section += f"| [`selected.txt`]({raw_url_selected}) | Отборные админами конфиги, самый надежный список | не знаю | {time_part} | {date_part} |\n\n"
-        
-        # Обновляем файл
-        sha = readme_file.sha if 'readme_file' in locals() else None
-        REPO.update_file(
-            path="README.md",
-            message="📝 Обновление README: " + str(total_configs) + " конфигов, " + str(wl_configs_count) + " в whitelist",
-            content=new_section,
-            sha=sha
-        )
-        log("📝 README.md обновлён")
-        
-    except Exception as e:
-        log("Ошибка обновления README: " + str(e))
+        return None
 
 def process_selected_file():
     """Обрабатывает файл selected.txt с ручными серверами, включая дедупликацию"""
@@ -998,11 +1058,7 @@ def process_selected_file():
             elif stripped.startswith('#'):
                 manual_comments.append(stripped)
             else:
-                if any(stripped.startswith(p) for p in ['vmess://', 'vless://', 'trojan://', 
-                                                         'ss://', 'ssr://', 'tuic://', 
-                                                         'hysteria://', 'hysteria2://']):
-                    configs.append((len(configs), stripped))
-                elif '@' in stripped and ':' in stripped and stripped.count(':') >= 2:
+                if is_config_line(stripped):
                     configs.append((len(configs), stripped))
         
         if configs:
@@ -1023,15 +1079,16 @@ def process_selected_file():
                     seen_full.add(config)
                     
                     # Генерируем уникальный ключ конфига на основе его параметров
-                    config_key = generate_config_key(config)
-                    if config_key and config_key in seen_config_keys:
+                    parsed = parse_config(config)
+                    if parsed.key and parsed.key in seen_config_keys:
                         duplicates_count += 1
                         continue
-                    seen_config_keys.add(config_key)
+                    seen_config_keys.add(parsed.key)
                     
-                    unique_configs_with_index.append((idx, config))
+                    unique_configs_with_index.append((idx, parsed))
                 
                 if duplicates_count > 0:
+                    count_duplicates("selected", duplicates_count)
                     log(f"🔍 Найдено {duplicates_count} дубликатов в selected.txt")
                 
                 # Обрабатываем конфиги с нумерацией
@@ -1079,340 +1136,39 @@ def process_selected_file():
         log("ℹ️ Файл selected.txt не найден")
         return []
 
-def filter_excluded_configs(configs, exclude_patterns=None, settings=None, excluded_file=None):
-    """
-    Фильтрует конфиги по паттернам исключения
-    """
-    if exclude_patterns is None:
-        exclude_patterns = EXCLUDE_PATTERNS
-    
-    if settings is None:
-        settings = EXCLUDE_SETTINGS.copy()
-    else:
-        settings = settings.copy()
-    
-    if excluded_file:
-        settings["excluded_file"] = excluded_file
-    
-    filtered_configs = []
-    excluded_configs = []
-    exclusion_stats = {}
-    
-    # Подготовка паттернов (регистр)
-    if not settings.get("case_sensitive", False):
-        exclude_patterns = [p.lower() for p in exclude_patterns]
-    
-    for config in configs:
-        config_for_check = config if settings.get("case_sensitive", False) else config.lower()
-        excluded = False
-        reason = ""
-        
-        # Проверка каждого паттерна
-        for pattern in exclude_patterns:
-            # Разные типы проверок в зависимости от паттерна
-            if pattern.startswith("#"):  # Исключение по remark
-                remark_pattern = pattern[1:]  # Убираем #
-                if f"#{remark_pattern}" in config_for_check:
-                    excluded = True
-                    reason = f"remark содержит: {pattern}"
-                    break
-                    
-            elif pattern.startswith("@"):  # Исключение по адресу
-                addr_pattern = pattern[1:]  # Убираем @
-                # Ищем адрес после @ и до : или ?
-                if f"@{addr_pattern}" in config_for_check:
-                    excluded = True
-                    reason = f"адрес содержит: {pattern}"
-                    break
-                    
-            elif pattern.startswith("/"):  # Исключение по path
-                if f"path={pattern}" in config_for_check or f"path%3D{pattern}" in config_for_check:
-                    excluded = True
-                    reason = f"path содержит: {pattern}"
-                    break
-                    
-            else:  # Общая проверка по подстроке
-                if pattern in config_for_check:
-                    excluded = True
-                    reason = f"содержит: {pattern}"
-                    break
-        
-        if excluded:
-            excluded_configs.append(config)
-            # Статистика по причинам
-            if reason in exclusion_stats:
-                exclusion_stats[reason] += 1
-            else:
-                exclusion_stats[reason] = 1
-        else:
-            filtered_configs.append(config)
-    
-    # Вывод статистики
-    if settings.get("log_excluded", True):
-        log(f"🚫 Фильтрация исключений:")
-        log(f"   Всего конфигов до фильтрации: {len(configs)}")
-        log(f"   Исключено: {len(excluded_configs)}")
-        log(f"   Осталось после исключений: {len(filtered_configs)}")
-        
-        if exclusion_stats:
-            log(f"   Причины исключений:")
-            for reason, count in exclusion_stats.items():
-                log(f"     • {reason}: {count}")
-    
-    # Сохранение исключенных конфигов
-    if settings.get("save_excluded", True) and excluded_configs:
-        excluded_filename = settings.get("excluded_file", "excluded.txt")
-        with open(excluded_filename, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(excluded_configs))
-        log(f"💾 Исключенные конфиги сохранены в {excluded_filename} ({len(excluded_configs)} шт.)")
-    
-    return filtered_configs, excluded_configs
-
-def upload_to_cloud_ru(file_path: str, s3_path: str = None):
-    """Загружает файл в bucket Cloud.ru по S3 API"""
-    if not all([CLOUD_RU_ENDPOINT, CLOUD_RU_ACCESS_KEY, CLOUD_RU_SECRET_KEY, CLOUD_RU_BUCKET]):
-        log("❌ Пропускаю загрузку в Cloud.ru: отсутствуют необходимые переменные окружения")
-        return
-    
-    try:
-        # Пробуем импортировать boto3
-        try:
-            import boto3
-            from botocore.config import Config
-        except ImportError:
-            log("❌ Модуль boto3 не установлен. Установите: pip install boto3")
-            return
-        
-        if not os.path.exists(file_path):
-            log(f"❌ Файл {file_path} не найден для загрузки в Cloud.ru")
-            return
-        
-        # Определяем имя файла в bucket
-        if s3_path is None:
-            s3_path = os.path.basename(file_path)
-        
-        log(f"☁️  Загружаю {file_path} в Cloud.ru bucket {CLOUD_RU_BUCKET} как {s3_path}")
-        
-        # Настройка клиента S3 для Cloud.ru
-        s3_client = boto3.client(
-            's3',
-            endpoint_url=CLOUD_RU_ENDPOINT,
-            aws_access_key_id=CLOUD_RU_ACCESS_KEY,
-            aws_secret_access_key=CLOUD_RU_SECRET_KEY,
-            region_name=CLOUD_RU_REGION,
-            config=Config(
-                signature_version='s3v4',
-                s3={'addressing_style': 'path'}
-            )
-        )
-        
-        # Загружаем файл
-        with open(file_path, 'rb') as f:
-            s3_client.put_object(
-                Bucket=CLOUD_RU_BUCKET,
-                Key=s3_path,
-                Body=f,
-                ContentType='text/plain; charset=utf-8',
-            )
-        
-        log(f"✅ Файл успешно загружен в Cloud.ru: {s3_path}")
-        
-        # Формируем ссылку на файл
-        file_url = f"{CLOUD_RU_ENDPOINT}/{CLOUD_RU_BUCKET}/{s3_path}"
-        log(f"🔗 Ссылка на файл: {file_url}")
-        
-    except Exception as e:
-        error_msg = str(e)
-        # Более подробное логирование ошибки
-        if "AuthorizationHeaderMalformed" in error_msg:
-            log(f"❌ Ошибка авторизации Cloud.ru: неверный регион или endpoint. Убедитесь, что регион: {CLOUD_RU_REGION}")
-        else:
-            log(f"❌ Ошибка при загрузке в Cloud.ru: {error_msg[:200]}")
-        
-def upload_to_gitverse(filename: str, remote_path: str = None):
-    """Загружает файл на GitVerse через API с корректным версионированием"""
-    if not GITVERSE_TOKEN:
-        log("❌ Пропускаю загрузку на GitVerse: отсутствует токен")
-        return
-    
-    if not os.path.exists(filename):
-        log(f"❌ Файл {filename} не найден для загрузки на GitVerse")
-        return
-    
-    try:
-        # 1. Чтение файла
-        with open(filename, "r", encoding="utf-8") as f:
-            content = f.read()
-        
-        remote_path = remote_path or os.path.basename(filename)
-        
-        # 2. Определение базового URL и первичных заголовков
-        base_url = "https://api.gitverse.ru"
-        
-        # 3. ОСНОВНОЕ ИСПРАВЛЕНИЕ: правильный формат Accept-заголовка
-        primary_headers = {
-            "Authorization": f"Bearer {GITVERSE_TOKEN}",
-            "Accept": "application/vnd.gitverse.object+json;version=1",  # <-- ИСПРАВЛЕНО
-            "Content-Type": "application/json"
-        }
-        
-        # 4. Проверка доступности API и получение актуальной версии
-        log(f"🔍 Проверяю доступ к API GitVerse...")
-        latest_version = None
-        
-        try:
-            test_response = requests.get(
-                f"{base_url}/user",
-                headers=primary_headers,
-                timeout=10
-            )
-            
-            # Если получили 400, возможно, версия устарела
-            if test_response.status_code == 400:
-                latest_version = test_response.headers.get('Gitverse-Api-Latest-Version')
-                if latest_version:
-                    log(f"⚠️  Версия 1 устарела. Актуальная версия: {latest_version}")
-                    # Обновляем заголовок с актуальной версией
-                    primary_headers["Accept"] = f"application/vnd.gitverse.object+json;version={latest_version}"
-                    
-                    # Повторяем проверку с новой версией
-                    test_response = requests.get(
-                        f"{base_url}/user",
-                        headers=primary_headers,
-                        timeout=10
-                    )
-            
-            if test_response.status_code == 200:
-                user_info = test_response.json()
-                log(f"✅ Аутентифицирован как: {user_info.get('login', 'Unknown')}")
-                log(f"✅ Версия API: {primary_headers['Accept'].split('version=')[1]}")
-            elif test_response.status_code in [401, 403]:
-                log(f"❌ Ошибка доступа ({test_response.status_code}). Проверьте токен.")
-                return
-            else:
-                log(f"⚠️  Неожиданный ответ от API: {test_response.status_code}")
-                
-        except requests.exceptions.RequestException as e:
-            log(f"❌ Ошибка подключения: {str(e)[:100]}")
-            return
-        
-        # 5. Формируем URL для работы с файлом (согласно п.6 документации)
-        content_url = f"{base_url}/repos/{GITVERSE_REPO_OWNER}/{GITVERSE_REPO_NAME}/contents/{remote_path}"
-        
-        # 6. Кодируем содержимое
-        content_b64 = base64.b64encode(content.encode('utf-8')).decode('utf-8')
-        
-        # 7. Проверяем существование файла и получаем SHA
-        sha = None
-        try:
-            params = {'ref': GITVERSE_BRANCH} if GITVERSE_BRANCH else {}
-            get_response = requests.get(
-                content_url,
-                headers=primary_headers,
-                params=params,
-                timeout=10
-            )
-            
-            if get_response.status_code == 200:
-                existing_file = get_response.json()
-                sha = existing_file.get('sha', '')
-                log(f"📄 Файл существует. SHA: {sha[:8]}...")
-            elif get_response.status_code != 404:
-                log(f"⚠️  Не удалось проверить файл ({get_response.status_code})")
-                
-        except requests.exceptions.RequestException:
-            pass  # Пропускаем ошибку проверки
-        
-        # 8. Подготовка данных для PUT запроса
-        data = {
-            "message": f"🤖 Авто-обновление: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            "content": content_b64,
-        }
-        
-        if GITVERSE_BRANCH:
-            data["branch"] = GITVERSE_BRANCH
-        if sha:
-            data["sha"] = sha  # Обязательно для обновления существующего файла
-        
-        # 9. Выполняем основной запрос (PUT)
-        log(f"📤 {'Обновляю' if sha else 'Создаю'} файл '{remote_path}'...")
-        try:
-            put_response = requests.put(content_url, headers=primary_headers, json=data, timeout=15)
-            
-            if put_response.status_code in [200, 201]:
-                action = "обновлён" if sha else "создан"
-                log(f"✅ Файл успешно {action}!")
-                
-                # Проверяем, не устарела ли используемая версия API
-                if put_response.headers.get('Gitverse-Api-Deprecation') == 'true':
-                    latest = put_response.headers.get('Gitverse-Api-Latest-Version')
-                    decommission = put_response.headers.get('Gitverse-Api-Decommissioning')
-                    log(f"⚠️  ВНИМАНИЕ: Используемая версия API устарела!")
-                    log(f"    Актуальная версия: {latest}")
-                    log(f"    Отключение: {decommission}")
-                    
-            elif put_response.status_code == 400:
-                error_text = put_response.text[:200]
-                log(f"❌ Ошибка 400: {error_text}")
-                
-                # Если в ответе есть указание на последнюю версию
-                latest_in_response = put_response.headers.get('Gitverse-Api-Latest-Version')
-                if latest_in_response and latest_in_response != latest_version:
-                    log(f"🔄 Обнаружена новая актуальная версия: {latest_in_response}")
-                    
-            elif put_response.status_code == 403:
-                log(f"❌ Ошибка 403: Доступ запрещён")
-                log(f"   Проверьте:")
-                log(f"   1. Существует ли репозиторий '{GITVERSE_REPO_OWNER}/{GITVERSE_REPO_NAME}'")
-                log(f"   2. Имеет ли токен права на запись (scope 'repo' или 'write:repo')")
-                log(f"   Полный ответ: {put_response.text[:300]}")
-                
-            elif put_response.status_code == 409:
-                log(f"❌ Конфликт: SHA файла изменился. Обновите локальный SHA.")
-                
-            else:
-                log(f"❌ Ошибка {put_response.status_code}: {put_response.text[:200]}")
-                
-        except requests.exceptions.RequestException as e:
-            log(f"❌ Сетевая ошибка: {str(e)[:100]}")
-            
-    except Exception as e:
-        log(f"❌ Общая ошибка: {str(e)}")
-    
 def main():
     """Основная функция"""
 
+    log(f"📋 ЛОГИ ВЫПОЛНЕНИЯ ({run_timestamp()})")
+    log(f"⏱️ Импорт модулей: {IMPORT_SECONDS * 1000:.0f} мс", stage="import", elapsed=round(IMPORT_SECONDS, 3))
+    record_stage("import", IMPORT_SECONDS)
     log("📥 Загрузка конфигов...")
     
     all_configs = []
-    max_workers = min(DEFAULT_MAX_WORKERS, len(URLS))
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {}
-        for url in URLS:
-            future = executor.submit(download_and_process_url, url)
-            futures[future] = url
-        
-        for future in concurrent.futures.as_completed(futures):
-            url = futures[future]
-            try:
-                configs = future.result(timeout=30)
-                if configs:
-                    all_configs.extend(configs)
-            except Exception as e:
-                error_msg = str(e)
-                if len(error_msg) > 50:
-                    error_msg = error_msg[:50]
-                log("Таймаут или ошибка для " + url + ": " + error_msg)
+    source_state = load_source_state()
+    with stage("fetch"):
+        payloads = fetch_all_sources(URLS, {url: entry.get("digest", "") for url, entry in source_state.items()})
+    with stage("parse"):
+        configs_by_source = process_source_payloads(payloads, source_state)
+        for configs in configs_by_source.values():
+            all_configs.extend(configs)
     
     log("📊 Скачано всего: " + str(len(all_configs)) + " конфигов")
+    log_http_cache_stats()
+    log_source_health()
+    if HEDGE_STATS["hedged"] or HEDGE_STATS["mirror_wins"]:
+        log(f"🔀 Резервных запросов: {HEDGE_STATS['hedged']}, получено с зеркал: {HEDGE_STATS['mirror_wins']}")
+    log(f"♻️ Инкрементально: {SOURCE_STATE_STATS['reused']} источников без изменений, "
+        f"{SOURCE_STATE_STATS['mirrors']} зеркал, {SOURCE_STATE_STATS['parsed']} разобрано заново")
     
     # 2. Обрабатываем selected.txt (ручные серверы)
     log("🔧 Обработка selected.txt...")
-    selected_configs = process_selected_file()
+    with stage("selected"):
+        selected_configs = process_selected_file()
     
     if not all_configs:
         log("❌ Не удалось загрузить ни одного конфига")
+        write_metrics()
         return
     
     # 3. Добавляем selected конфиги в общий список
@@ -1420,24 +1176,37 @@ def main():
     
     # 4. Дедупликация и сортировка по подсетям
     log("🔄 Дедупликация и фильтрация...")
-    unique_configs, whitelist_configs = merge_and_deduplicate(all_configs)
+    with stage("dedup"):
+        unique_configs, whitelist_configs = merge_and_deduplicate(all_configs)
+    if RESOLVE_HOSTNAMES:
+        with stage("dns"):
+            whitelist_configs = extend_whitelist_by_dns(unique_configs, whitelist_configs)
     log("🔄 После дедупликации: " + str(len(unique_configs)) + " конфигов")
     log("🛡️ Whitelist конфигов: " + str(len(whitelist_configs)))
     
+    # Каталог конфигов: поля, источники и время появления переживают запуск
+    if CATALOGUE_FILE:
+        with stage("catalogue"):
+            update_catalogue(
+                {**configs_by_source, SELECTED_SOURCE: [parse_config(config) for config in selected_configs]},
+                {parsed.key for parsed in whitelist_configs},
+            )
+    
     # 5. ФИЛЬТРАЦИЯ ИСКЛЮЧЕНИЙ - НОВЫЙ ЭТАП
     log("🚫 Применение списка исключений...")
     
-    # Фильтруем основной список (merged)
-    filtered_unique_configs, excluded_unique = filter_excluded_configs(
-        unique_configs, 
-        excluded_file="excluded_merged.txt"
-    )
-    
-    # Фильтруем whitelist список
-    filtered_whitelist_configs, excluded_whitelist = filter_excluded_configs(
-        whitelist_configs,
-        excluded_file="excluded_wl.txt"
-    )
+    with stage("exclusions"):
+        # Фильтруем основной список (merged) один раз - исключения помечаются в самих конфигах
+        filtered_unique_configs, excluded_unique = filter_excluded_configs(
+            unique_configs, 
+            excluded_file="excluded_merged.txt"
+        )
+        
+        # Whitelist - подмножество merged, поэтому используем уже проставленные пометки
+        filtered_whitelist_configs = [config for config in whitelist_configs if not config.excluded]
+        excluded_whitelist = [config for config in whitelist_configs if config.excluded]
+        if EXCLUDE_SETTINGS.get("save_excluded", True) and excluded_whitelist:
+            save_excluded_configs(excluded_whitelist, "excluded_wl.txt")
     
     # Обновляем переменные для дальнейшего использования
     unique_configs = filtered_unique_configs
@@ -1447,59 +1216,48 @@ def main():
     log(f"   • merged: {len(unique_configs)} конфигов (исключено {len(excluded_unique)})")
     log(f"   • whitelist: {len(whitelist_configs)} конфигов (исключено {len(excluded_whitelist)})")
     
+    # Проверка доступности: быстрые серверы в начало, недоступные - в конец
+    if PROBE_ENABLED:
+        log("📡 Проверка доступности серверов...")
+        with stage("probe"):
+            unique_configs, whitelist_configs = rank_by_probe(unique_configs, whitelist_configs)
+    
     # 6. Сохраняем локально
     os.makedirs("confs", exist_ok=True)
     
     # СОХРАНЯЕМ merged.txt С НУМЕРАЦИЕЙ (включая конфиги из selected.txt)
-    save_to_file(unique_configs, "merged", "Объединенные конфиги (после исключений)", add_numbering=True)
-    save_to_file(whitelist_configs, "wl", "Whitelist конфиги (после исключений)", add_numbering=True)
+    with stage("save"):
+        merged_lines = save_to_file(unique_configs, "merged", "Объединенные конфиги (после исключений)", add_numbering=True)
+        wl_lines = save_to_file(whitelist_configs, "wl", "Whitelist конфиги (после исключений)", add_numbering=True)
+        if SHARD_OUTPUTS:
+            write_shards(unique_configs)
+        if DELTA_OUTPUTS:
+            write_delta({"merged": (unique_configs, merged_lines), "wl": (whitelist_configs, wl_lines)})
     
-    # 7. Загружаем на GitHub
-    log("🌐 Загрузка на GitHub...")
-    upload_to_github(PATHS["merged"])
-    upload_to_github(PATHS["wl"])
-    upload_to_github(PATHS["selected"])
-    
-    # 8. Загружаем в Cloud.ru
-    log("☁️  Начинаю загрузку в Cloud.ru...")
-    files_to_upload = {
-        "merged.txt": PATHS["merged"],
-        "wl.txt": PATHS["wl"],
-        "selected.txt": PATHS["selected"]
-    }
-    
-    for s3_name, local_path in files_to_upload.items():
-        if os.path.exists(local_path):
-            upload_to_cloud_ru(local_path, s3_name)
-        else:
-            log(f"⚠️  Файл {local_path} не найден, пропускаю загрузку в Cloud.ru")
-
-    if GITVERSE_TOKEN:
-        log("🚀 Начинаю загрузку на GitVerse...")
-        gitverse_files = {
-            "merged.txt": PATHS["merged"],
-            "wl.txt": PATHS["wl"],
-            "selected.txt": PATHS["selected"]
-        }
-    
-        # Создаем сессию для повторного использования соединений
-        for remote_name, local_path in gitverse_files.items():
-            if os.path.exists(local_path):
-                upload_to_gitverse(local_path, remote_name)
-            else:
-                log(f"⚠️  Файл {local_path} не найден, пропускаю загрузку на GitVerse")
+    # 7. Публикуем параллельно: GitHub (файлы и README), Cloud.ru, GitVerse
+    if OFFLINE:
+        log("📴 Офлайн-режим: публикация пропущена")
     else:
-        log("ℹ️  Токен GitVerse не задан, пропускаю загрузку")
-    
-    # 9. Обновляем README
-    update_readme(len(unique_configs), len(whitelist_configs))
+        destinations = {
+            "GitHub": lambda: publish_to_github(len(unique_configs), len(whitelist_configs)),
+            "Cloud.ru": publish_to_cloud_ru,
+        }
+        if GITVERSE_TOKEN:
+            destinations["GitVerse"] = publish_to_gitverse
+        else:
+            log("ℹ️  Токен GitVerse не задан, пропускаю загрузку")
+        with stage("publish"):
+            publish_outputs(destinations)
+            save_publish_manifest()
     
-    # 10. Выводим итоги
+    # 8. Выводим итоги
     log("=" * 60)
     log("📊 ИТОГИ:")
     log("   🌐 Источников: " + str(len(URLS)))
     log("   📥 Скачано из URL: " + str(len(all_configs) - len(selected_configs)))
     log("   🔧 Из selected.txt: " + str(len(selected_configs)))
+    log("   ♻️ Источников из инкрементального состояния: " + str(SOURCE_STATE_STATS["reused"]))
+    log("   🪞 Источников-зеркал (тело совпало с другим URL): " + str(SOURCE_STATE_STATS["mirrors"]))
     log("   🔄 Уникальных (после дедупликации): " + str(len(filtered_unique_configs)))
     log("   🚫 Исключено паттернами: " + str(len(excluded_unique) + len(excluded_whitelist)))
     log("   🛡️ Whitelist (после исключений): " + str(len(filtered_whitelist_configs)))
@@ -1518,12 +1276,32 @@ def main():
     log(f"📊 Конфигов в merged.txt: {len(unique_configs)}")
     log(f"🛡️ Конфигов в wl.txt: {len(whitelist_configs)}")
     
-    # Выводим логи
-    print("\n📋 ЛОГИ ВЫПОЛНЕНИЯ (" + offset + "):")
-    print("=" * 60)
-    for line in LOGS_BY_FILE[0]:
-        print(line)
+    # Метрики запуска: metrics.json и metrics.prom
+    set_counter("sources_total", len(URLS))
+    set_counter("sources_failed", sum(1 for payload in payloads.values() if not payload.digest))
+    set_counter("configs_fetched", len(all_configs) - len(selected_configs))
+    set_counter("configs_selected", len(selected_configs))
+    set_counter("configs_unique", len(unique_configs))
+    set_counter("configs_whitelist", len(whitelist_configs))
+    set_counter("configs_excluded", len(excluded_unique))
+    set_counter("http_cache_hits", HTTP_CACHE_STATS["hits"])
+    set_counter("sources_skipped", HEALTH_STATS["skipped"])
+    set_counter("probe_alive", PROBE_STATS["alive"])
+    set_counter("probe_dead", PROBE_STATS["dead"])
+    set_counter("sources_hedged", HEDGE_STATS["hedged"])
+    set_counter("sources_from_mirrors", HEDGE_STATS["mirror_wins"])
+    metrics = write_metrics()
+    stages = ", ".join(f"{name} {seconds:.1f} с" for name, seconds in metrics["stages"].items())
+    log(f"📈 Этапы: {stages}")
+    log(f"📈 Пик памяти: {metrics['peak_rss_bytes'] / 1024 / 1024:.0f} МиБ")
+
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except BaseException:
+        logger.critical("💥 Запуск прерван", exc_info=True)
+        raise
+    finally:
+        shutdown_logging()
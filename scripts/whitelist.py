@@ -0,0 +1,332 @@
+"""
+Whitelist подсетей: компактный индекс интервалов и классификация IP-адресов.
+Индекс строится (или читается из кэша) при первой проверке, а не при импорте.
+"""
+
+from collections import defaultdict
+from collections.abc import Iterable
+import ipaddress
+import threading
+import bisect
+import hashlib
+import socket
+import json
+import os
+
+from common import log
+
+WHITELIST_SUBNETS = [
+    "5.188.0.0/16",
+    "37.18.0.0/16",
+    "37.139.0.0/16",
+    "45.15.0.0/16",
+    "45.129.0.0/16",
+    "51.250.0.0/16", 
+    "51.250.0.0/17", 
+    "77.88.21.0/24", 
+    "78.159.0.0/16",
+    "78.159.247.0/24", 
+    "79.174.91.0/24",  
+    "79.174.92.0/24",  
+    "79.174.93.0/24",  
+    "79.174.94.0/24", 
+    "79.174.95.0/24",  
+    "83.166.0.0/16",
+    "84.201.0.0/16",   
+    "84.201.128.0/18", 
+    "87.250.247.0/24", 
+    "87.250.250.0/24",
+    "87.250.251.0/24", 
+    "87.250.254.0/24", 
+    "89.208.0.0/16",
+    "89.253.200.0/21", 
+    "91.219.0.0/16",
+    "91.222.239.0/24", 
+    "95.163.0.0/16",
+    "95.163.248.0/22", 
+    "95.181.182.0/24", 
+    "103.111.114.0/24", 
+    "109.120.0.0/16",
+    "109.73.201.0/24", 
+    "130.193.0.0/16",
+    "134.17.94.0/24",  
+    "158.160.0.0/16",
+    "176.32.0.0/16",
+    "176.108.0.0/16",
+    "176.109.0.0/16",
+    "176.122.0.0/16",
+    "178.154.0.0/16",
+    "185.39.206.0/24",
+    "185.130.0.0/16",
+    "185.141.216.0/24", 
+    "185.177.0.0/16",
+    "185.177.73.0/24", 
+    "185.241.192.0/22", 
+    "193.53.0.0/16",
+    "212.233.72.0/21",
+    "217.12.0.0/16",
+    "217.16.0.0/16",    
+    "217.16.24.0/21",  
+    "37.9.38.0/24",
+    "37.220.166.0/24",
+    "77.41.174.0/24",
+    "79.126.125.0/24",
+    "81.22.206.0/24",
+    "81.177.73.0/24",
+    "81.211.48.0/24",
+    "82.208.79.0/24",
+    "82.209.65.0/24",
+    "85.26.166.0/24",
+    "85.234.38.0/24",
+    "89.248.230.0/24",
+    "91.233.216.0/24",
+    "91.233.217.0/24",
+    "91.233.218.0/24",
+    "92.223.43.0/24",
+    "94.229.232.0/24",
+    "95.142.205.0/24",
+    "95.163.43.0/24",
+    "95.167.222.0/24",
+    "95.181.181.0/24",
+    "109.120.190.0/24",
+    "128.75.235.0/24",
+    "128.75.253.0/24",
+    "128.140.170.0/24",
+    "146.185.209.0/24",
+    "151.236.75.0/24",
+    "151.236.87.0/24",
+    "151.236.90.0/24",
+    "151.236.96.0/24",
+    "151.236.99.0/24",
+    "155.212.192.0/24",
+    "176.211.118.0/24",
+    "178.176.128.0/24",
+    "178.176.145.0/24",
+    "178.178.103.0/24",
+    "178.237.22.0/24",
+    "178.248.232.0/24",
+    "178.248.233.0/24",
+    "178.248.234.0/24",
+    "178.248.235.0/24",
+    "178.248.238.0/24",
+    "178.248.239.0/24",
+    "185.9.230.0/24",
+    "185.16.150.0/24",
+    "185.27.192.0/24",
+    "185.32.187.0/24",
+    "185.32.251.0/24",
+    "185.45.82.0/24",
+    "185.62.201.0/24",
+    "185.65.148.0/24",
+    "185.65.149.0/24",
+    "185.72.228.0/24",
+    "185.72.229.0/24",
+    "185.72.231.0/24",
+    "185.73.192.0/24",
+    "185.73.193.0/24",
+    "185.73.194.0/24",
+    "185.73.195.0/24",
+    "185.163.159.0/24",
+    "185.226.55.0/24",
+    "185.241.193.0/24",
+    "185.242.16.0/24",
+    "188.43.2.0/24",
+    "188.43.3.0/24",
+    "188.43.5.0/24",
+    "188.170.146.0/24",
+    "194.67.49.0/24",
+    "194.85.149.0/24",
+    "194.154.70.0/24",
+    "194.154.71.0/24",
+    "194.154.73.0/24",
+    "194.154.76.0/24",
+    "194.154.80.0/24",
+    "194.186.16.0/24",
+    "194.186.17.0/24",
+    "194.186.26.0/24",
+    "194.186.31.0/24",
+    "194.186.81.0/24",
+    "194.186.86.0/24",
+    "194.186.91.0/24",
+    "194.186.96.0/24",
+    "194.186.158.0/24",
+    "194.186.168.0/24",
+    "194.186.172.0/24",
+    "194.186.174.0/24",
+    "194.186.244.0/24",
+    "194.186.249.0/24",
+    "194.186.250.0/24",
+    "195.34.36.0/24",
+    "195.34.37.0/24",
+    "195.34.38.0/24",
+    "195.34.58.0/24",
+    "195.239.1.0/24",
+    "195.239.7.0/24",
+    "195.239.9.0/24",
+    "195.239.13.0/24",
+    "195.239.38.0/24",
+    "195.239.57.0/24",
+    "195.239.67.0/24",
+    "195.239.68.0/24",
+    "195.239.94.0/24",
+    "195.239.109.0/24",
+    "195.239.156.0/24",
+    "195.239.158.0/24",
+    "195.239.159.0/24",
+    "212.46.197.0/24",
+    "212.46.198.0/24",
+    "212.46.200.0/24",
+    "212.46.208.0/24",
+    "212.46.210.0/24",
+    "212.46.254.0/24",
+    "212.188.4.0/24",
+    "212.188.6.0/24",
+    "212.188.8.0/24",
+    "212.188.12.0/24",
+    "212.188.15.0/24",
+    "212.188.16.0/24",
+    "212.193.146.0/24",
+    "212.193.147.0/24",
+    "213.87.71.0/24",
+    "213.184.156.0/24",
+    "217.20.158.0/24",
+    "217.118.183.0/24",
+    "217.174.188.0/24",
+    "80.68.251.0/24",
+    "91.208.84.0/24",
+    "91.232.131.0/24",
+    "109.207.4.0/24",
+]
+
+# Скомпилированный индекс подсетей кэшируется на диске
+WHITELIST_INDEX_CACHE = os.environ.get("WHITELIST_INDEX_CACHE", ".cache/whitelist_index.json")
+
+class SubnetIndex:
+    """Индекс подсетей: отсортированные непересекающиеся интервалы целых адресов
+
+    Поиск - bisect по началам интервалов, O(log n) на адрес. IPv4 и IPv6 хранятся раздельно.
+    """
+
+    __slots__ = ("_starts", "_ends")
+
+    def __init__(self, intervals: dict[int, list[tuple[int, int]]]):
+        self._starts = {version: [start for start, _ in spans] for version, spans in intervals.items()}
+        self._ends = {version: [end for _, end in spans] for version, spans in intervals.items()}
+
+    @classmethod
+    def from_subnets(cls, subnets: Iterable[str]) -> "SubnetIndex":
+        """Схлопывает подсети и строит интервалы"""
+        by_version = defaultdict(list)
+        for subnet in subnets:
+            network = ipaddress.ip_network(subnet.strip(), strict=False)
+            by_version[network.version].append(network)
+
+        intervals = {}
+        for version, networks in by_version.items():
+            spans = []
+            for network in ipaddress.collapse_addresses(networks):
+                start = int(network.network_address)
+                end = int(network.broadcast_address)
+                # Склеиваем соседние интервалы, которые collapse_addresses не объединил
+                if spans and spans[-1][1] + 1 >= start:
+                    spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+                else:
+                    spans.append((start, end))
+            intervals[version] = spans
+        return cls(intervals)
+
+    def __len__(self) -> int:
+        return sum(len(starts) for starts in self._starts.values())
+
+    def contains_int(self, version: int, value: int) -> bool:
+        """Проверяет адрес, уже переведённый в целое число"""
+        starts = self._starts.get(version)
+        if not starts:
+            return False
+        pos = bisect.bisect_right(starts, value) - 1
+        return pos >= 0 and value <= self._ends[version][pos]
+
+    def contains(self, address: str) -> bool:
+        """Проверяет, входит ли адрес (строкой) в одну из подсетей"""
+        parsed = ip_to_int(address)
+        return parsed is not None and self.contains_int(*parsed)
+
+    def classify(self, addresses: Iterable[str]) -> list[bool]:
+        """Проверяет пачку адресов разом; не-IP строки дают False"""
+        result = []
+        for address in addresses:
+            parsed = ip_to_int(address) if address else None
+            result.append(parsed is not None and self.contains_int(*parsed))
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            str(version): [[start, end] for start, end in zip(starts, self._ends[version])]
+            for version, starts in self._starts.items()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SubnetIndex":
+        return cls({int(version): [(start, end) for start, end in spans] for version, spans in data.items()})
+
+
+def ip_to_int(address: str) -> tuple[int, int] | None:
+    """Переводит IP-адрес в (версия, целое число) или возвращает None"""
+    try:
+        if ':' in address:
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+            # IPv4-mapped (::ffff:a.b.c.d) проверяем по IPv4-подсетям
+            if value >> 32 == 0xFFFF:
+                return 4, value & 0xFFFFFFFF
+            return 6, value
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+    except (OSError, ValueError):
+        return None
+
+def load_whitelist_index(subnets: list[str], cache_path: str | None = None) -> SubnetIndex:
+    """Возвращает индекс подсетей из кэша на диске или строит его заново"""
+    if cache_path is None:
+        cache_path = WHITELIST_INDEX_CACHE
+    digest = hashlib.sha256("\n".join(subnets).encode("utf-8")).hexdigest()
+
+    if cache_path:
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("digest") == digest:
+                return SubnetIndex.from_dict(cached["intervals"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    index = SubnetIndex.from_subnets(subnets)
+    log(f"🛡️ Подсети whitelist: {len(subnets)} записей → {len(index)} интервалов")
+
+    if cache_path:
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"digest": digest, "intervals": index.to_dict()}, f)
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError as e:
+            log(f"⚠️  Не удалось сохранить индекс подсетей: {str(e)[:100]}")
+    return index
+
+_WHITELIST_INDEX: SubnetIndex | None = None
+_WHITELIST_INDEX_LOCK = threading.Lock()
+
+def get_whitelist_index() -> SubnetIndex:
+    """Возвращает индекс WHITELIST_SUBNETS (строится при первом обращении)"""
+    global _WHITELIST_INDEX
+    if _WHITELIST_INDEX is None:
+        with _WHITELIST_INDEX_LOCK:
+            if _WHITELIST_INDEX is None:
+                _WHITELIST_INDEX = load_whitelist_index(WHITELIST_SUBNETS)
+    return _WHITELIST_INDEX
+
+def is_ip_in_subnets(ip_str: str) -> bool:
+    """Проверяет, принадлежит ли IP-адрес одной из разрешенных подсетей"""
+    return get_whitelist_index().contains(ip_str)
+
+def classify_ips(addresses: Iterable[str]) -> list[bool]:
+    """Проверяет пачку IP-адресов по разрешенным подсетям"""
+    return get_whitelist_index().classify(addresses)
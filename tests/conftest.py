@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# Скрипты запускаются как python scripts/<имя>.py и импортируют соседние модули напрямую
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+# Тесты не пишут журнал и кэши в .cache рабочей копии
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault("WHITELIST_INDEX_CACHE", "")
+
+from common import shutdown_logging  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _stop_log_writer():
+    # Поток-писатель пишет в sys.stdout, который pytest подменяет на время теста
+    yield
+    shutdown_logging()
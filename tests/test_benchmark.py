@@ -0,0 +1,23 @@
+import subprocess
+import sys
+import os
+
+from conftest import SCRIPTS_DIR
+from benchmark import CorpusGenerator, run_stages
+
+
+def test_run_stages_without_memory():
+    corpus = CorpusGenerator(1, 0.3).corpus(200, 0.25)
+    results = run_stages(corpus, measure_memory=False)
+    assert "merge_and_deduplicate" in results
+    assert all("seconds" in metrics and "peak_kib" not in metrics for metrics in results.values())
+
+
+def test_cli_no_memory(tmp_path):
+    completed = subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS_DIR, "benchmark.py"), "--sizes", "500", "--no-memory",
+         "--baseline", str(tmp_path / "baseline.json")],
+        cwd=tmp_path, capture_output=True, text=True, timeout=120,
+    )
+    assert completed.returncode == 0, completed.stderr
+    assert "merge_and_deduplicate" in completed.stdout
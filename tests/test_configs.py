@@ -0,0 +1,28 @@
+import configs
+from configs import merge_and_deduplicate, parse_config
+
+
+def test_exact_duplicates_are_not_parsed(monkeypatch):
+    parsed_batches = []
+    parse_many = configs.parse_many
+
+    def counting_parse_many(lines):
+        parsed_batches.append(list(lines))
+        return parse_many(lines)
+
+    monkeypatch.setattr(configs, "parse_many", counting_parse_many)
+    a = "vless://uuid@1.2.3.4:443?security=none#a"
+    b = "trojan://pass@5.6.7.8:443#b"
+    unique, _ = merge_and_deduplicate([a, " " + a, "", b, a, parse_config(b), b + " "])
+    assert [parsed.raw for parsed in unique] == [a, b]
+    assert parsed_batches == [[a, b]]
+
+
+def test_unparsable_url_key_prefix_length():
+    # urlsplit не принимает незакрытую '[' - ключом становится префикс строки
+    prefix = "ss://[" + "a" * 120
+    assert parse_config(prefix + "#one").key == (prefix + "#one")[:200]
+    unique, _ = merge_and_deduplicate([prefix + "1@host:1#x", prefix + "2@host:1#x"])
+    assert len(unique) == 2
+    vless = "vless://[" + "a" * 120
+    assert parse_config(vless).key == vless[:100]
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import socket
+import socketserver
+import threading
+
+import simple_merge
+from simple_merge import _DNS_TYPE_A, _DNS_TYPE_AAAA, _build_dns_query, _parse_dns_response, _resolve_one
+
+FLAGS_OK = 0x8180  # QR, RD, RA
+FLAG_TC = 0x0200
+
+
+def build_response(query: bytes, flags: int = FLAGS_OK, addresses: tuple[str, ...] = (), ttl: int = 300) -> bytes:
+    """Ответ на query: тот же id и вопрос, A/AAAA-записи со сжатым именем"""
+    answers = b""
+    for address in addresses:
+        family, rtype = (socket.AF_INET6, _DNS_TYPE_AAAA) if ":" in address else (socket.AF_INET, _DNS_TYPE_A)
+        rdata = socket.inet_pton(family, address)
+        answers += (b"\xc0\x0c" + rtype.to_bytes(2, "big") + b"\x00\x01" + ttl.to_bytes(4, "big")
+                    + len(rdata).to_bytes(2, "big") + rdata)
+    header = query[0:2] + flags.to_bytes(2, "big") + b"\x00\x01" + len(addresses).to_bytes(2, "big") + b"\x00\x00" * 2
+    return header + query[12:] + answers
+
+
+def test_parse_response():
+    query = _build_dns_query(0x1234, "example.com", _DNS_TYPE_A)
+    response = build_response(query, addresses=("10.0.0.1", "10.0.0.2"), ttl=120)
+    assert _parse_dns_response(response, 0x1234) == (0, ["10.0.0.1", "10.0.0.2"], 120, False)
+    assert _parse_dns_response(response, 0x4321) is None
+
+
+def test_parse_truncated_response():
+    query = _build_dns_query(7, "example.com", _DNS_TYPE_A)
+    response = build_response(query, flags=FLAGS_OK | FLAG_TC, addresses=("10.0.0.1",))
+    assert _parse_dns_response(response, 7)[3] is True
+
+
+class FakeResolver(asyncio.DatagramProtocol):
+    """UDP-резолвер, отвечающий на A заданными адресами и пустым ответом на AAAA"""
+
+    def __init__(self, addresses: tuple[str, ...], flags: int):
+        self.addresses = addresses
+        self.flags = flags
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        qtype = int.from_bytes(data[-4:-2], "big")
+        addresses = self.addresses if qtype == _DNS_TYPE_A else ()
+        self.transport.sendto(build_response(data, self.flags, addresses), addr)
+
+
+def resolve_with(hostname: str, addresses: tuple[str, ...], flags: int = FLAGS_OK):
+    async def run():
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: FakeResolver(addresses, flags), local_addr=("127.0.0.1", 0)
+        )
+        try:
+            return await _resolve_one(hostname, transport.get_extra_info("sockname")[:2])
+        finally:
+            transport.close()
+
+    return asyncio.run(run())
+
+
+def test_stub_resolver_answer():
+    assert resolve_with("example.com", ("10.0.0.1",)) == (["10.0.0.1"], 300)
+
+
+def test_stub_resolver_empty_answer_is_negative():
+    assert resolve_with("example.com", ()) == ([], simple_merge.DNS_NEGATIVE_TTL)
+
+
+def test_truncated_answer_falls_back_to_getaddrinfo():
+    addresses, ttl = resolve_with("localhost", ("10.0.0.1",), FLAGS_OK | FLAG_TC)
+    assert "10.0.0.1" not in addresses
+    assert addresses and ttl == simple_merge.DNS_DEFAULT_TTL
+
+
+class ThreadedFakeResolver(socketserver.BaseRequestHandler):
+    """Синхронная замена резолвера для resolve_hostnames: на всё отвечает обрезанным ответом без адресов"""
+
+    def handle(self):
+        data, sock = self.request
+        sock.sendto(build_response(data, FLAGS_OK | FLAG_TC), self.client_address)
+
+
+def test_truncated_answer_without_addresses_is_not_cached(monkeypatch, tmp_path):
+    server = socketserver.ThreadingUDPServer(("127.0.0.1", 0), ThreadedFakeResolver)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    async def system_resolver_fails(hostname):
+        raise socket.gaierror("Name or service not known")
+
+    cache_file = tmp_path / "dns.json"
+    monkeypatch.setattr(simple_merge, "DNS_CACHE_FILE", str(cache_file))
+    monkeypatch.setattr(simple_merge, "_dns_resolver_address", lambda: server.server_address[:2])
+    monkeypatch.setattr(simple_merge, "_system_resolve", system_resolver_fails)
+    monkeypatch.setattr(simple_merge, "DNS_STATS", {"hosts": 0, "hits": 0, "misses": 0, "failures": 0})
+    try:
+        assert simple_merge.resolve_hostnames(["truncated.example"]) == {"truncated.example": []}
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert simple_merge.DNS_STATS["failures"] == 1
+    cached = json.loads(cache_file.read_text()) if cache_file.exists() else {}
+    assert "truncated.example" not in cached
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import simple_merge
+
+BODY = b"vless://uuid@1.2.3.4:443?security=none#a\nvless://uuid@1.2.3.5:443?security=none#b\n"
+
+
+class SourceHandler(BaseHTTPRequestHandler):
+    """Источник: /slow отвечает с задержкой, остальные пути - сразу"""
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(1.5)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        try:
+            self.wfile.write(BODY)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SourceHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_cdn_mirror_is_opt_in(monkeypatch):
+    url = "https://raw.githubusercontent.com/owner/repo/main/list.txt"
+    assert simple_merge.mirror_urls(url) == [url]
+    monkeypatch.setattr(simple_merge, "HEDGE_CDN_MIRRORS", True)
+    assert simple_merge.mirror_urls(url) == [url, "https://cdn.jsdelivr.net/gh/owner/repo@main/list.txt"]
+
+
+def test_slow_primary_is_hedged_and_mirror_wins(server, monkeypatch):
+    primary, mirror = f"{server}/slow", f"{server}/fast"
+    monkeypatch.setattr(simple_merge, "HTTP_CACHE_DIR", "")
+    monkeypatch.setattr(simple_merge, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(simple_merge, "HEDGE_DEFAULT_DELAY", 0.2)
+    monkeypatch.setitem(simple_merge.SOURCE_MIRRORS, primary, [mirror])
+    monkeypatch.setattr(simple_merge, "HEDGE_STATS", {"hedged": 0, "mirror_wins": 0})
+
+    # Запоминаем события отмены каждой загрузки
+    cancel_events = {}
+    download = simple_merge.download_and_process_url
+
+    def recording_download(url, deadline, known_digest, timeout, max_attempts, cancelled):
+        cancel_events[url] = cancelled
+        return download(url, deadline, known_digest, timeout, max_attempts, cancelled)
+
+    monkeypatch.setattr(simple_merge, "download_and_process_url", recording_download)
+
+    started = time.monotonic()
+    payloads = asyncio.run(simple_merge._fetch_sources_async([primary], {}))
+    elapsed = time.monotonic() - started
+
+    payload = payloads[primary]
+    assert payload.url == primary
+    assert payload.complete and len(payload.lines) == 2
+    assert elapsed < 1.5, "результат должен прийти с зеркала, не дожидаясь основного URL"
+    assert simple_merge.HEDGE_STATS == {"hedged": 1, "mirror_wins": 1}
+    assert set(cancel_events) == {primary, mirror}
+    assert cancel_events[primary].is_set()
@@ -0,0 +1,131 @@
+import hashlib
+import gzip
+
+import pytest
+
+from publishers import S3Publisher
+
+
+class FakeS3Client:
+    """Замена клиента boto3: объекты в памяти, HEAD и PUT записываются"""
+
+    def __init__(self):
+        self.objects = {}
+        self.heads = []
+        self.puts = []
+
+    def head_object(self, Bucket, Key):
+        self.heads.append(Key)
+        if Key not in self.objects:
+            error = Exception("Not Found")
+            error.response = {"ResponseMetadata": {"HTTPStatusCode": 404}}
+            raise error
+        return self.objects[Key]
+
+    def put_object(self, Bucket, Key, Body, ContentType, ContentMD5, Metadata, **extra):
+        self.puts.append({"Key": Key, "Body": Body, "ContentType": ContentType, **extra})
+        self.objects[Key] = {
+            "ContentType": ContentType,
+            "ContentEncoding": extra.get("ContentEncoding", ""),
+            "Metadata": Metadata,
+        }
+
+
+@pytest.fixture
+def client():
+    return FakeS3Client()
+
+
+def publisher(client, use_gzip=False) -> S3Publisher:
+    return S3Publisher("http://s3.local", "key", "secret", "bucket", "ru-central-1", use_gzip=use_gzip, client=client)
+
+
+def test_compressed_variant_is_uploaded_as_archive(client, tmp_path):
+    path = tmp_path / "merged.txt.gz"
+    path.write_bytes(gzip.compress(b"vless://a\n", mtime=0))
+    assert publisher(client).upload(str(path), "merged.txt.gz", "application/gzip")
+    put = client.puts[0]
+    assert put["ContentType"] == "application/gzip"
+    assert "ContentEncoding" not in put
+    assert put["Body"] == path.read_bytes()
+
+
+def test_matching_sha256_skips_put(client, tmp_path):
+    path = tmp_path / "merged.txt"
+    path.write_text("vless://a\n", encoding="utf-8")
+    first = publisher(client)
+    assert first.upload(str(path), "merged.txt")
+    second = publisher(client)
+    assert not second.upload(str(path), "merged.txt")
+    assert len(client.puts) == 1
+    assert second.stats["skipped"] == 1 and second.stats["uploaded"] == 0
+
+
+def test_matching_etag_skips_put(client, tmp_path):
+    path = tmp_path / "merged.txt"
+    path.write_bytes(b"vless://a\n")
+    # Объект без метаданных sha256, загруженный не нами: совпадение по ETag = MD5 тела
+    client.objects["merged.txt"] = {
+        "ContentType": "text/plain; charset=utf-8",
+        "ETag": '"%s"' % hashlib.md5(b"vless://a\n").hexdigest(),
+    }
+    uploader = publisher(client)
+    assert not uploader.upload(str(path), "merged.txt")
+    assert client.puts == []
+    assert uploader.stats == {"uploaded": 0, "skipped": 1, "bytes_raw": 0, "bytes_sent": 0}
+
+
+def test_changed_body_is_uploaded(client, tmp_path):
+    path = tmp_path / "merged.txt"
+    path.write_bytes(b"vless://a\n")
+    uploader = publisher(client)
+    uploader.upload(str(path), "merged.txt")
+    path.write_bytes(b"vless://a\nvless://b\n")
+    assert uploader.upload(str(path), "merged.txt")
+    assert [put["Body"] for put in client.puts] == [b"vless://a\n", b"vless://a\nvless://b\n"]
+    assert uploader.stats["uploaded"] == 2 and uploader.stats["skipped"] == 0
+    assert uploader.stats["bytes_raw"] == uploader.stats["bytes_sent"] == 30
+
+
+def test_gzip_upload_reuses_compressed_copy(client, tmp_path):
+    path = tmp_path / "merged.txt"
+    data = b"vless://a\n" * 100
+    path.write_bytes(data)
+    (tmp_path / "merged.txt.gz").write_bytes(gzip.compress(data, mtime=0))
+    uploader = publisher(client, use_gzip=True)
+    assert uploader.upload(str(path), "merged.txt")
+    put = client.puts[0]
+    assert put["ContentEncoding"] == "gzip" and put["ContentType"] == "text/plain; charset=utf-8"
+    assert put["Body"] == (tmp_path / "merged.txt.gz").read_bytes()
+    assert uploader.stats["bytes_sent"] < uploader.stats["bytes_raw"]
+    # Тот же файл без сжатия - другой объект: Content-Encoding не совпадает
+    assert publisher(client).upload(str(path), "merged.txt")
+
+
+def test_head_error_falls_through_to_put(client, tmp_path):
+    path = tmp_path / "merged.txt"
+    path.write_bytes(b"vless://a\n")
+
+    def failing_head(Bucket, Key):
+        error = Exception("Internal Error")
+        error.response = {"ResponseMetadata": {"HTTPStatusCode": 500}}
+        raise error
+
+    client.head_object = failing_head
+    uploader = publisher(client)
+    assert uploader.upload(str(path), "merged.txt")
+    assert uploader.stats["uploaded"] == 1
+
+
+def test_put_error_propagates(client, tmp_path):
+    path = tmp_path / "merged.txt"
+    path.write_bytes(b"vless://a\n")
+
+    def failing_put(**kwargs):
+        raise OSError("connection reset")
+
+    client.put_object = failing_put
+    uploader = publisher(client)
+    with pytest.raises(OSError):
+        uploader.upload(str(path), "merged.txt")
+    assert uploader.stats["uploaded"] == 0